@@ -1,4 +1,5 @@
 from .client import TrustGridClient
+from .async_client import AsyncTrustGridClient, gather_bounded
 
-__version__ = "0.1.0"
-__all__ = ["TrustGridClient"]
+__version__ = "0.2.0"
+__all__ = ["TrustGridClient", "AsyncTrustGridClient", "gather_bounded"]
@@ -0,0 +1,194 @@
+import asyncio
+import random
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, TypeVar
+
+import httpx
+
+from .client import ApiKey, Organization
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# The API accepts at most this many items per POST /api/v1/request-data/batch
+MAX_BATCH_ITEMS = 500
+
+# Statuses where the server did no work and asks to come back later
+RETRYABLE_STATUSES = {429, 503}
+# Gateway errors: the request may or may not have reached the API
+GATEWAY_STATUSES = {502, 504}
+# Errors raised before the request was sent, so retrying can never duplicate it
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+async def gather_bounded(
+    fn: Callable[[T], Awaitable[R]],
+    items: Iterable[T],
+    concurrency: int,
+    return_exceptions: bool = True,
+) -> List[Any]:
+    """
+    Runs fn(item) for every item with at most `concurrency` in flight and returns
+    the results in input order. With return_exceptions, a failed item's exception
+    takes its place in the list instead of cancelling the rest.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(item: T):
+        async with semaphore:
+            return await fn(item)
+
+    return await asyncio.gather(*(run(item) for item in items), return_exceptions=return_exceptions)
+
+
+class AsyncTrustGridClient:
+    """
+    Async client for high-volume integrations.
+
+    One pooled httpx.AsyncClient is reused for every call (keep-alive, optional
+    HTTP/2 with `pip install "tga[http2]"`). Calls time out, and transient
+    failures are retried with exponential backoff and jitter, honouring
+    Retry-After:
+    - GETs are retried on any transport error, 429, 502, 503 and 504
+    - POSTs only when the request provably did no work (connection never made,
+      429, or 503), so a retry cannot create a duplicate data request;
+      pass retry_non_idempotent=True to retry them like GETs
+
+    Use as `async with AsyncTrustGridClient(api_key) as client: ...` or call aclose().
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = "https://trust-grid.onrender.com",
+        timeout: float = 30.0,
+        connect_timeout: float = 5.0,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        http2: bool = False,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        retry_non_idempotent: bool = False,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_non_idempotent = retry_non_idempotent
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            headers={"X-API-Key": api_key},
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            http2=http2,
+            transport=transport,
+        )
+
+    async def __aenter__(self) -> "AsyncTrustGridClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    def _delay(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass # HTTP-date form; fall back to backoff
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _should_retry(self, method: str, error: Optional[Exception], response: Optional[httpx.Response]) -> bool:
+        idempotent = method == "GET" or self.retry_non_idempotent
+        if error is not None:
+            return isinstance(error, NOT_SENT_ERRORS) or (idempotent and isinstance(error, httpx.TransportError))
+        if response.status_code in RETRYABLE_STATUSES:
+            return True
+        return idempotent and response.status_code in GATEWAY_STATUSES
+
+    async def _request(self, method: str, endpoint: str, **kwargs) -> Any:
+        attempt = 0
+        while True:
+            error: Optional[Exception] = None
+            response: Optional[httpx.Response] = None
+            try:
+                response = await self._client.request(method, endpoint, **kwargs)
+            except httpx.TransportError as e:
+                error = e
+            if attempt >= self.max_retries or not self._should_retry(method, error, response):
+                if error is not None:
+                    raise error
+                response.raise_for_status()
+                return response.json()
+            await asyncio.sleep(self._delay(attempt, response))
+            attempt += 1
+
+    async def _post(self, endpoint: str, data: Dict[str, Any]) -> Any:
+        return await self._request("POST", endpoint, json=data)
+
+    async def _get(self, endpoint: str, params: Optional[Dict[str, Any]] = None) -> Any:
+        return await self._request("GET", endpoint, params=params)
+
+    async def register_organization(self, org_name: str) -> Organization:
+        response = await self._post("/api/v1/org/register", {"org_name": org_name})
+        return Organization(**response["organization"])
+
+    async def request_data_access(self, user_id: str, data_type: str, purpose: str) -> Dict[str, Any]:
+        data = {"user_id": user_id, "data_type": data_type, "purpose": purpose}
+        return await self._post("/api/v1/request-data", data)
+
+    async def request_data_access_batch(self, items: List[Dict[str, str]]) -> Dict[str, Any]:
+        """items: [{"user_id": ..., "data_type": ..., "purpose": ...}, ...] (up to 500)."""
+        return await self._post("/api/v1/request-data/batch", {"items": items})
+
+    async def request_data_access_many(self, items: List[Dict[str, str]], concurrency: int = 32) -> List[Any]:
+        """
+        One request_data_access call per item, at most `concurrency` at a time.
+        Results are in input order; a failed item holds its exception
+        (e.g. httpx.HTTPStatusError for a 403 compliance violation).
+        """
+        return await gather_bounded(lambda item: self.request_data_access(**item), items, concurrency)
+
+    async def request_data_access_batches(
+        self,
+        items: List[Dict[str, str]],
+        batch_size: int = MAX_BATCH_ITEMS,
+        concurrency: int = 4,
+    ) -> List[Dict[str, Any]]:
+        """
+        Sends `items` through the batch endpoint in chunks of `batch_size`, at most
+        `concurrency` chunks at a time, and returns the per-item results in input
+        order. Items of a chunk that failed as a whole carry its exception under "error".
+        """
+        batch_size = max(1, min(batch_size, MAX_BATCH_ITEMS))
+        chunks = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+        responses = await gather_bounded(self.request_data_access_batch, chunks, concurrency)
+        results: List[Dict[str, Any]] = []
+        for chunk, response in zip(chunks, responses):
+            if isinstance(response, Exception):
+                results.extend({**item, "status": "error", "error": response} for item in chunk)
+            else:
+                results.extend(response["results"])
+        return results
+
+    async def check_request_status(self, request_id: str) -> Dict[str, Any]:
+        return await self._get(f"/api/v1/request-status/{request_id}")
+
+    async def get_api_keys(self) -> List[ApiKey]:
+        response = await self._get("/api/v1/org/api-keys")
+        return [ApiKey(**key) for key in response]
+
+    async def create_api_key(self, name: str) -> Dict[str, Any]:
+        return await self._post("/api/v1/org/api-keys", {"name": name})
+
+    async def revoke_api_key(self, key_id: str) -> Dict[str, Any]:
+        return await self._post(f"/api/v1/org/api-keys/{key_id}/revoke", {})
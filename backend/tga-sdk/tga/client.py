@@ -16,9 +16,10 @@ class ApiKey(BaseModel):
     # Add other fields as needed
 
 class TrustGridClient:
-    def __init__(self, api_key: str, base_url: str = "https://trust-grid.onrender.com"):
+    def __init__(self, api_key: str, base_url: str = "https://trust-grid.onrender.com", timeout: float = 30.0):
         self.api_key = api_key
         self.base_url = base_url
+        self.timeout = timeout
         self.session = requests.Session()
         self.session.headers.update({
             "X-API-Key": api_key,
@@ -27,17 +28,13 @@ class TrustGridClient:
 
     def _post(self, endpoint: str, data: Dict[str, Any]) -> Dict[str, Any]:
         url = f"{self.base_url}{endpoint}"
-        print(f"🔍 POST {url}")
-        print(f"📋 Headers: {dict(self.session.headers)}")
-        print(f"📦 Data: {data}")
-        response = self.session.post(url, json=data)
-        print(f"📊 Response: {response.status_code}")
+        response = self.session.post(url, json=data, timeout=self.timeout)
         response.raise_for_status()
         return response.json()
 
     def _get(self, endpoint: str) -> Dict[str, Any]:
         url = f"{self.base_url}{endpoint}"
-        response = self.session.get(url)
+        response = self.session.get(url, timeout=self.timeout)
         response.raise_for_status()
         return response.json()
 
@@ -50,6 +47,10 @@ class TrustGridClient:
         data = {"user_id": user_id, "data_type": data_type, "purpose": purpose}
         return self._post("/api/v1/request-data", data)
 
+    def request_data_access_batch(self, items: List[Dict[str, str]]) -> Dict[str, Any]:
+        """items: [{"user_id": ..., "data_type": ..., "purpose": ...}, ...] (up to 500)."""
+        return self._post("/api/v1/request-data/batch", {"items": items})
+
     def get_api_keys(self) -> List[ApiKey]:
         response = self._get("/api/v1/org/api-keys")
         return [ApiKey(**key) for key in response]
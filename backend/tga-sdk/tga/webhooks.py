@@ -0,0 +1,43 @@
+import hashlib
+import hmac
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+SIGNATURE_HEADER = "X-TrustGrid-Signature"
+
+
+class WebhookSignatureError(Exception):
+    pass
+
+
+def verify_signature(payload: bytes, signature_header: str, secret: str, tolerance: int = 300, now: Optional[float] = None) -> None:
+    """
+    Checks the X-TrustGrid-Signature header ("t=<unix seconds>,v1=<hex>") of a
+    webhook delivery against the raw request body. Raises WebhookSignatureError
+    if it doesn't match or is older than `tolerance` seconds (replay protection).
+    """
+    try:
+        pairs = [item.strip().split("=", 1) for item in signature_header.split(",")]
+        timestamp = int(dict(pairs)["t"])
+        signatures = [value for key, value in pairs if key == "v1"]
+    except (ValueError, KeyError, AttributeError):
+        raise WebhookSignatureError("Malformed signature header.")
+
+    current = time.time() if now is None else now
+    if tolerance and abs(current - timestamp) > tolerance:
+        raise WebhookSignatureError("Signature timestamp is outside the tolerance window.")
+
+    expected = hmac.new(secret.encode(), f"{timestamp}.".encode() + payload, hashlib.sha256).hexdigest()
+    if not any(hmac.compare_digest(expected, signature) for signature in signatures):
+        raise WebhookSignatureError("Signature does not match.")
+
+
+def parse_events(payload: bytes, signature_header: str, secret: str, tolerance: int = 300) -> List[Dict[str, Any]]:
+    """
+    Verifies a delivery and returns its events, e.g.
+    [{"id": "evt_...", "type": "consent.decision", "created_at": ..., "data": {...}}].
+    Deliveries are at-least-once: de-duplicate on event["id"].
+    """
+    verify_signature(payload, signature_header, secret, tolerance)
+    return json.loads(payload)["events"]
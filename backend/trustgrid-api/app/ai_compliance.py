@@ -1,25 +1,29 @@
 # app/ai_compliance.py
-import google.generativeai as genai
 from app.database import settings
+from app.metrics import (
+    LLM_CALL_DURATION, LLM_CIRCUIT_OPEN, LLM_COALESCED, LLM_IN_FLIGHT, LLM_QUEUE_WAIT,
+    LLM_RETRIES, LLM_UNAVAILABLE, observe_llm_usage,
+)
+import asyncio
+import hashlib
 import logging
 import json
-from typing import Literal
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Literal, Optional
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Handlers are installed by app/logging_config.py
 logger = logging.getLogger(__name__)
 
 # --- Configure AI Models ---
-regulator_model = None
-verifier_model = None
-try:
-    if not getattr(settings, "GEMINI_API_KEY", None):
-        raise ValueError("GEMINI_API_KEY is missing from settings")
-
-    genai.configure(api_key=settings.GEMINI_API_KEY)
-
-    # --- AI 1: The "Regulator" (Checks Data Minimization) ---
-    regulator_system_instruction = """
+# google.generativeai pulls in gRPC, which takes a while to import and must not
+# be initialised before a server forks its workers. So it is imported, and the
+# models built, on first use in each process (the lifespan in app/main.py
+# starts that in the background).
+REGULATOR_SYSTEM_INSTRUCTION = """
     You are a strict Nigerian Data Protection Regulation (NDPR) Compliance Officer.
     Your duty is to enforce 'Data Minimization'. You must block any data request that is not
     absolutely necessary and proportionate for the company's *verified* business category.
@@ -27,13 +31,8 @@ try:
     - 'Dating', 'Social Media', or 'E-commerce' MUST NOT collect BVN or NIN.
     You will respond with a JSON object: {"decision": "APPROVED" or "VIOLATION", "reason": "Your one-sentence explanation."}
     """
-    regulator_model = genai.GenerativeModel(
-        "gemini-2.5-flash",  # Or "gemini-pro" if 1.5 is not supported by your version
-        system_instruction=regulator_system_instruction
-    )
 
-    # --- AI 2: The "Verifier" (Checks Identity) ---
-    verifier_system_instruction = """
+VERIFIER_SYSTEM_INSTRUCTION = """
     You are a meticulous business verifier for a compliance agency.
     Your job is to detect impostors. You will compare a company's submitted info
     against their uploaded CAC (Corporate Affairs Commission) certificate.
@@ -44,30 +43,349 @@ try:
     - If they match, VERIFY it.
     You will respond with a JSON object: {"decision": "VERIFIED" or "REJECTED", "reason": "Your one-sentence explanation."}
     """
-    # This model MUST be multi-modal (1.5-flash or 1.5-pro)
-    verifier_model = genai.GenerativeModel(
-        "gemini-2.5-flash", 
-        system_instruction=verifier_system_instruction
-    )
-    
-    logger.info("✅ Gemini AI Models (Verifier and Regulator) configured successfully.")
-except Exception as e:
-    logger.error(f"🔥 Failed to configure Gemini AI: {e}. Check GEMINI_API_KEY and library version.")
-    # Set to None so the app can still run, but endpoints will fail gracefully
-    regulator_model = None
-    verifier_model = None
+
+regulator_model = None
+verifier_model = None
+_models_configured = False
+_models_lock = threading.Lock()
+
+def genai_module():
+    """google.generativeai, imported on first use."""
+    import google.generativeai as genai
+    return genai
+
+def configure_models() -> None:
+    """Builds the Regulator and Verifier models once per process. Blocking: call via ensure_models()."""
+    global regulator_model, verifier_model, _models_configured
+    with _models_lock:
+        if _models_configured:
+            return
+        try:
+            if not getattr(settings, "GEMINI_API_KEY", None):
+                raise ValueError("GEMINI_API_KEY is missing from settings")
+            genai = genai_module()
+            genai.configure(api_key=settings.GEMINI_API_KEY)
+
+            # --- AI 1: The "Regulator" (Checks Data Minimization) ---
+            regulator_model = genai.GenerativeModel(
+                "gemini-2.5-flash",  # Or "gemini-pro" if 1.5 is not supported by your version
+                system_instruction=REGULATOR_SYSTEM_INSTRUCTION
+            )
+            # --- AI 2: The "Verifier" (Checks Identity) ---
+            # This model MUST be multi-modal (1.5-flash or 1.5-pro)
+            verifier_model = genai.GenerativeModel(
+                "gemini-2.5-flash",
+                system_instruction=VERIFIER_SYSTEM_INSTRUCTION
+            )
+            logger.info("✅ Gemini AI Models (Verifier and Regulator) configured successfully.")
+        except Exception as e:
+            logger.error(f"🔥 Failed to configure Gemini AI: {e}. Check GEMINI_API_KEY and library version.")
+            # Left as None so the app can still run, but endpoints will fail gracefully
+            regulator_model = None
+            verifier_model = None
+        _models_configured = True
+
+def use_models(regulator, verifier) -> None:
+    """Installs ready-made models instead of building Gemini ones (offline benchmarks, tests)."""
+    global regulator_model, verifier_model, _models_configured
+    with _models_lock:
+        regulator_model, verifier_model, _models_configured = regulator, verifier, True
+
+async def ensure_models() -> None:
+    """Configures the models on first use, off the event loop."""
+    if not _models_configured:
+        await asyncio.to_thread(configure_models)
+
+def models_status() -> str:
+    """For /health: 'configuring' until the first configure_models() finishes, then 'ready' or 'unavailable'."""
+    if not _models_configured:
+        return "configuring"
+    return "ready" if regulator_model is not None and verifier_model is not None else "unavailable"
+
+
+# --- Deadlines, Retries and Circuit Breaking ---
+class LLMUnavailable(Exception):
+    """The LLM could not answer in time: deadline spent, retries exhausted or circuit open."""
+    def __init__(self, message: str, retry_after: float = 0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+# Absolute time.monotonic() deadline for all LLM work in the current request, if any
+_llm_deadline: ContextVar[Optional[float]] = ContextVar("llm_deadline", default=None)
+
+@contextmanager
+def llm_deadline(budget_seconds: float):
+    """Gives every LLM call inside the block a share of one overall time budget."""
+    deadline = time.monotonic() + budget_seconds
+    current = _llm_deadline.get()
+    token = _llm_deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _llm_deadline.reset(token)
+
+def _remaining_budget() -> Optional[float]:
+    deadline = _llm_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+def is_transient_error(error: BaseException) -> bool:
+    """Timeouts, rate limits and 5xx-style provider errors are worth retrying."""
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    # google.api_core exceptions, matched by name so this module doesn't depend on their import path
+    return type(error).__name__ in {
+        "ResourceExhausted", "TooManyRequests", "ServiceUnavailable",
+        "InternalServerError", "DeadlineExceeded", "GatewayTimeout", "RetryError",
+    }
+
+class CircuitBreaker:
+    """
+    closed -> open after `failure_threshold` consecutive failures; open fails fast
+    for `reset_seconds`; then half-open lets one trial call through, which closes
+    the circuit on success or re-opens it on failure.
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._trial_in_flight = False
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.reset_seconds - time.monotonic())
+
+    def before_call(self) -> None:
+        """Raises LLMUnavailable if the call must not be attempted now."""
+        if self.state == "open":
+            if self.retry_after() > 0:
+                raise LLMUnavailable("circuit open", retry_after=self.retry_after())
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._trial_in_flight:
+                raise LLMUnavailable("circuit half-open, trial call in progress", retry_after=1.0)
+            self._trial_in_flight = True
+
+    def release_trial(self) -> None:
+        """The trial call never reached the provider; let the next caller try."""
+        self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self._trial_in_flight = False
+        self.consecutive_failures += 1
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                self.times_opened += 1
+                logger.error(f"🔥 LLM circuit opened after {self.consecutive_failures} consecutive failures.")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+
+# --- Shared LLM Gateway ---
+class LLMGateway:
+    """
+    Every Gemini call goes through here:
+    - a semaphore per model caps concurrent calls (provider rate limits)
+    - single-flight: identical in-flight requests (same model + key) share one call
+    - each attempt is bounded by the call timeout and the request's remaining budget
+    - transient errors are retried with full-jitter exponential backoff
+    - a circuit breaker per model fails fast while the provider is unhealthy
+    - counters for queue depth, wait time, in-flight calls and coalesced requests
+    Raises LLMUnavailable when no answer could be obtained in time.
+    """
+
+    def __init__(self, limits: Dict[str, int], call_timeout: float, max_retries: int,
+                 retry_base_delay: float, failure_threshold: int, reset_seconds: float):
+        self.call_timeout = call_timeout
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self._semaphores = {name: asyncio.Semaphore(limit) for name, limit in limits.items()}
+        self._breakers = {name: CircuitBreaker(failure_threshold, reset_seconds) for name in limits}
+        self._inflight: Dict[tuple, asyncio.Future] = {}
+        self._stats = {
+            name: {
+                "limit": limit, "calls": 0, "coalesced": 0, "errors": 0, "retries": 0,
+                "timeouts": 0, "short_circuited": 0,
+                "waiting": 0, "in_flight": 0, "wait_seconds_total": 0.0, "wait_seconds_max": 0.0,
+            }
+            for name, limit in limits.items()
+        }
+
+    async def generate(self, model_name: str, model, contents, coalesce_key: Optional[str] = None) -> Any:
+        """
+        Runs model.generate_content_async(contents) under the model's concurrency limit.
+        Callers passing the same coalesce_key while a call is in flight get its result.
+        """
+        if coalesce_key is None:
+            return await self._call_with_retries(model_name, model, contents)
+
+        key = (model_name, coalesce_key)
+        existing = self._inflight.get(key)
+        if existing is not None:
+            self._stats[model_name]["coalesced"] += 1
+            LLM_COALESCED.labels(model_name).inc()
+            # shield: one caller being cancelled must not cancel the shared call.
+            # The shared call follows the first caller's budget; still honour ours.
+            remaining = _remaining_budget()
+            try:
+                return await asyncio.wait_for(asyncio.shield(existing), timeout=remaining)
+            except asyncio.TimeoutError:
+                LLM_UNAVAILABLE.labels(model_name).inc()
+                raise LLMUnavailable("request deadline exceeded while waiting for a shared call")
+
+        future = asyncio.get_running_loop().create_future()
+        # Nobody may be waiting on the shared future; don't warn about unretrieved errors
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[key] = future
+        try:
+            result = await self._call_with_retries(model_name, model, contents)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                # Only the leader was cancelled; the others get an answer they can handle
+                future.set_exception(LLMUnavailable("shared call was cancelled", retry_after=1.0))
+            else:
+                future.set_exception(e)
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _call_with_retries(self, model_name: str, model, contents) -> Any:
+        breaker = self._breakers[model_name]
+        try:
+            return await self._attempts(model_name, model, contents)
+        except LLMUnavailable:
+            LLM_UNAVAILABLE.labels(model_name).inc()
+            raise
+        finally:
+            LLM_CIRCUIT_OPEN.labels(model_name).set(0 if breaker.state == "closed" else 1)
+
+    async def _attempts(self, model_name: str, model, contents) -> Any:
+        stats = self._stats[model_name]
+        breaker = self._breakers[model_name]
+        attempt = 0
+        while True:
+            try:
+                breaker.before_call()
+            except LLMUnavailable:
+                stats["short_circuited"] += 1
+                raise
+            try:
+                result = await self._call(model_name, model, contents)
+            except LLMUnavailable:
+                # Budget ran out before the call could start; says nothing about the provider
+                breaker.release_trial()
+                raise
+            except asyncio.CancelledError:
+                # Client gone, deadline or shutdown: no verdict on the provider either way
+                breaker.release_trial()
+                raise
+            except Exception as e:
+                stats["errors"] += 1
+                if isinstance(e, asyncio.TimeoutError):
+                    stats["timeouts"] += 1
+                if not is_transient_error(e):
+                    # Not a sign the provider is down (e.g. bad request, parsing bug), but
+                    # not a success either: only a real answer closes a half-open circuit
+                    breaker.release_trial()
+                    raise
+                breaker.record_failure()
+                delay = random.uniform(0, self.retry_base_delay * (2 ** attempt))
+                remaining = _remaining_budget()
+                if attempt >= self.max_retries or (remaining is not None and remaining <= delay):
+                    raise LLMUnavailable(f"{model_name} failed after {attempt + 1} attempt(s): {e!r}",
+                                         retry_after=breaker.retry_after())
+                attempt += 1
+                stats["retries"] += 1
+                LLM_RETRIES.labels(model_name).inc()
+                logger.warning(f"Transient {model_name} error ({e!r}); retry {attempt} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                continue
+            breaker.record_success()
+            return result
+
+    def _attempt_timeout(self) -> float:
+        remaining = _remaining_budget()
+        timeout = self.call_timeout if remaining is None else min(self.call_timeout, remaining)
+        if timeout <= 0:
+            raise LLMUnavailable("request deadline exceeded")
+        return timeout
+
+    async def _call(self, model_name: str, model, contents) -> Any:
+        stats = self._stats[model_name]
+        semaphore = self._semaphores[model_name]
+        stats["waiting"] += 1
+        queued_at = time.monotonic()
+        try:
+            # Waiting for a slot spends the same budget as the call itself
+            await asyncio.wait_for(semaphore.acquire(), timeout=self._attempt_timeout())
+        except asyncio.TimeoutError:
+            raise LLMUnavailable("request deadline exceeded while queued for the LLM")
+        finally:
+            stats["waiting"] -= 1
+        started = time.monotonic()
+        waited = started - queued_at
+        stats["wait_seconds_total"] += waited
+        stats["wait_seconds_max"] = max(stats["wait_seconds_max"], waited)
+        LLM_QUEUE_WAIT.labels(model_name).observe(waited)
+        stats["calls"] += 1
+        stats["in_flight"] += 1
+        LLM_IN_FLIGHT.labels(model_name).inc()
+        outcome = "error"
+        try:
+            response = await asyncio.wait_for(model.generate_content_async(contents), timeout=self._attempt_timeout())
+            outcome = "ok"
+            observe_llm_usage(model_name, contents, response)
+            return response
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+            raise
+        finally:
+            stats["in_flight"] -= 1
+            LLM_IN_FLIGHT.labels(model_name).dec()
+            LLM_CALL_DURATION.labels(model_name, outcome).observe(time.monotonic() - started)
+            semaphore.release()
+
+    def stats(self) -> Dict[str, dict]:
+        return {
+            name: {**values, "circuit": self._breakers[name].state, "circuit_opened": self._breakers[name].times_opened}
+            for name, values in self._stats.items()
+        }
+
+
+llm_gateway = LLMGateway(
+    limits={
+        "regulator": settings.REGULATOR_MAX_CONCURRENCY,
+        "verifier": settings.VERIFIER_MAX_CONCURRENCY,
+    },
+    call_timeout=settings.LLM_CALL_TIMEOUT_SECONDS,
+    max_retries=settings.LLM_MAX_RETRIES,
+    retry_base_delay=settings.LLM_RETRY_BASE_DELAY_SECONDS,
+    failure_threshold=settings.LLM_CIRCUIT_FAILURE_THRESHOLD,
+    reset_seconds=settings.LLM_CIRCUIT_RESET_SECONDS,
+)
 
 
 # --- NEW FUNCTION: The "Gatekeeper" ---
 async def verify_organization_identity(
     org_name: str,
     business_registration_number: str,
-    cac_certificate_file: dict # This will be the dict from genai.upload_file
+    cac_certificate_file: dict, # This will be the dict from genai.upload_file
+    coalesce_key: Optional[str] = None # Identifies the certificate bytes + details, for single-flight
 ) -> dict:
     
+    await ensure_models()
     if not verifier_model:
         logger.error("Verifier AI model is not initialized. Failing closed.")
-        return {"decision": "REJECTED", "reason": "Internal AI system error. Check model configuration."}
+        return {"decision": "REJECTED", "reason": "Internal AI system error. Check model configuration.", "error": True}
 
     # --- The Multi-Modal Prompt ---
     prompt_parts = [
@@ -86,19 +404,23 @@ async def verify_organization_identity(
     ]
 
     try:
-        response = await verifier_model.generate_content_async(prompt_parts)
+        response = await llm_gateway.generate("verifier", verifier_model, prompt_parts, coalesce_key=coalesce_key)
         json_response_text = response.text.strip().replace("```json", "").replace("```", "")
         ai_response = json.loads(json_response_text)
         
         decision = ai_response.get("decision", "REJECTED").upper()
         reason = ai_response.get("reason", "AI analysis was inconclusive.")
         
-        logger.info(f"Verification Decision: {decision}. Reason: {reason}")
+        logger.info(f"Verification Decision: {decision}. Reason: {reason}", extra={"event": "verification.decision", "decision": decision})
         return {"decision": decision, "reason": reason}
 
+    except LLMUnavailable as e:
+        # Not a judgement on the company - the job is retried later
+        logger.error(f"Verifier AI unavailable: {e}")
+        return {"decision": "UNAVAILABLE", "reason": "The AI verifier is temporarily unavailable.", "error": True, "retry_after": e.retry_after}
     except Exception as e:
         logger.error(f"Error calling Verifier AI: {e}")
-        return {"decision": "REJECTED", "reason": f"Internal error during AI verification: {e}"}
+        return {"decision": "REJECTED", "reason": f"Internal error during AI verification: {e}", "error": True}
 
 
 # --- UPGRADED FUNCTION: The "Regulator" ---
@@ -106,12 +428,14 @@ async def check_policy_compliance(
     policy_text: str, 
     data_type: str, 
     purpose: str,
-    company_category: str # This category is now TRUSTED
+    company_category: str, # This category is now TRUSTED
+    excerpt: bool = False # policy_text holds only the sections relevant to this request (app/policy_index.py)
 ) -> dict:
     
+    await ensure_models()
     if not regulator_model:
         logger.error("Regulator AI model is not initialized. Failing closed.")
-        return {"decision": "VIOLATION", "reason": "Internal AI system error."}
+        return {"decision": "VIOLATION", "reason": "Internal AI system error.", "error": True}
 
     prompt = f"""
     Analyze the following request based on the company's *verified* profile and its policy.
@@ -119,7 +443,7 @@ async def check_policy_compliance(
     VERIFIED COMPANY PROFILE:
     - Category: "{company_category}"
 
-    PRIVACY POLICY:
+    {"PRIVACY POLICY (the sections relevant to this request; the rest is omitted)" if excerpt else "PRIVACY POLICY"}:
     "{policy_text}"
 
     DATA REQUEST:
@@ -137,16 +461,22 @@ async def check_policy_compliance(
     """
 
     try:
-        response = await regulator_model.generate_content_async(prompt)
+        # Identical prompts in flight at the same time share one Gemini call
+        prompt_key = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        response = await llm_gateway.generate("regulator", regulator_model, prompt, coalesce_key=prompt_key)
         json_response_text = response.text.strip().replace("```json", "").replace("```", "")
         ai_response = json.loads(json_response_text)
         
         decision = ai_response.get("decision", "VIOLATION").upper()
         reason = ai_response.get("reason", "AI analysis was inconclusive.")
 
-        logger.info(f"Compliance Decision: {decision}. Reason: {reason}")
+        logger.info(f"Compliance Decision: {decision}. Reason: {reason}", extra={"event": "compliance.decision", "decision": decision})
         return {"decision": decision, "reason": reason}
 
+    except LLMUnavailable as e:
+        # Distinct from VIOLATION: nothing was judged, the client should retry later
+        logger.error(f"Regulator AI unavailable: {e}")
+        return {"decision": "UNAVAILABLE", "reason": "The AI compliance regulator is temporarily unavailable. Please retry shortly.", "error": True, "retry_after": e.retry_after}
     except Exception as e:
         logger.error(f"Error calling Regulator AI: {e}")
-        return {"decision": "VIOLATION", "reason": f"Internal error during AI compliance check: {e}"}
\ No newline at end of file
+        return {"decision": "VIOLATION", "reason": f"Internal error during AI compliance check: {e}", "error": True}
\ No newline at end of file
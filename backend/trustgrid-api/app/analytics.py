@@ -0,0 +1,225 @@
+# app/analytics.py
+"""
+Per-organization request analytics from rollup documents.
+
+consent_rollups holds one document per (org, UTC day, data_type) with a
+count per status:
+    {"_id": "<org_id>:<YYYY-MM-DD>:<data_type>", "org_id", "day", "data_type",
+     "counts": {"requests", "pending", "auto_approved", "approved", "denied"}}
+A request is counted on the day it was created (the time in its _id). A
+decision moves it from "pending" to "approved" / "denied" on that same day.
+Reading a date range therefore touches at most days x data types documents,
+however large the log is.
+
+Writers don't wait on the rollups. rollups.record_created() and
+record_decision() add $inc deltas to an in-process buffer, and a background
+task writes them with one bulk_write every ROLLUP_FLUSH_SECONDS. A crash
+loses at most that window, as does a replayed write-behind journal
+(app/consent_journal.py). backfill() rebuilds days exactly from the log
+(hot and archive tiers):
+    python -m app.analytics backfill --since 2024-01-01 [--org <org_id>]
+"""
+import argparse
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import date, datetime, time, timezone
+from typing import Dict, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ReplaceOne, UpdateOne
+
+from app.database import consent_rollups_collection, settings
+from app.logging_config import configure_logging
+from app.retention import consent_log_tiers
+
+logger = logging.getLogger(__name__)
+
+STATUSES = ("pending", "auto_approved", "approved", "denied")
+COUNT_FIELDS = ("requests",) + STATUSES
+
+RollupKey = Tuple[ObjectId, date, str]
+
+
+def request_day(doc_id: ObjectId) -> date:
+    """The UTC day a consent request was created, from its _id."""
+    return doc_id.generation_time.date()
+
+def rollup_id(org_id: ObjectId, day: date, data_type: str) -> str:
+    return f"{org_id}:{day.isoformat()}:{data_type}"
+
+def day_start(day: date) -> datetime:
+    return datetime.combine(day, time.min, tzinfo=timezone.utc)
+
+
+class RollupWriter:
+    """Buffers rollup $inc deltas and writes them in batches."""
+
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self._deltas: Dict[RollupKey, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self._task: Optional[asyncio.Task] = None
+
+    def record_created(self, doc: dict) -> None:
+        """A new consent log entry (pending or auto_approved)."""
+        deltas = self._deltas[(doc["org_id"], request_day(doc["_id"]), doc["data_type"])]
+        deltas["requests"] += 1
+        deltas[doc["status"]] += 1
+
+    def record_decision(self, request_doc: dict, decision: str) -> None:
+        """A pending request was approved or denied."""
+        deltas = self._deltas[(request_doc["org_id"], request_day(request_doc["_id"]), request_doc["data_type"])]
+        deltas["pending"] -= 1
+        deltas[decision] += 1
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._flush_forever())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"🔥 Rollup deltas lost on shutdown (backfill repairs them): {e}")
+
+    async def _flush_forever(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"🔥 Rollup flush failed, retrying: {e}")
+
+    async def flush(self) -> None:
+        if not self._deltas:
+            return
+        batch, self._deltas = self._deltas, defaultdict(lambda: defaultdict(int))
+        operations = [
+            UpdateOne(
+                {"_id": rollup_id(org_id, day, data_type)},
+                {
+                    "$setOnInsert": {"org_id": org_id, "day": day_start(day), "data_type": data_type},
+                    "$inc": {f"counts.{field}": value for field, value in deltas.items() if value},
+                },
+                upsert=True,
+            )
+            for (org_id, day, data_type), deltas in batch.items()
+            if any(deltas.values())
+        ]
+        try:
+            if operations:
+                await consent_rollups_collection.bulk_write(operations, ordered=False)
+        except Exception:
+            # Put them back for the next round ($inc is additive)
+            for key, deltas in batch.items():
+                for field, value in deltas.items():
+                    self._deltas[key][field] += value
+            raise
+
+
+async def org_analytics(org_id: ObjectId, since: date, until: date, data_type: Optional[str] = None) -> dict:
+    """Counts per day and data type for days in [since, until], plus totals and approval rates."""
+    query = {"org_id": org_id, "day": {"$gte": day_start(since), "$lte": day_start(until)}}
+    if data_type:
+        query["data_type"] = data_type
+    rollups = await consent_rollups_collection.find(query).sort([("day", 1), ("data_type", 1)]).to_list(None)
+
+    def summarize(counts: Dict[str, int]) -> dict:
+        decided = counts["auto_approved"] + counts["approved"] + counts["denied"]
+        granted = counts["auto_approved"] + counts["approved"]
+        return {**counts, "approval_rate": round(granted / decided, 4) if decided else None}
+
+    totals = dict.fromkeys(COUNT_FIELDS, 0)
+    by_data_type: Dict[str, Dict[str, int]] = defaultdict(lambda: dict.fromkeys(COUNT_FIELDS, 0))
+    days = []
+    for rollup in rollups:
+        counts = {field: rollup.get("counts", {}).get(field, 0) for field in COUNT_FIELDS}
+        for field, value in counts.items():
+            totals[field] += value
+            by_data_type[rollup["data_type"]][field] += value
+        days.append({"day": rollup["day"].date(), "data_type": rollup["data_type"], **summarize(counts)})
+    return {
+        "since": since,
+        "until": until,
+        "totals": summarize(totals),
+        "by_data_type": {name: summarize(counts) for name, counts in sorted(by_data_type.items())},
+        "days": days,
+    }
+
+
+async def backfill(since: date, until: date, org_id: Optional[ObjectId] = None) -> int:
+    """
+    Recomputes the rollups of days in [since, until) from the consent log
+    (all tiers) and replaces them. Returns how many rollups were written.
+    Live deltas for these days that land while it runs may be overwritten,
+    so leave `until` at today (the default) unless repairing a quiet period.
+    """
+    # Requests are dated by _id, so the _id range selects them (and uses the _id index)
+    match = {"_id": {
+        "$gte": ObjectId.from_datetime(day_start(since)),
+        "$lt": ObjectId.from_datetime(day_start(until)),
+    }}
+    if org_id:
+        match["org_id"] = org_id
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": {
+                "org_id": "$org_id",
+                "day": {"$dateToString": {"format": "%Y-%m-%d", "date": {"$toDate": "$_id"}}},
+                "data_type": "$data_type",
+                "status": "$status",
+            },
+            "n": {"$sum": 1},
+        }},
+    ]
+    counts: Dict[RollupKey, Dict[str, int]] = defaultdict(lambda: dict.fromkeys(COUNT_FIELDS, 0))
+    for tier in await consent_log_tiers():
+        if tier.before is not None and tier.before <= day_start(since):
+            continue # An archive year entirely before the range
+        for group in await tier.collection.aggregate(pipeline):
+            key = group["_id"]
+            day = date.fromisoformat(key["day"])
+            rollup = counts[(key["org_id"], day, key["data_type"])]
+            rollup["requests"] += group["n"]
+            if key["status"] in STATUSES:
+                rollup[key["status"]] += group["n"]
+
+    # Replace every recomputed rollup, then drop the range's rollups this run didn't write
+    run = ObjectId()
+    operations = [
+        ReplaceOne(
+            {"_id": rollup_id(org, day, data_type)},
+            {"org_id": org, "day": day_start(day), "data_type": data_type, "counts": rollup_counts, "backfill": run},
+            upsert=True,
+        )
+        for (org, day, data_type), rollup_counts in counts.items()
+    ]
+    for start in range(0, len(operations), 1000):
+        await consent_rollups_collection.bulk_write(operations[start:start + 1000], ordered=False)
+    stale = {"day": {"$gte": day_start(since), "$lt": day_start(until)}, "backfill": {"$ne": run}}
+    if org_id:
+        stale["org_id"] = org_id
+    await consent_rollups_collection.delete_many(stale)
+    logger.info(f"Backfilled {len(operations)} rollups for {since} .. {until}.")
+    return len(operations)
+
+
+rollups = RollupWriter(flush_interval=settings.ROLLUP_FLUSH_SECONDS)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild consent_rollups from the consent log.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    backfill_parser = subcommands.add_parser("backfill")
+    backfill_parser.add_argument("--since", type=date.fromisoformat, required=True, help="First day (YYYY-MM-DD, UTC).")
+    backfill_parser.add_argument("--until", type=date.fromisoformat, default=None, help="Day after the last one (default: today).")
+    backfill_parser.add_argument("--org", type=ObjectId, default=None, help="Only this organization id.")
+    args = parser.parse_args()
+    configure_logging(settings)
+    until = args.until or datetime.now(timezone.utc).date()
+    written = asyncio.run(backfill(args.since, until, args.org))
+    print(f"Wrote {written} rollups.")
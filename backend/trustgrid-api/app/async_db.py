@@ -0,0 +1,177 @@
+# app/async_db.py
+"""
+Async access to the (synchronous) pymongo collections.
+
+Every blocking pymongo call is handed to a dedicated, bounded thread pool so
+request handlers can `await` it without stalling the event loop. The API
+mirrors Motor (`await coll.find_one(...)`, `await coll.find(...).sort(...).to_list(None)`,
+`async for doc in coll.find(...)`) so the driver can be swapped later without
+touching the endpoints.
+"""
+import asyncio
+import functools
+import time
+from concurrent.futures import Executor
+from typing import Any, Callable, List, Optional
+
+import pymongo.errors
+
+from app.metrics import MONGO_EXECUTOR_WAIT, MONGO_IN_FLIGHT, MONGO_OPERATION_DURATION, MONGO_OPERATION_ERRORS
+
+DUPLICATE_KEY = 11000
+
+async def run_in_executor(executor: Optional[Executor], fn: Callable, *args, **kwargs) -> Any:
+    """Runs a blocking callable on `executor` and awaits its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+
+async def run_timed(executor: Optional[Executor], collection: str, operation: str, fn: Callable, *args, **kwargs) -> Any:
+    """run_in_executor, recorded in the Mongo metrics (app/metrics.py) under collection/operation."""
+    submitted = time.perf_counter()
+
+    def timed_call():
+        MONGO_EXECUTOR_WAIT.observe(time.perf_counter() - submitted)
+        return fn(*args, **kwargs)
+
+    MONGO_IN_FLIGHT.inc()
+    try:
+        return await run_in_executor(executor, timed_call)
+    except Exception as e:
+        MONGO_OPERATION_ERRORS.labels(collection, operation, type(e).__name__).inc()
+        raise
+    finally:
+        MONGO_IN_FLIGHT.dec()
+        MONGO_OPERATION_DURATION.labels(collection, operation).observe(time.perf_counter() - submitted)
+
+
+class AsyncCursor:
+    """
+    Wraps a pymongo Cursor. Builder methods (sort/limit/skip/...) do no I/O and
+    return self; fetching happens in the executor via to_list() or `async for`.
+    """
+
+    def __init__(self, cursor, executor: Executor, batch_size: int = 100, collection: str = ""):
+        self._cursor = cursor
+        self._executor = executor
+        self._collection = collection
+        self._batch_size = batch_size
+        self._buffer: List[dict] = []
+        self._exhausted = False
+
+    def sort(self, *args, **kwargs) -> "AsyncCursor":
+        self._cursor.sort(*args, **kwargs)
+        return self
+
+    def limit(self, limit: int) -> "AsyncCursor":
+        self._cursor.limit(limit)
+        return self
+
+    def skip(self, skip: int) -> "AsyncCursor":
+        self._cursor.skip(skip)
+        return self
+
+    def hint(self, index) -> "AsyncCursor":
+        self._cursor.hint(index)
+        return self
+
+    def batch_size(self, batch_size: int) -> "AsyncCursor":
+        self._cursor.batch_size(batch_size)
+        self._batch_size = batch_size
+        return self
+
+    async def to_list(self, length: Optional[int] = None) -> List[dict]:
+        """Fetches up to `length` documents (all remaining if None)."""
+        def fetch():
+            if length is None:
+                return list(self._cursor)
+            return [doc for _, doc in zip(range(length), self._cursor)]
+        return await run_timed(self._executor, self._collection, "find", fetch)
+
+    async def close(self) -> None:
+        await run_in_executor(self._executor, self._cursor.close)
+
+    def __aiter__(self) -> "AsyncCursor":
+        return self
+
+    async def __anext__(self) -> dict:
+        if not self._buffer:
+            if self._exhausted:
+                raise StopAsyncIteration
+            # Pull a whole batch per executor hop instead of one document
+            self._buffer = await self.to_list(self._batch_size)
+            if len(self._buffer) < self._batch_size:
+                self._exhausted = True
+            if not self._buffer:
+                raise StopAsyncIteration
+            self._buffer.reverse() # pop() from the end in original order
+        return self._buffer.pop()
+
+
+class AsyncCollection:
+    """Awaitable facade over a pymongo Collection. Use `.sync` for the raw collection."""
+
+    def __init__(self, collection, executor: Executor):
+        self.sync = collection
+        self._executor = executor
+
+    @property
+    def name(self) -> str:
+        return self.sync.name
+
+    async def _run(self, method: str, *args, **kwargs) -> Any:
+        return await run_timed(self._executor, self.name, method, getattr(self.sync, method), *args, **kwargs)
+
+    def find(self, *args, **kwargs) -> AsyncCursor:
+        # Creating a pymongo cursor does no I/O; iteration does.
+        return AsyncCursor(self.sync.find(*args, **kwargs), self._executor, collection=self.name)
+
+    async def find_one(self, *args, **kwargs):
+        return await self._run("find_one", *args, **kwargs)
+
+    async def find_one_and_update(self, *args, **kwargs):
+        return await self._run("find_one_and_update", *args, **kwargs)
+
+    async def insert_one(self, *args, **kwargs):
+        return await self._run("insert_one", *args, **kwargs)
+
+    async def insert_many(self, *args, **kwargs):
+        return await self._run("insert_many", *args, **kwargs)
+
+    async def insert_many_ignoring_duplicates(self, docs: List[dict]) -> None:
+        """
+        Unordered insert_many where documents whose _id is already present count
+        as written, so re-running it (a replay, a retried batch) is harmless.
+        """
+        if not docs:
+            return
+        try:
+            await self.insert_many(docs, ordered=False)
+        except pymongo.errors.BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != DUPLICATE_KEY for error in errors) or e.details.get("writeConcernErrors"):
+                raise
+
+    async def update_one(self, *args, **kwargs):
+        return await self._run("update_one", *args, **kwargs)
+
+    async def update_many(self, *args, **kwargs):
+        return await self._run("update_many", *args, **kwargs)
+
+    async def delete_one(self, *args, **kwargs):
+        return await self._run("delete_one", *args, **kwargs)
+
+    async def delete_many(self, *args, **kwargs):
+        return await self._run("delete_many", *args, **kwargs)
+
+    async def bulk_write(self, *args, **kwargs):
+        return await self._run("bulk_write", *args, **kwargs)
+
+    async def count_documents(self, *args, **kwargs) -> int:
+        return await self._run("count_documents", *args, **kwargs)
+
+    async def aggregate(self, pipeline, **kwargs) -> List[dict]:
+        """Runs an aggregation and returns all results (aggregations here are small)."""
+        return await run_timed(self._executor, self.name, "aggregate", lambda: list(self.sync.aggregate(pipeline, **kwargs)))
+
+    async def create_index(self, *args, **kwargs):
+        return await self._run("create_index", *args, **kwargs)
@@ -2,49 +2,113 @@
 from fastapi import Security, HTTPException, status
 from fastapi.security.api_key import APIKeyHeader
 import pymongo
-from .database import api_keys_collection, organizations_collection # <-- Use api_keys_collection
+from .database import api_keys_collection, organizations_collection, settings # <-- Use api_keys_collection
 from .models import Organization, ApiKey # Import ApiKey
-from .security import verify_api_key # <-- Import our new function
+from .security import get_api_key_hash, get_api_key_prefix
+from .cache import TTLCache
+from .metrics import AUTH_DURATION, register_cache
 from .models import validate_object_id # Import koded's validator
 from bson import ObjectId
+from typing import Optional
 import logging
+import time
 
 # Define the API key header we expect
 api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
 
+# Authenticated orgs keyed by API key hash: (org, the key's auth_version when cached).
+# A hit still re-reads the key's status and auth_version (one indexed read instead
+# of two reads plus validation), so a key revoked or an org changed by any worker
+# stops being served at once. invalidate_api_key / invalidate_org also drop the
+# entries here so this process doesn't even make that read.
+org_cache = TTLCache(
+    maxsize=settings.ORG_CACHE_MAX_ENTRIES,
+    ttl=settings.ORG_CACHE_TTL_SECONDS,
+    name="org_auth",
+)
+register_cache(org_cache)
+
+def invalidate_api_key(key_hash: str) -> None:
+    """Drops the cached org for one API key (e.g. after it is revoked)."""
+    org_cache.pop(key_hash)
+
+async def invalidate_org(org_id) -> int:
+    """
+    Drops every cached entry for an org (e.g. after its policy or verification changes).
+    Bumping auth_version on the org's keys makes every other worker drop theirs on next use.
+    """
+    await api_keys_collection.update_many({"org_id": validate_object_id(str(org_id))}, {"$inc": {"auth_version": 1}})
+    org_id = str(org_id)
+    return org_cache.pop_where(lambda _key_hash, entry: str(entry[0].id) == org_id)
+
+async def _cached_org(key_hash: str) -> Optional[Organization]:
+    """The cached org for this key if the key is still active and its org unchanged since."""
+    entry = org_cache.get(key_hash)
+    if entry is None:
+        return None
+    org, auth_version = entry
+    key_doc = await api_keys_collection.find_one({"key_hash": key_hash}, {"status": 1, "auth_version": 1})
+    if key_doc and key_doc.get("status") == "active" and key_doc.get("auth_version", 0) == auth_version:
+        return org
+    # Revoked, deleted or changed since it was cached (possibly by another worker)
+    org_cache.pop(key_hash)
+    return None
+
+async def find_active_api_key(api_key: str, key_hash: Optional[str] = None) -> Optional[dict]:
+    """
+    Resolves a plain-text API key to its active key document with a single
+    indexed query on `key_hash` (unique index, see app/database.py).
+
+    Keys issued before key prefixes existed resolve the same way, since their
+    hash was computed with the same scheme; their `key_prefix` is backfilled
+    the first time they are used.
+    """
+    key_hash = key_hash or get_api_key_hash(api_key)
+    key_doc = await api_keys_collection.find_one({"key_hash": key_hash, "status": "active"})
+    if key_doc and not key_doc.get("key_prefix"):
+        # --- Lazy migration for legacy keys ---
+        await api_keys_collection.update_one(
+            {"_id": key_doc["_id"]},
+            {"$set": {"key_prefix": get_api_key_prefix(api_key)}}
+        )
+    return key_doc
+
 async def get_current_org(api_key: str = Security(api_key_header)) -> Organization:
     """
     Dependency to validate a dynamic API key.
-    Checks the provided key against hashed keys in the DB and returns the associated org.
+    Looks up the hash of the provided key in the DB and returns the associated org.
     """
     if not api_key:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="API Key is missing"
         )
-    
+
     # --- DYNAMIC KEY CHECK ---
-    # 1. Iterate through all API keys in the database
-    # Note: In a production system with many keys, you'd optimize this,
-    # perhaps by storing a key prefix and only querying potential matches.
-    all_api_keys = api_keys_collection.find({"status": "active"}) # Only check active keys
-    
-    matched_key_doc = None
-    for key_doc in all_api_keys:
-        hashed_key = key_doc.get("key_hash")
-        if hashed_key and verify_api_key(api_key, hashed_key):
-            # Found a valid, matching key!
-            matched_key_doc = key_doc
-            break # Stop searching
-            
+    # 0. Serve recently authenticated keys from the in-process cache
+    started = time.perf_counter()
+    key_hash = get_api_key_hash(api_key)
+    cached_org = await _cached_org(key_hash)
+    if cached_org is not None:
+        AUTH_DURATION.labels("cache").observe(time.perf_counter() - started)
+        return cached_org
+
+    # 1. Resolve the key with one indexed lookup on its hash
+    matched_key_doc = await find_active_api_key(api_key, key_hash)
+
     # 2. If a matching key was found, get the associated organization
     if matched_key_doc:
         org_id = matched_key_doc.get("org_id")
         if org_id:
-            org_data = organizations_collection.find_one({"_id": org_id})
+            org_data = await organizations_collection.find_one({"_id": org_id})
             if org_data:
-                # Return the Pydantic Organization model
-                return Organization(**org_data)
+                # Cache and return the Pydantic Organization model
+                org = Organization(**org_data)
+                # Cached under the version read with the key: if the org changed since,
+                # the version has moved on and the next hit reloads it
+                org_cache.set(key_hash, (org, matched_key_doc.get("auth_version", 0)))
+                AUTH_DURATION.labels("db").observe(time.perf_counter() - started)
+                return org
             else:
                 # This should not happen if data integrity is maintained
                 logging.error(f"API Key {matched_key_doc['_id']} linked to non-existent org {org_id}")
@@ -53,9 +117,10 @@ async def get_current_org(api_key: str = Security(api_key_header)) -> Organizati
              logging.error(f"API Key {matched_key_doc['_id']} has no associated org_id")
              raise HTTPException(status_code=500, detail="Internal server error: API key is not linked to an organization.")
 
-    # 3. If no match is found after checking all active keys
+    # 3. If no active key has this hash
+    AUTH_DURATION.labels("rejected").observe(time.perf_counter() - started)
     logging.warning(f"Invalid API key attempt (no match found or key inactive).")
     raise HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Invalid or expired API Key"
-    )
\ No newline at end of file
+    )
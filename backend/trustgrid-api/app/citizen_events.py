@@ -0,0 +1,137 @@
+# app/citizen_events.py
+"""
+Live consent request updates for the citizen app, instead of polling
+GET /api/v1/citizen/{user_id}/requests.
+
+Request handlers publish every consent log change for a citizen to
+`citizen_events` (an in-process pub/sub keyed by user_id); each open
+GET /api/v1/citizen/{user_id}/events stream holds one subscription and
+relays the events as Server-Sent Events.
+
+Publishes only reach subscribers in the same process. With several API
+processes, feed publish() from a Mongo change stream on consent_log (one
+watcher per process) instead of from the request handlers; subscribers and
+the stream endpoint stay as they are.
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from app.database import settings
+from app.metrics import CITIZEN_EVENT_STREAMS
+from app.models import ConsentLog
+from app.serialization import encode_document
+
+# request.created: a new consent log (pending or auto_approved)
+# request.updated: a citizen's decision on a pending request
+EVENT_TYPES = ("request.created", "request.updated")
+
+
+class Subscription:
+    """One stream's queue. A reader that falls `queue_size` events behind is closed rather than buffered."""
+
+    def __init__(self, queue_size: int):
+        self.queue: "asyncio.Queue[Optional[Tuple[str, bytes]]]" = asyncio.Queue(maxsize=queue_size)
+        self.closed = False
+
+    def push(self, event: Tuple[str, bytes]) -> None:
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # The client resynchronises from the snapshot sent when it reconnects
+            self.close()
+
+    def close(self) -> None:
+        """Ends the stream: the reader gets None once it reaches the end marker."""
+        self.closed = True
+        while True:
+            try:
+                self.queue.put_nowait(None)
+                return
+            except asyncio.QueueFull:
+                self.queue.get_nowait()
+
+
+class CitizenEventHub:
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+
+    def publish(self, event_type: str, consent_log: dict) -> int:
+        """
+        Sends a consent log document to every open stream of its citizen and
+        returns how many there were. Never blocks: call it after the write succeeded.
+        """
+        subscribers = self._subscribers.get(consent_log["user_id"])
+        if not subscribers:
+            return 0
+        # Serialised once, however many devices the citizen has open
+        data = encode_document(ConsentLog, consent_log)
+        for subscription in list(subscribers):
+            subscription.push((event_type, data))
+        return len(subscribers)
+
+    @asynccontextmanager
+    async def subscribe(self, user_id: str) -> AsyncIterator[Subscription]:
+        subscription = Subscription(self.queue_size)
+        self._subscribers.setdefault(user_id, set()).add(subscription)
+        CITIZEN_EVENT_STREAMS.inc()
+        try:
+            yield subscription
+        finally:
+            CITIZEN_EVENT_STREAMS.dec()
+            subscribers = self._subscribers.get(user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[user_id]
+
+    def stats(self) -> dict:
+        return {
+            "citizens": len(self._subscribers),
+            "streams": sum(len(subscribers) for subscribers in self._subscribers.values()),
+        }
+
+
+def format_sse(event_type: str, data: bytes) -> bytes:
+    return f"event: {event_type}\ndata: ".encode() + data + b"\n\n"
+
+
+async def sse_stream(
+    hub: CitizenEventHub,
+    user_id: str,
+    load_snapshot: Callable[[], Awaitable[bytes]],
+    heartbeat: float,
+    max_seconds: float,
+) -> AsyncIterator[bytes]:
+    """
+    The body of one /events response: the citizen's current pending requests
+    as a "snapshot" event, then every published event, with a comment line
+    every `heartbeat` seconds while idle. Subscribing before loading the
+    snapshot means no change is missed in between (some may arrive twice).
+
+    The stream ends after `max_seconds` and the client reconnects. Otherwise
+    open streams would hold up a graceful shutdown (uvicorn waits for them
+    before running shutdown hooks) and pin clients to one process.
+    """
+    async with hub.subscribe(user_id) as subscription:
+        yield b"retry: 3000\n" + format_sse("snapshot", await load_snapshot())
+        ends_at = time.monotonic() + max_seconds
+        while True:
+            remaining = ends_at - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), timeout=min(heartbeat, remaining))
+            except asyncio.TimeoutError:
+                yield b": keep-alive\n\n"
+                continue
+            if event is None:
+                return
+            yield format_sse(*event)
+
+
+citizen_events = CitizenEventHub(queue_size=settings.CITIZEN_EVENTS_QUEUE_SIZE)
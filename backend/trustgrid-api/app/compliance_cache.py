@@ -0,0 +1,128 @@
+# app/compliance_cache.py
+import hashlib
+import logging
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from app.ai_compliance import check_policy_compliance
+from app.async_db import AsyncCollection
+from app.cache import TTLCache
+from app.metrics import register_cache
+from app.policy_index import policy_excerpt, policy_hash
+from app.database import compliance_decisions_collection, settings
+
+logger = logging.getLogger(__name__)
+
+# Only real regulator verdicts are cached - never errors or unparseable answers
+CACHEABLE_DECISIONS = ("APPROVED", "VIOLATION")
+
+def normalize_purpose(purpose: str) -> str:
+    """Case, whitespace and trailing punctuation don't change what a purpose means."""
+    return re.sub(r"\s+", " ", purpose or "").strip().rstrip(".!").lower()
+
+class ComplianceDecisionCache:
+    """
+    Two-tier cache of regulator decisions keyed on
+    (policy hash, data_type, normalized purpose, company_category).
+
+    An in-memory TTLCache sits in front of a Mongo collection whose TTL index
+    (see app/database.py) expires old decisions. Because the policy hash is part
+    of the key, a changed policy never matches old entries; invalidate_policy()
+    also deletes them eagerly.
+    """
+
+    def __init__(self, collection: AsyncCollection, memory: TTLCache, ttl_seconds: float):
+        self.collection = collection
+        self.memory = memory
+        self.ttl_seconds = ttl_seconds
+
+    @staticmethod
+    def make_key(policy_digest: str, data_type: str, purpose: str, company_category: Optional[str]) -> str:
+        parts = [policy_digest, (data_type or "").strip().lower(), normalize_purpose(purpose), company_category or ""]
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    async def get(self, policy_text: str, data_type: str, purpose: str, company_category: Optional[str]) -> Optional[dict]:
+        key = self.make_key(policy_hash(policy_text), data_type, purpose, company_category)
+        cached = self.memory.get(key)
+        if cached is not None:
+            return dict(cached["result"])
+
+        # The TTL monitor only runs about once a minute, so check freshness here too
+        fresh_after = datetime.now(timezone.utc) - timedelta(seconds=self.ttl_seconds)
+        doc = await self.collection.find_one({"_id": key, "created_at": {"$gt": fresh_after}})
+        if not doc:
+            return None
+        entry = {"policy_hash": doc["policy_hash"], "result": {"decision": doc["decision"], "reason": doc["reason"]}}
+        self.memory.set(key, entry)
+        return dict(entry["result"])
+
+    async def set(self, policy_text: str, data_type: str, purpose: str, company_category: Optional[str], result: dict) -> None:
+        if result.get("error") or result.get("decision") not in CACHEABLE_DECISIONS:
+            return
+        digest = policy_hash(policy_text)
+        key = self.make_key(digest, data_type, purpose, company_category)
+        entry = {"policy_hash": digest, "result": {"decision": result["decision"], "reason": result["reason"]}}
+        self.memory.set(key, entry)
+        try:
+            await self.collection.update_one(
+                {"_id": key},
+                {"$set": {
+                    "policy_hash": digest,
+                    "data_type": data_type,
+                    "purpose": normalize_purpose(purpose),
+                    "company_category": company_category,
+                    "decision": result["decision"],
+                    "reason": result["reason"],
+                    "created_at": datetime.now(timezone.utc),
+                }},
+                upsert=True,
+            )
+        except Exception as e:
+            # The cache is an optimization - never fail the request over it
+            logger.error(f"Failed to persist compliance decision: {e}")
+
+    async def invalidate_policy(self, policy_text: Optional[str]) -> None:
+        """Drops every cached decision made against this policy text."""
+        if not policy_text:
+            return
+        digest = policy_hash(policy_text)
+        self.memory.pop_where(lambda _key, entry: entry["policy_hash"] == digest)
+        await self.collection.delete_many({"policy_hash": digest})
+
+
+decision_cache = ComplianceDecisionCache(
+    collection=compliance_decisions_collection,
+    memory=TTLCache(
+        maxsize=settings.COMPLIANCE_CACHE_MEMORY_ENTRIES,
+        # Never keep a decision in memory longer than Mongo would
+        ttl=min(settings.COMPLIANCE_CACHE_MEMORY_TTL_SECONDS, settings.COMPLIANCE_CACHE_TTL_SECONDS),
+        name="compliance_decisions",
+    ),
+    ttl_seconds=settings.COMPLIANCE_CACHE_TTL_SECONDS,
+)
+register_cache(decision_cache.memory)
+
+async def cached_check_policy_compliance(
+    policy_text: str,
+    data_type: str,
+    purpose: str,
+    company_category: str
+) -> dict:
+    """check_policy_compliance with the decision cache in front of the Gemini call."""
+    cached = await decision_cache.get(policy_text, data_type, purpose, company_category)
+    if cached is not None:
+        logger.debug(f"Compliance decision served from cache: {cached['decision']}")
+        return {**cached, "stage": "cache"}
+
+    # Keyed on the full policy above; the prompt only carries the sections relevant to this request
+    prompt_policy, is_excerpt = await policy_excerpt(policy_text, data_type, purpose)
+    result = await check_policy_compliance(
+        policy_text=prompt_policy,
+        data_type=data_type,
+        purpose=purpose,
+        company_category=company_category,
+        excerpt=is_excerpt,
+    )
+    await decision_cache.set(policy_text, data_type, purpose, company_category, result)
+    return {**result, "stage": "llm"}
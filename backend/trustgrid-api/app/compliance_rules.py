@@ -0,0 +1,126 @@
+# app/compliance_rules.py
+import copy
+import json
+import logging
+from typing import Dict, List, Optional
+
+from app.compliance_cache import cached_check_policy_compliance
+from app.database import settings
+from app.metrics import COMPLIANCE_DECISIONS
+from app.models import Organization
+from app.policy_index import phrase_text
+
+logger = logging.getLogger(__name__)
+
+# --- Default Rules ---
+# Override any of these with a JSON file at settings.COMPLIANCE_RULES_FILE
+# (top-level keys replace the defaults below).
+DEFAULT_RULES = {
+    # data_type -> the only company categories allowed to request it.
+    # Mirrors the regulator's system instruction ("BVN or NIN is ONLY for Fintech or Healthcare").
+    "restricted_data_types": {
+        "bvn": ["Fintech", "Healthcare"],
+        "nin": ["Fintech", "Healthcare"],
+    },
+    # Reject data types the org did not list in `data_types_collected` at verification.
+    # Orgs that never declared anything are left to the regulator.
+    "enforce_declared_data_types": True,
+    # Other ways orgs write a data type in their free-text declaration. Matching is on
+    # whole words, case- and plural-insensitive ("Phone Numbers" matches "phone_number").
+    "data_type_aliases": {
+        "bvn": ["bank verification number"],
+        "nin": ["national identification number", "national identity number", "national id"],
+        "email": ["e-mail"],
+        "phone_number": ["phone", "mobile number", "telephone"],
+        "date_of_birth": ["dob", "birth date", "birthday"],
+        "first_name": ["name", "full name"],
+        "last_name": ["name", "full name", "surname"],
+        "address": ["home address", "residential address"],
+        "bank_account_number": ["account number", "bank account", "bank details"],
+        "bank_name": ["bank", "bank details"],
+        "monthly_income": ["income", "salary"],
+        "medical_conditions": ["medical", "health"],
+        "fingerprint_data": ["fingerprint", "biometric"],
+        "facial_recognition_data": ["face", "facial", "biometric"],
+        "location_data": ["location", "gps"],
+    },
+}
+
+class ComplianceRules:
+    """
+    Deterministic checks that decide clear violations without calling the LLM.
+    Returns None when the request needs the regulator's judgement.
+    """
+
+    def __init__(self, rules: Dict):
+        self.restricted_data_types: Dict[str, List[str]] = {
+            k.lower(): v for k, v in rules.get("restricted_data_types", {}).items()
+        }
+        self.enforce_declared_data_types: bool = rules.get("enforce_declared_data_types", True)
+        self.data_type_aliases: Dict[str, List[str]] = {
+            k.lower(): v for k, v in rules.get("data_type_aliases", {}).items()
+        }
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> "ComplianceRules":
+        rules = copy.deepcopy(DEFAULT_RULES)
+        if path:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    rules.update(json.load(f))
+                logger.info(f"Loaded compliance rules from {path}")
+            except Exception as e:
+                logger.error(f"🔥 Failed to load compliance rules from {path}, using defaults: {e}")
+        return cls(rules)
+
+    def is_declared(self, data_type: str, data_types_collected: str) -> bool:
+        """Whether the declaration names the data type or an alias, as whole words (same matching as app/policy_index.py)."""
+        declared = phrase_text(data_types_collected)
+        phrases = [data_type] + self.data_type_aliases.get(data_type.lower(), [])
+        return any(phrase_text(phrase) in declared for phrase in phrases if phrase.strip())
+
+    def evaluate(self, data_type: str, company_category: Optional[str], data_types_collected: Optional[str]) -> Optional[dict]:
+        key = (data_type or "").strip().lower()
+
+        allowed_categories = self.restricted_data_types.get(key)
+        if allowed_categories is not None and company_category not in allowed_categories:
+            return {
+                "decision": "VIOLATION",
+                "reason": f"'{data_type}' may only be requested by {' or '.join(allowed_categories)} companies, not '{company_category}'.",
+                "rule": "category_forbidden",
+            }
+
+        if self.enforce_declared_data_types and data_types_collected and data_types_collected.strip():
+            if not self.is_declared(key, data_types_collected):
+                return {
+                    "decision": "VIOLATION",
+                    "reason": f"'{data_type}' is not among the data types your organization declared it collects.",
+                    "rule": "undeclared_data_type",
+                }
+
+        return None
+
+
+compliance_rules = ComplianceRules.load(settings.COMPLIANCE_RULES_FILE)
+
+async def evaluate_request_compliance(org: Organization, data_type: str, purpose: str) -> dict:
+    """
+    Full compliance pipeline for one data request: local rules first, then the
+    (cached) LLM regulator. `stage` records which one decided: "rules", "cache" or "llm".
+    """
+    rule_result = compliance_rules.evaluate(data_type, org.company_category, org.data_types_collected)
+    if rule_result:
+        logger.info(
+            f"Compliance decided locally ({rule_result['rule']}): {rule_result['decision']}",
+            extra={"event": "compliance.rules", "rule": rule_result["rule"], "decision": rule_result["decision"]}
+        )
+        result = {**rule_result, "stage": "rules"}
+    else:
+        result = await cached_check_policy_compliance(
+            policy_text=org.policy_text,
+            data_type=data_type,
+            purpose=purpose,
+            company_category=org.company_category
+        )
+    COMPLIANCE_DECISIONS.labels(result["stage"], result["decision"]).inc()
+    return result
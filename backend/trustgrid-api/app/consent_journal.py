@@ -0,0 +1,291 @@
+# app/consent_journal.py
+"""
+Optional write-behind for auto-approved consent logs (CONSENT_WRITE_BEHIND).
+
+request_data_access used to wait for consent_log.insert_one before returning
+the data. In write-behind mode the record gets its _id up front, is appended
+to a local journal and fsync'ed, and the request returns. A background task
+then writes journaled records to Mongo with insert_many, whenever
+CONSENT_FLUSH_BATCH_SIZE have accumulated or every CONSENT_FLUSH_INTERVAL_SECONDS.
+
+Journal layout: CONSENT_JOURNAL_DIR holds segment files of one
+extended-JSON record per line. Each flush seals the active segment and opens
+a new one; a sealed segment is deleted once its records are in Mongo. Every
+segment is flock'ed by the process writing it, so on startup a process
+replays only the segments no live process owns: ones left by a crash.
+Replays are idempotent because records carry their _id (duplicate key
+errors are ignored).
+
+Concurrent appends share one write + fsync (group commit). If the journal
+can't take a record (I/O error, or CONSENT_JOURNAL_MAX_BACKLOG records not
+yet flushed, e.g. while Mongo is down), write_consent_logs falls back to a
+synchronous insert.
+
+Until a record is flushed, find_consent_log (used by /request-status) sees
+it but the log listings don't. Pending (manual) requests are
+always inserted synchronously, because the returned request_id must exist.
+"""
+import asyncio
+import fcntl
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timezone
+from typing import Dict, IO, List, Optional, Tuple
+
+from bson import ObjectId, json_util
+
+from app.async_db import run_in_executor
+from app.database import consent_log_collection, settings
+from app.metrics import CONSENT_JOURNAL_FLUSHES, CONSENT_JOURNAL_PENDING
+
+logger = logging.getLogger(__name__)
+
+_JSON_OPTIONS = json_util.JSONOptions(json_mode=json_util.JSONMode.CANONICAL, tz_aware=True, tzinfo=timezone.utc)
+
+
+class JournalUnavailable(Exception):
+    pass
+
+
+class _Segment:
+    """One journal file, exclusively locked by this process until it is deleted."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file: IO[bytes] = open(path, "ab")
+        fcntl.flock(self.file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self.docs: List[dict] = []
+
+    def write(self, lines: List[bytes], fsync: bool) -> None:
+        self.file.write(b"".join(lines))
+        self.file.flush()
+        if fsync:
+            os.fsync(self.file.fileno())
+
+    def delete(self) -> None:
+        os.unlink(self.path)
+        self.file.close() # Releases the lock
+
+
+class ConsentJournal:
+    def __init__(self, directory: str, batch_size: int, flush_interval: float, max_backlog: int, fsync: bool):
+        self.directory = directory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backlog = max_backlog
+        self.fsync = fsync
+        # One thread, so writes, fsyncs and rotations happen in order
+        self._io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="consent-journal")
+        self._active: Optional[_Segment] = None
+        self._sealed: List[_Segment] = []
+        self._by_id: Dict[ObjectId, dict] = {} # Journaled, not yet in Mongo
+        self._waiting: List[Tuple[List[dict], asyncio.Future]] = []
+        self._writer: Optional[asyncio.Task] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._flush_now = asyncio.Event()
+        # Held across a write and across a rotation, so no write lands in a segment being flushed
+        self._segment_lock = asyncio.Lock()
+        self._sequence = 0
+
+    @property
+    def running(self) -> bool:
+        return self._flusher is not None
+
+    @property
+    def pending(self) -> int:
+        return len(self._by_id)
+
+    def _new_segment(self) -> _Segment:
+        self._sequence += 1
+        name = f"{time.time_ns()}-{os.getpid()}-{self._sequence}.jsonl"
+        return _Segment(os.path.join(self.directory, name))
+
+    async def start(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            await self.replay()
+        except Exception as e:
+            # e.g. Mongo not reachable yet: the segments stay on disk for the next start
+            logger.error(f"Consent journal replay failed: {e}")
+        self._active = await run_in_executor(self._io, self._new_segment)
+        self._flusher = asyncio.create_task(self._flush_forever())
+        logger.info(f"Consent log write-behind journal started in {self.directory}.")
+
+    async def stop(self) -> None:
+        """Stops taking records and writes everything journaled to Mongo (what fails stays journaled)."""
+        if self._flusher is None:
+            return
+        self._flusher.cancel()
+        await asyncio.gather(self._flusher, return_exceptions=True)
+        self._flusher = None
+        if self._writer is not None:
+            await asyncio.gather(self._writer, return_exceptions=True)
+            self._writer = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Consent journal not fully flushed on shutdown, it is replayed on the next start: {e}")
+        if self._active is not None and not self._active.docs:
+            await run_in_executor(self._io, self._active.delete)
+            self._active = None
+
+    # --- Appending ---
+    async def append(self, docs: List[dict]) -> None:
+        """Returns once `docs` (each with its _id set) are durable in the journal. Raises JournalUnavailable."""
+        if not self.running:
+            raise JournalUnavailable("Journal is not running.")
+        if self.pending + len(docs) > self.max_backlog:
+            raise JournalUnavailable(f"{self.pending} records are waiting to be flushed.")
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.append((docs, future))
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_waiting())
+        await future
+
+    async def _write_waiting(self) -> None:
+        # Everything that queued up during the previous fsync goes in the next one
+        while self._waiting:
+            batch, self._waiting = self._waiting, []
+            docs = [doc for batch_docs, _ in batch for doc in batch_docs]
+            lines = [json_util.dumps(doc, json_options=_JSON_OPTIONS).encode() + b"\n" for doc in docs]
+            async with self._segment_lock:
+                segment = self._active
+                try:
+                    if segment is None:
+                        raise OSError("no open journal segment")
+                    await run_in_executor(self._io, segment.write, lines, self.fsync)
+                except Exception as e:
+                    logger.error(f"Consent journal write failed: {e}")
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(JournalUnavailable(str(e)))
+                    if segment is not None:
+                        # It may end in a torn line now: seal it, the next flush opens a new one
+                        self._sealed.append(segment)
+                        self._active = None
+                    continue
+                segment.docs.extend(docs)
+                for doc in docs:
+                    self._by_id[doc["_id"]] = doc
+            CONSENT_JOURNAL_PENDING.set(self.pending)
+            for _, future in batch:
+                if not future.done():
+                    future.set_result(None)
+            if len(segment.docs) >= self.batch_size:
+                self._flush_now.set()
+
+    def get(self, doc_id: ObjectId) -> Optional[dict]:
+        """A journaled record that may not be in Mongo yet."""
+        return self._by_id.get(doc_id)
+
+    def stats(self) -> dict:
+        return {"running": self.running, "pending": self.pending, "sealed_segments": len(self._sealed)}
+
+    # --- Flushing ---
+    async def _flush_forever(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                # Sealed segments stay on disk and in memory; retried next round
+                logger.error(f"Consent journal flush failed: {e}")
+
+    async def flush(self) -> None:
+        """Seals the active segment and inserts every sealed segment, oldest first."""
+        async with self._segment_lock:
+            if self._active is None or self._active.docs:
+                if self._active is not None:
+                    self._sealed.append(self._active)
+                self._active = None
+                self._active = await run_in_executor(self._io, self._new_segment)
+        while self._sealed:
+            segment = self._sealed[0]
+            try:
+                await consent_log_collection.insert_many_ignoring_duplicates(segment.docs)
+            except Exception:
+                CONSENT_JOURNAL_FLUSHES.labels("error").inc()
+                raise
+            CONSENT_JOURNAL_FLUSHES.labels("ok").inc()
+            self._sealed.pop(0)
+            for doc in segment.docs:
+                self._by_id.pop(doc["_id"], None)
+            CONSENT_JOURNAL_PENDING.set(self.pending)
+            await run_in_executor(self._io, segment.delete)
+
+    # --- Recovery ---
+    async def replay(self) -> int:
+        """Inserts the records of segments left behind by a process that is gone. Returns how many."""
+        replayed = 0
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(".jsonl"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                segment = await run_in_executor(self._io, _Segment, path)
+            except BlockingIOError:
+                continue # Another live process owns it
+            except FileNotFoundError:
+                continue # Flushed and deleted since listdir
+            docs = await run_in_executor(self._io, read_segment, path)
+            for start in range(0, len(docs), self.batch_size):
+                await consent_log_collection.insert_many_ignoring_duplicates(docs[start:start + self.batch_size])
+            await run_in_executor(self._io, segment.delete)
+            replayed += len(docs)
+        if replayed:
+            logger.warning(f"Replayed {replayed} consent log records from the write-behind journal.")
+        return replayed
+
+
+def read_segment(path: str) -> List[dict]:
+    docs = []
+    with open(path, "rb") as f:
+        for number, line in enumerate(f, start=1):
+            try:
+                docs.append(json_util.loads(line, json_options=_JSON_OPTIONS))
+            except ValueError:
+                # A write torn by a crash; it was never acknowledged
+                logger.warning(f"Skipping unreadable line {number} of {path}.")
+    return docs
+
+
+async def write_consent_logs(docs: List[dict], write_behind: bool = False) -> List[ObjectId]:
+    """
+    Stores consent log documents (setting their _id) and returns the ids in
+    order. With `write_behind` (and CONSENT_WRITE_BEHIND on) they are
+    journaled and flushed to Mongo later, else inserted now.
+    """
+    if not docs:
+        return []
+    for doc in docs:
+        doc.setdefault("_id", ObjectId())
+    if write_behind and consent_journal.running:
+        try:
+            await consent_journal.append(docs)
+            return [doc["_id"] for doc in docs]
+        except JournalUnavailable as e:
+            logger.warning(f"Write-behind unavailable, inserting {len(docs)} consent logs directly: {e}")
+    if len(docs) == 1:
+        return [(await consent_log_collection.insert_one(docs[0])).inserted_id]
+    return (await consent_log_collection.insert_many(docs, ordered=True)).inserted_ids
+
+
+async def find_consent_log(doc_id: ObjectId) -> Optional[dict]:
+    """consent_log lookup by id that also sees records still in the journal."""
+    # Journal first: a record leaves it only after it is in Mongo
+    return consent_journal.get(doc_id) or await consent_log_collection.find_one({"_id": doc_id})
+
+
+consent_journal = ConsentJournal(
+    directory=settings.CONSENT_JOURNAL_DIR,
+    batch_size=settings.CONSENT_FLUSH_BATCH_SIZE,
+    flush_interval=settings.CONSENT_FLUSH_INTERVAL_SECONDS,
+    max_backlog=settings.CONSENT_JOURNAL_MAX_BACKLOG,
+    fsync=settings.CONSENT_JOURNAL_FSYNC,
+)
@@ -1,9 +1,12 @@
 # app/database.py
 import pymongo
+from concurrent.futures import ThreadPoolExecutor
 from pydantic_settings import BaseSettings
 from pydantic import BaseModel
-from typing import Optional
+from typing import Dict, Literal, Optional
 import os
+import threading
+from app.async_db import AsyncCollection, run_in_executor
 
 # Use Pydantic's BaseSettings to load from .env
 class Settings(BaseSettings):
@@ -11,6 +14,100 @@ class Settings(BaseSettings):
     DB_NAME: str
     GEMINI_API_KEY: str
 
+    # In-process cache of API key hash -> authenticated Organization (app/auth.py)
+    ORG_CACHE_TTL_SECONDS: float = 30.0
+    ORG_CACHE_MAX_ENTRIES: int = 10000
+
+    # Threads used to run blocking pymongo calls off the event loop (app/async_db.py).
+    # Each thread holds at most one pooled connection at a time.
+    MONGO_EXECUTOR_WORKERS: int = 32
+    MONGO_MAX_POOL_SIZE: int = 100
+
+    # Regulator decision cache (app/compliance_cache.py): Mongo tier with a TTL
+    # index, plus a smaller in-memory tier in front of it
+    COMPLIANCE_CACHE_TTL_SECONDS: int = 24 * 60 * 60
+    COMPLIANCE_CACHE_MEMORY_TTL_SECONDS: float = 300.0
+    COMPLIANCE_CACHE_MEMORY_ENTRIES: int = 5000
+
+    # Regulator prompts carry at most this much of a policy: its best-matching sections (app/policy_index.py).
+    # Longer policies are excerpted; 0 always sends the full text
+    POLICY_EXCERPT_MAX_CHARS: int = 6000
+    POLICY_INDEX_MEMORY_ENTRIES: int = 256
+    POLICY_INDEX_MEMORY_TTL_SECONDS: float = 3600.0
+
+    # Optional JSON file overriding the local compliance rules (app/compliance_rules.py)
+    COMPLIANCE_RULES_FILE: Optional[str] = None
+
+    # Create/update the indexes declared in app/indexes.py when the app starts
+    ENSURE_INDEXES_ON_STARTUP: bool = True
+
+    # Background CAC verification jobs (app/verification_jobs.py)
+    VERIFICATION_WORKERS: int = 4
+    VERIFICATION_JOB_LEASE_SECONDS: int = 600 # A running job is retried if its worker is gone this long
+    VERIFICATION_JOB_MAX_ATTEMPTS: int = 3
+    MAX_CERTIFICATE_BYTES: int = 10 * 1024 * 1024
+
+    # Concurrent Gemini calls per model (app/ai_compliance.py LLMGateway)
+    REGULATOR_MAX_CONCURRENCY: int = 8
+    VERIFIER_MAX_CONCURRENCY: int = 2
+    # Gemini resilience: per-attempt timeout, retries of transient errors, circuit breaker
+    LLM_CALL_TIMEOUT_SECONDS: float = 15.0
+    LLM_MAX_RETRIES: int = 2
+    LLM_RETRY_BASE_DELAY_SECONDS: float = 0.5
+    LLM_CIRCUIT_FAILURE_THRESHOLD: int = 5
+    LLM_CIRCUIT_RESET_SECONDS: float = 30.0
+    # Total time one API request (or one verification job) may spend waiting on Gemini
+    REQUEST_LLM_BUDGET_SECONDS: float = 20.0
+    VERIFICATION_LLM_BUDGET_SECONDS: float = 120.0
+
+    # Webhook delivery of consent decisions (app/webhooks.py)
+    WEBHOOK_BATCH_SIZE: int = 50 # Events per POST
+    WEBHOOK_CONCURRENCY: int = 8 # Webhooks delivered to at the same time
+    WEBHOOK_MAX_ATTEMPTS: int = 10
+    WEBHOOK_TIMEOUT_SECONDS: float = 10.0
+    WEBHOOK_RETRY_BASE_SECONDS: float = 10.0
+    WEBHOOK_RETRY_MAX_SECONDS: float = 3600.0
+    WEBHOOK_LEASE_SECONDS: int = 120
+    WEBHOOK_POLL_SECONDS: float = 5.0
+    WEBHOOK_ALLOW_HTTP: bool = False # Only https:// webhook URLs unless enabled (local development)
+    WEBHOOK_ALLOW_PRIVATE_ADDRESSES: bool = False # Only hosts resolving to public IPs unless enabled (local development)
+    WEBHOOK_DELIVERED_RETENTION_SECONDS: int = 7 * 24 * 60 * 60
+
+    # Write-behind for auto-approved consent logs (app/consent_journal.py)
+    CONSENT_WRITE_BEHIND: bool = False
+    CONSENT_JOURNAL_DIR: str = "journal" # Must be on local, persistent disk
+    CONSENT_JOURNAL_FSYNC: bool = True # Acknowledge only after fsync (off: survives a process crash, not a power loss)
+    CONSENT_FLUSH_BATCH_SIZE: int = 500 # Records per insert_many
+    CONSENT_FLUSH_INTERVAL_SECONDS: float = 1.0
+    CONSENT_JOURNAL_MAX_BACKLOG: int = 100000 # Beyond this, records are inserted synchronously
+
+    # Consent log retention (app/retention.py): decided entries older than this move to
+    # yearly, compressed archive collections; None keeps everything in consent_log
+    CONSENT_RETENTION_DAYS: Optional[int] = None
+    CONSENT_ARCHIVE_BATCH_SIZE: int = 1000
+    CONSENT_ARCHIVE_INTERVAL_SECONDS: float = 3600.0
+    CONSENT_ARCHIVE_COMPRESSOR: Optional[str] = "zstd" # WiredTiger block compressor of archive collections
+
+    # Per-org analytics rollups (app/analytics.py): buffered $inc deltas are written this often
+    ROLLUP_FLUSH_SECONDS: float = 1.0
+    ANALYTICS_MAX_DAYS: int = 366 # Longest range one /org/analytics call may ask for
+
+    # Live consent request streams to the citizen app (app/citizen_events.py)
+    CITIZEN_EVENTS_QUEUE_SIZE: int = 100 # Unsent events per connection before it is closed (the client reconnects)
+    CITIZEN_EVENTS_HEARTBEAT_SECONDS: float = 15.0 # Keeps proxies from closing idle streams
+    CITIZEN_EVENTS_MAX_STREAM_SECONDS: float = 300.0 # Streams are then closed and the client reconnects
+
+    # Logging (app/logging_config.py): records are queued and written by a background thread
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: Literal["json", "text"] = "json"
+    LOG_QUEUE_SIZE: int = 10000 # Records beyond this are dropped rather than blocking a request
+    # Keep-rate per `extra={"event": ...}` name; WARNING and above are never sampled
+    LOG_SAMPLING: Dict[str, float] = {
+        "compliance.decision": 0.1,
+        "compliance.rules": 0.1,
+        "request_data.accepted": 0.1,
+    }
+
     class Config:
         env_file = os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env')
         env_file_encoding = 'utf-8'
@@ -21,21 +118,117 @@ except Exception as e:
     print(f"🔥 Error loading settings. Make sure .env file exists in trustgrid-api/ root. Error: {e}")
     exit(1)
 
-# Setup MongoDB connection
-try:
-    # Make sure dnspython is installed: pip install dnspython
-    client = pymongo.MongoClient(settings.MONGO_URI, serverSelectionTimeoutMS=5000)
-    client.admin.command('ping')
-    print("✅ MongoDB connection successful.")
-    
-    db = client[settings.DB_NAME]
-    
-    users_collection = db["users"]
-    organizations_collection = db["organizations"]
-    consent_log_collection = db["consent_log"]
-    # koded added this collection, dope shii
-    api_keys_collection = db["api_keys"] 
+class MongoConnection:
+    """
+    This process's MongoClient and the thread pool that runs its blocking calls
+    (app/async_db.py), both created on first use rather than at import. Neither
+    survives a fork - the client's sockets and the pool's threads belong to the
+    parent - so a forked worker drops them and makes its own on first use.
 
-except Exception as e:
-    print(f"🔥 MongoDB connection failed. Check MONGO_URI or network. Error: {e}")
-    exit(1) # Fail fast if DB connection fails
\ No newline at end of file
+    Nothing here pings or exits: an unreachable server shows up as failing
+    requests and a 503 from /health, not as a process that won't start.
+    """
+
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        self._lock = threading.Lock()
+        self._client: Optional[pymongo.MongoClient] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _open(self) -> None:
+        with self._lock:
+            if self._client is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.settings.MONGO_EXECUTOR_WORKERS, thread_name_prefix="mongo"
+                )
+                # connect=False: no background monitoring until the first operation
+                self._client = pymongo.MongoClient(
+                    self.settings.MONGO_URI,
+                    serverSelectionTimeoutMS=5000,
+                    maxPoolSize=self.settings.MONGO_MAX_POOL_SIZE,
+                    connect=False,
+                )
+
+    @property
+    def client(self) -> pymongo.MongoClient:
+        if self._client is None:
+            self._open()
+        return self._client
+
+    @property
+    def db(self):
+        return self.client[self.settings.DB_NAME]
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._open()
+        return self._executor
+
+    def collection(self, name: str) -> "ProcessCollection":
+        return ProcessCollection(self, name)
+
+    def after_fork(self) -> None:
+        """In a forked child: forget the parent's client and threads (never close them from here)."""
+        self._lock = threading.Lock()
+        self._client = None
+        self._executor = None
+
+    def close(self) -> None:
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+class ProcessCollection(AsyncCollection):
+    """AsyncCollection resolved through MongoConnection on each use, so it follows reconnects and forks."""
+
+    def __init__(self, connection: MongoConnection, name: str):
+        self._connection = connection
+        self._name = name
+        self._bound_to: Optional[pymongo.MongoClient] = None
+        self._collection = None
+
+    @property
+    def sync(self):
+        client = self._connection.client
+        if self._bound_to is not client:
+            self._collection = client[self._connection.settings.DB_NAME][self._name]
+            self._bound_to = client
+        return self._collection
+
+    @property
+    def _executor(self) -> ThreadPoolExecutor:
+        return self._connection.executor
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+
+mongo = MongoConnection(settings)
+os.register_at_fork(after_in_child=mongo.after_fork)
+
+# All request-path Mongo calls go through these async wrappers so they run on
+# mongo.executor instead of blocking the event loop. Use `.sync` for the raw collection.
+users_collection = mongo.collection("users")
+organizations_collection = mongo.collection("organizations")
+consent_log_collection = mongo.collection("consent_log")
+# koded added this collection, dope shii
+api_keys_collection = mongo.collection("api_keys")
+compliance_decisions_collection = mongo.collection("compliance_decisions")
+verification_jobs_collection = mongo.collection("verification_jobs")
+verification_decisions_collection = mongo.collection("verification_decisions")
+webhooks_collection = mongo.collection("webhooks")
+webhook_deliveries_collection = mongo.collection("webhook_deliveries")
+consent_rollups_collection = mongo.collection("consent_rollups")
+policy_indexes_collection = mongo.collection("policy_indexes")
+
+# Indexes are declared in app/indexes.py and ensured at startup (see app/main.py)
+
+async def ping_database() -> None:
+    """Pings the server without blocking the event loop. Raises on failure."""
+    await run_in_executor(mongo.executor, mongo.client.admin.command, 'ping')
@@ -0,0 +1,149 @@
+# app/indexes.py
+import logging
+from typing import Dict, List
+
+import pymongo
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+logger = logging.getLogger(__name__)
+
+def declared_indexes(settings) -> Dict[str, List[IndexModel]]:
+    """
+    Every index the app relies on, by collection. Each one is named so it can be
+    compared against what the server has. Keep this next to the query it serves.
+    """
+    return {
+        "users": [
+            # Citizen login/profile/data lookups are all by username
+            IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+        ],
+        "organizations": [
+            IndexModel([("org_name", ASCENDING)], name="org_name_unique", unique=True),
+        ],
+        "api_keys": [
+            # get_current_org resolves keys by hash; older docs may have no hash
+            IndexModel(
+                [("key_hash", ASCENDING)], name="key_hash_unique", unique=True,
+                partialFilterExpression={"key_hash": {"$type": "string"}},
+            ),
+            # get_api_keys / revoke_api_key: keys of one org, newest first
+            IndexModel([("org_id", ASCENDING), ("created_date", DESCENDING), ("_id", DESCENDING)], name="org_created_id"),
+        ],
+        "consent_log": [
+            # Log endpoints page in (timestamp desc, _id desc) keyset order (app/pagination.py)
+            # get_pending_requests: a citizen's pending requests, newest first
+            IndexModel([("user_id", ASCENDING), ("status", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)], name="user_status_timestamp_id"),
+            # get_citizen_transparency_log
+            IndexModel([("user_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)], name="user_timestamp_id"),
+            # get_org_compliance_log
+            IndexModel([("org_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)], name="org_timestamp_id"),
+            # ConsentArchiver: entries past retention, oldest first (archive collections: app/retention.py)
+            IndexModel([("timestamp", ASCENDING)], name="timestamp"),
+        ],
+        "consent_rollups": [
+            # org_analytics: an org's rollups for a range of days (_id is "<org>:<day>:<data_type>")
+            IndexModel([("org_id", ASCENDING), ("day", ASCENDING), ("data_type", ASCENDING)], name="org_day_data_type"),
+        ],
+        "compliance_decisions": [
+            IndexModel(
+                [("created_at", ASCENDING)], name="created_at_ttl",
+                expireAfterSeconds=settings.COMPLIANCE_CACHE_TTL_SECONDS,
+            ),
+            IndexModel([("policy_hash", ASCENDING)], name="policy_hash"),
+        ],
+        "verification_jobs": [
+            # Recovery sweep: queued jobs and running jobs whose lease expired
+            IndexModel([("status", ASCENDING), ("lease_expires_at", ASCENDING)], name="status_lease"),
+            # Latest job of an org
+            IndexModel([("org_id", ASCENDING), ("created_at", DESCENDING)], name="org_created"),
+        ],
+        "webhooks": [
+            # enqueue_event / list_webhooks: an org's active webhooks
+            IndexModel([("org_id", ASCENDING), ("status", ASCENDING)], name="org_status"),
+        ],
+        "webhook_deliveries": [
+            # Dispatcher: due pending deliveries and expired leases, per webhook
+            IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)], name="status_next_attempt"),
+            IndexModel([("webhook_id", ASCENDING), ("status", ASCENDING), ("created_at", ASCENDING)], name="webhook_status_created"),
+            IndexModel([("claim", ASCENDING)], name="claim", sparse=True),
+            # Delivered events are kept for a while for debugging, then expire
+            IndexModel(
+                [("delivered_at", ASCENDING)], name="delivered_at_ttl",
+                expireAfterSeconds=settings.WEBHOOK_DELIVERED_RETENTION_SECONDS,
+            ),
+        ],
+        "verification_decisions": [
+            # Looked up by _id (hash of certificate bytes + org name + RC number); this one is for audits
+            IndexModel([("certificate_sha256", ASCENDING)], name="certificate_sha256"),
+        ],
+    }
+
+def ensure_indexes(db, settings) -> Dict[str, Dict[str, List[str]]]:
+    """
+    Idempotently creates every declared index. Safe to run on every startup:
+    existing identical indexes are left alone, a changed TTL is updated in place
+    with collMod, and failures (e.g. duplicates blocking a unique index) are logged
+    instead of stopping the app. Returns what was created/updated/failed per collection.
+    """
+    result = {}
+    for collection_name, models in declared_indexes(settings).items():
+        collection = db[collection_name]
+        existing = collection.index_information()
+        outcome = {"created": [], "updated": [], "failed": []}
+        for model in models:
+            spec = model.document
+            name = spec["name"]
+            current = existing.get(name)
+            if current is not None:
+                # Only a TTL change can be applied in place; anything else needs a manual drop
+                wanted_ttl = spec.get("expireAfterSeconds")
+                if wanted_ttl is not None and current.get("expireAfterSeconds") != wanted_ttl:
+                    try:
+                        db.command("collMod", collection_name, index={"name": name, "expireAfterSeconds": wanted_ttl})
+                        outcome["updated"].append(name)
+                    except pymongo.errors.PyMongoError as e:
+                        logger.error(f"🔥 Could not update TTL of {collection_name}.{name}: {e}")
+                        outcome["failed"].append(name)
+                continue
+            try:
+                collection.create_indexes([model])
+                outcome["created"].append(name)
+            except pymongo.errors.PyMongoError as e:
+                logger.error(f"🔥 Could not create index {collection_name}.{name}: {e}")
+                outcome["failed"].append(name)
+        if any(outcome.values()):
+            logger.info(f"Indexes on {collection_name}: {outcome}")
+        result[collection_name] = outcome
+    return result
+
+def index_report(db, settings) -> Dict[str, Dict[str, List[str]]]:
+    """
+    Compares the server's indexes with the declared ones.
+    - missing:    declared but not present (creation failed or was skipped)
+    - undeclared: present on the server but not declared here
+    - unused:     present but with zero accesses since the server last restarted ($indexStats)
+    """
+    report = {}
+    for collection_name, models in declared_indexes(settings).items():
+        collection = db[collection_name]
+        declared = {model.document["name"] for model in models}
+        existing = set(collection.index_information()) - {"_id_"}
+        try:
+            usage = {s["name"]: s["accesses"]["ops"] for s in collection.aggregate([{"$indexStats": {}}])}
+        except pymongo.errors.PyMongoError:
+            usage = {} # $indexStats needs clusterMonitor on some deployments
+        report[collection_name] = {
+            "missing": sorted(declared - existing),
+            "undeclared": sorted(existing - declared),
+            "unused": sorted(name for name in existing if usage.get(name) == 0),
+        }
+    return report
+
+def log_index_report(report: Dict[str, Dict[str, List[str]]]) -> None:
+    for collection_name, entry in report.items():
+        if entry["missing"]:
+            logger.warning(f"⚠️ {collection_name}: missing indexes {entry['missing']}")
+        if entry["undeclared"]:
+            logger.info(f"{collection_name}: indexes not declared in app/indexes.py {entry['undeclared']}")
+        if entry["unused"]:
+            logger.info(f"{collection_name}: indexes unused since server start {entry['unused']}")
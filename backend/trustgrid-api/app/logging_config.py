@@ -0,0 +1,146 @@
+# app/logging_config.py
+"""
+Non-blocking, structured logging.
+
+Loggers on the event loop only put records on a bounded in-memory queue
+(DroppingQueueHandler); a QueueListener thread formats them as JSON lines and
+writes them to stdout. A slow or blocked stdout therefore stalls only that
+thread - never a request. When the queue is full, records are dropped and
+counted (trustgrid_log_records_dropped_total) instead of waiting.
+
+Chatty message types can be sampled: pass `extra={"event": "<name>"}` at the
+call site and set a keep-rate for that name in LOG_SAMPLING. WARNING and above
+are never sampled.
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from app.metrics import LOG_RECORDS_DROPPED
+
+# Attributes every LogRecord has; anything else was passed with `extra=` and is logged as a field
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+# Loggers that configure their own handlers; route them through the queue as well
+_THIRD_PARTY_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+_TRACEBACK_FORMATTER = logging.Formatter()
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, message, `extra` fields and the exception if any."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a share of the records of each sampled event; warnings and errors always pass."""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(getattr(record, "event", None))
+        if rate is None or rate >= 1.0 or random.random() < rate:
+            return True
+        LOG_RECORDS_DROPPED.labels("sampled").inc()
+        return False
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never waits: a full queue drops the record."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve the message and traceback now (arguments may change later), but
+        # leave JSON formatting to the writer thread and keep the traceback a separate field
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = _TRACEBACK_FORMATTER.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.labels("queue_full").inc()
+
+
+def configure_logging(settings, background: bool = True) -> None:
+    """
+    Installs the queue -> background writer pipeline on the root logger.
+    Safe to call again (e.g. in a forked worker); the previous writer is stopped first.
+    With `background=False` records are written directly, with the same format and
+    sampling, and no thread is started (at import, before any worker forks).
+    """
+    global _listener
+    stop_logging()
+
+    if settings.LOG_FORMAT == "json":
+        formatter: logging.Formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+    writer = logging.StreamHandler(sys.stdout)
+    writer.setFormatter(formatter)
+
+    if not background:
+        writer.addFilter(SamplingFilter(settings.LOG_SAMPLING))
+        _install(settings, writer)
+        return
+
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+    handler = DroppingQueueHandler(log_queue)
+    handler.addFilter(SamplingFilter(settings.LOG_SAMPLING))
+    _install(settings, handler)
+
+    _listener = logging.handlers.QueueListener(log_queue, writer, respect_handler_level=True)
+    _listener.start()
+
+def _install(settings, handler: logging.Handler) -> None:
+    """Makes `handler` the root logger's only handler and routes third-party loggers to it."""
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(settings.LOG_LEVEL.upper())
+    for name in _THIRD_PARTY_LOGGERS:
+        third_party = logging.getLogger(name)
+        third_party.handlers = []
+        third_party.propagate = True
+
+def stop_logging() -> None:
+    """Flushes what is queued and stops the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+atexit.register(stop_logging)
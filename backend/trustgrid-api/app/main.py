@@ -5,47 +5,132 @@ import sys
 sys.path.append('..')
 from fastapi import (
     FastAPI, HTTPException, Depends, status,
-    UploadFile, File, Form
+    UploadFile, File, Form, Query, Response
 )
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 import pymongo
 from app.database import (
     users_collection,
     organizations_collection,
     consent_log_collection,
     api_keys_collection, # <-- Make sure this is imported
-    db as check_db_connection,
+    verification_jobs_collection,
+    webhooks_collection,
+    ping_database,
+    run_in_executor,
+    mongo,
+    settings,
+)
+from app.indexes import ensure_indexes, index_report, log_index_report
+from app.pagination import (
+    MAX_PAGE_SIZE, NDJSON_MEDIA_TYPE,
+    decode_cursor, fetch_merged_page, fetch_page, keyset_find, merged_find, ndjson_lines
 )
 from app.models import (
     User, UserCreate, UserProfileUpdate,
     Organization, OrgPolicyUpdate,
-    DataRequestBody, ConsentLog, ConsentResponseBody,
+    DataRequestBody, BatchDataRequestBody, ConsentLog, ConsentResponseBody,
     ApiKey, ApiKeyCreate, ApiKeyResponse, # <-- Updated/New models
+    VerificationJob, OrgAnalytics,
+    Webhook, WebhookCreate, WebhookResponse,
     PyObjectId, validate_object_id,
+    data_type_field, user_projection,
     OrgCreate, OrganizationRegistration, OrgRegistrationResponse # <-- New models for registration
 )
-from app.auth import get_current_org
-from app.ai_compliance import (
-    check_policy_compliance,
-    verify_organization_identity
+from app.auth import (
+    get_current_org, find_active_api_key,
+    org_cache, invalidate_api_key, invalidate_org
 )
+from app.ai_compliance import ensure_models, llm_deadline, llm_gateway, models_status
+from app.metrics import MetricsMiddleware, render_latest
+from app.logging_config import configure_logging
+from app.verification_jobs import verification_jobs
+from app.webhooks import UnsafeWebhookURL, enqueue_event, generate_webhook_secret, resolve_public_address, webhook_dispatcher
+from app.citizen_events import citizen_events, sse_stream
+from app.consent_journal import consent_journal, find_consent_log, write_consent_logs
+from app.retention import consent_archiver, consent_log_tiers, find_archived_consent_log
+from app.analytics import org_analytics, rollups
+from app.serialization import JSON_MEDIA_TYPE, encode_document, encode_documents
+from app.storage import save_upload_content_addressed, UploadTooLarge
+from app.compliance_cache import decision_cache, normalize_purpose
+from app.compliance_rules import evaluate_request_compliance
+from app.policy_index import policy_indexes
 # --- NEW SECURITY IMPORTS ---
 from app.security import (
     generate_api_key,
     get_api_key_hash,
-    verify_api_key # Import verify_api_key (though auth.py uses it mainly)
+    get_api_key_prefix,
 )
 from passlib.context import CryptContext
-from datetime import datetime, timezone
+from datetime import date, datetime, timedelta, timezone
 from bson import ObjectId
 import uvicorn
+import asyncio
+from contextlib import asynccontextmanager
 import logging
-from typing import Literal, List
-import google.generativeai as genai
+import math
+from typing import Annotated, Literal, List, Optional
 import os
-import shutil
 # Removed secrets import as it's now in security.py
 
+# --- Startup / Shutdown ---
+INDEX_RETRY_SECONDS = 30.0
+
+async def provision_indexes():
+    """Ensures the indexes declared in app/indexes.py exist and logs any gaps. Retries until Mongo is reachable."""
+    if not settings.ENSURE_INDEXES_ON_STARTUP:
+        return
+    while True:
+        try:
+            await run_in_executor(mongo.executor, ensure_indexes, mongo.db, settings)
+            break
+        except Exception as e:
+            # Missing indexes make queries slow, not wrong - keep serving
+            logger.error(f"🔥 Index provisioning failed, retrying in {INDEX_RETRY_SECONDS:.0f}s: {e}")
+            await asyncio.sleep(INDEX_RETRY_SECONDS)
+    try:
+        log_index_report(await run_in_executor(mongo.executor, index_report, mongo.db, settings))
+    except Exception as e:
+        logger.error(f"🔥 Index report failed: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Per-process startup and shutdown. It runs in each worker after any fork, so
+    the Mongo client, the Gemini models, threads and background tasks all
+    belong to the process using them. Nothing here waits for Mongo or Gemini
+    to be reachable; /health reports readiness instead.
+    """
+    configure_logging(settings) # A forked worker needs its own writer thread
+    warmups = [
+        asyncio.create_task(provision_indexes()),
+        asyncio.create_task(ensure_models()), # Imports google.generativeai in a thread
+    ]
+    if settings.CONSENT_WRITE_BEHIND:
+        # Replays consent logs a crashed process left in the write-behind journal first
+        await consent_journal.start()
+    if settings.CONSENT_RETENTION_DAYS:
+        # Moves decided consent log entries past CONSENT_RETENTION_DAYS to the yearly archives
+        await consent_archiver.start()
+    await rollups.start() # Writes buffered org analytics deltas to consent_rollups
+    # Both also pick up work left over from a previous run
+    await verification_jobs.start()
+    await webhook_dispatcher.start()
+    try:
+        yield
+    finally:
+        await webhook_dispatcher.stop()
+        await verification_jobs.stop()
+        await rollups.stop()
+        await consent_archiver.stop()
+        await consent_journal.stop()
+        for task in warmups:
+            task.cancel()
+        await asyncio.gather(*warmups, return_exceptions=True)
+        mongo.close()
+
+
 # --- App Setup ---
 app = FastAPI(
     title="TrustGrid API",
@@ -59,11 +144,14 @@ app = FastAPI(
     license_info={
         "name": "TrustGrid Developer License",
         "url": "https://trustgrid.ng/license"
-    }
+    },
+    lifespan=lifespan,
 )
 
 # --- Logging, CORS, pwd_context, UPLOAD_DIRECTORY Setup ---
-logging.basicConfig(level=logging.INFO)
+# Formats import-time logs; the queued writer thread (app/logging_config.py) is
+# started per process by the lifespan, so a pre-fork parent never owns one
+configure_logging(settings, background=False)
 logger = logging.getLogger(__name__)
 app.add_middleware(
     CORSMiddleware,
@@ -71,13 +159,63 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Compliance-Stage"], # Let browser clients read these
 )
+app.add_middleware(MetricsMiddleware) # Per-route latency/status metrics, served at /metrics
 # Use the same pwd_context as your security.py
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 UPLOAD_DIRECTORY = "uploads"
+CERTIFICATE_DIRECTORY = os.path.join(UPLOAD_DIRECTORY, "cac") # Content-addressed (app/storage.py)
 os.makedirs(UPLOAD_DIRECTORY, exist_ok=True)
 
 
+# --- Shared list/log response helper ---
+async def list_documents(
+    collection,
+    query: dict,
+    sort_field: str,
+    model,
+    limit: Optional[int],
+    cursor: Optional[str],
+    output: str,
+    archived: bool = False,
+):
+    """
+    Keyset-paginated list in (sort_field desc, _id desc) order.
+    - json:   one page; X-Next-Cursor header is set when more documents exist
+    - ndjson: documents are streamed as the cursor yields them (limit still applies)
+    With `archived`, `collection` must be consent_log and its archive tiers are read too.
+    """
+    try:
+        tiers = await consent_log_tiers() if archived else []
+        if output == "ndjson":
+            serialize = lambda doc: encode_document(model, doc)
+            if len(tiers) > 1:
+                if cursor:
+                    decode_cursor(cursor) # Reject a bad cursor before the response starts
+                found = merged_find(tiers, query, sort_field, cursor, limit)
+            else:
+                found = keyset_find(collection, query, sort_field, cursor)
+                if limit:
+                    found = found.limit(limit)
+            return StreamingResponse(ndjson_lines(found, serialize), media_type=NDJSON_MEDIA_TYPE)
+        if len(tiers) > 1:
+            docs, next_cursor = await fetch_merged_page(tiers, query, sort_field, limit, cursor)
+        else:
+            docs, next_cursor = await fetch_page(collection, query, sort_field, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Already-validated documents: encoded directly instead of through response_model
+    page = Response(content=encode_documents(model, docs), media_type=JSON_MEDIA_TYPE)
+    if next_cursor:
+        page.headers["X-Next-Cursor"] = next_cursor
+    return page
+
+# Query parameters shared by the list/log endpoints
+LimitParam = Annotated[Optional[int], Query(ge=1, le=MAX_PAGE_SIZE, description="Page size. Omit to return every entry.")]
+CursorParam = Annotated[Optional[str], Query(description="Value of the X-Next-Cursor header from the previous page.")]
+FormatParam = Annotated[Literal["json", "ndjson"], Query(alias="format", description="'ndjson' streams one JSON document per line.")]
+
 # --- Root Endpoint ---
 @app.get("/", tags=["Root"])
 async def root():
@@ -98,15 +236,33 @@ async def root():
 # --- Health Check ---
 @app.get("/health", status_code=status.HTTP_200_OK, tags=["Health"])
 async def health_check():
-    if check_db_connection is None:
-        raise HTTPException(status_code=503, detail="Database not connected")
+    """
+    Readiness probe: 200 once this process reaches Mongo, 503 until then (the
+    app starts without it). ai_models is "configuring" while Gemini loads in the
+    background; requests meanwhile wait for it or are decided by rules and cache.
+    """
     try:
-        # The ismaster command is cheap and does not require auth.
-        check_db_connection.client.admin.command('ping')
-        return {"status": "ok", "database": "connected"}
+        # The ping command is cheap and does not require auth.
+        await ping_database()
+        return {
+            "status": "ok",
+            "database": "connected",
+            "ai_models": models_status(),
+            "pid": os.getpid(),
+            "caches": {"org_auth": org_cache.stats(), "compliance_decisions": decision_cache.memory.stats(), "policy_indexes": policy_indexes.memory.stats()},
+            "llm": llm_gateway.stats(),
+            "citizen_streams": citizen_events.stats(),
+            "consent_journal": consent_journal.stats(),
+        }
     except Exception as e:
         raise HTTPException(status_code=503, detail=f"Database connection failed: {e}")
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint (see app/metrics.py)."""
+    body, content_type = render_latest()
+    return Response(content=body, media_type=content_type)
+
 # --- Component 0: NEW Org Registration ---
 @app.post("/api/v1/org/register", response_model=OrgRegistrationResponse, tags=["Organization (SME-Femi)"])
 async def register_organization(org_create: OrganizationRegistration):
@@ -117,12 +273,13 @@ async def register_organization(org_create: OrganizationRegistration):
     logger.info(f"Registration request received for org: {org_create.org_name}")
     
     # Check if organization name already exists to avoid duplicates
-    existing_org = organizations_collection.find_one({"org_name": org_create.org_name})
+    existing_org = await organizations_collection.find_one({"org_name": org_create.org_name})
     if existing_org:
         logger.warning(f"Organization name '{org_create.org_name}' already exists - deleting for re-registration")
         # For development: delete existing org and its API keys
-        organizations_collection.delete_one({"_id": existing_org["_id"]})
-        api_keys_collection.delete_many({"org_id": existing_org["_id"]})
+        await organizations_collection.delete_one({"_id": existing_org["_id"]})
+        await api_keys_collection.delete_many({"org_id": existing_org["_id"]})
+        await invalidate_org(existing_org["_id"])
         logger.info(f"Deleted existing organization '{org_create.org_name}' for re-registration")
 
     # --- Create the Organization Document ---
@@ -138,8 +295,12 @@ async def register_organization(org_create: OrganizationRegistration):
         "business_registration_number": None,
         "cac_certificate_url": None,
     }
-    org_result = organizations_collection.insert_one(new_org_data)
-    created_org_doc = organizations_collection.find_one({"_id": org_result.inserted_id})
+    try:
+        org_result = await organizations_collection.insert_one(new_org_data)
+    except pymongo.errors.DuplicateKeyError:
+        # org_name is unique; a concurrent registration with the same name won
+        raise HTTPException(status_code=409, detail=f"Organization '{org_create.org_name}' already exists.")
+    created_org_doc = await organizations_collection.find_one({"_id": org_result.inserted_id})
 
     # Error handling in case DB insertion fails unexpectedly
     if not created_org_doc:
@@ -153,11 +314,12 @@ async def register_organization(org_create: OrganizationRegistration):
     key_doc = {
         "name": "Default Key", # Give the first key a default name
         "key_hash": api_key_hash, # Store the HASH, not the plain key
+        "key_prefix": get_api_key_prefix(new_api_key), # Public prefix for display
         "status": "active", # Start as active
         "created_date": datetime.now(timezone.utc),
         "org_id": org_id, # Link the key to the newly created organization
     }
-    api_keys_collection.insert_one(key_doc)
+    await api_keys_collection.insert_one(key_doc)
 
     # --- Return Org details AND the plain-text key ---
     # The response includes the full organization details and the plain API key
@@ -172,19 +334,23 @@ async def register_organization(org_create: OrganizationRegistration):
 async def create_user(user: UserCreate):
     logger.info(f"Citizen registration request for username: {user.username}")
     
-    existing_user = users_collection.find_one({"username": user.username})
+    existing_user = await users_collection.find_one({"username": user.username})
     if existing_user: 
         logger.warning(f"Username '{user.username}' already exists - deleting for re-registration")
         # For development: delete existing user for re-registration
-        users_collection.delete_one({"_id": existing_user["_id"]})
+        await users_collection.delete_one({"_id": existing_user["_id"]})
         logger.info(f"Deleted existing user '{user.username}' for re-registration")
     
     # Hash user password on creation (use SHA256 to avoid bcrypt 72-byte limit)
     import hashlib
     password_hash = hashlib.sha256(user.password.encode()).hexdigest()
     user_doc = {"username": user.username, "password": password_hash}
-    result = users_collection.insert_one(user_doc)
-    created_user = users_collection.find_one({"_id": result.inserted_id})
+    try:
+        result = await users_collection.insert_one(user_doc)
+    except pymongo.errors.DuplicateKeyError:
+        # username is unique; a concurrent registration with the same name won
+        raise HTTPException(status_code=409, detail=f"Username '{user.username}' already exists.")
+    created_user = await users_collection.find_one({"_id": result.inserted_id})
     if not created_user: raise HTTPException(status_code=500, detail="Failed to retrieve created user.")
     return User(**created_user)
 
@@ -194,7 +360,7 @@ async def login_user(user: UserCreate):
     Login endpoint for citizens.
     Returns user details if credentials are valid.
     """
-    existing_user = users_collection.find_one({"username": user.username})
+    existing_user = await users_collection.find_one({"username": user.username})
     if not existing_user:
         raise HTTPException(status_code=401, detail="Invalid username or password")
 
@@ -208,9 +374,39 @@ async def login_user(user: UserCreate):
     return User(**existing_user)
 
 @app.get("/api/v1/citizen/{user_id}/requests", response_model=List[ConsentLog], tags=["Citizen (Ayo)"])
-async def get_pending_requests(user_id: str):
-    requests = consent_log_collection.find({"user_id": user_id, "status": "pending"}).sort("timestamp", -1)
-    return list(requests)
+async def get_pending_requests(
+    user_id: str,
+    limit: LimitParam = None,
+    cursor: CursorParam = None,
+    output: FormatParam = "json",
+):
+    return await list_documents(
+        consent_log_collection, {"user_id": user_id, "status": "pending"},
+        "timestamp", ConsentLog, limit, cursor, output
+    )
+
+@app.get("/api/v1/citizen/{user_id}/events", tags=["Citizen (Ayo)"])
+async def stream_citizen_events(user_id: str):
+    """
+    Server-Sent Events stream replacing polling of /requests:
+    - snapshot:         the pending requests (JSON array), sent on every (re)connect
+    - request.created:  a new consent log entry (pending or auto_approved)
+    - request.updated:  a pending request was approved or denied
+    """
+    async def load_snapshot() -> bytes:
+        pending = await keyset_find(
+            consent_log_collection, {"user_id": user_id, "status": "pending"}, "timestamp"
+        ).limit(MAX_PAGE_SIZE).to_list(None)
+        return encode_documents(ConsentLog, pending)
+
+    return StreamingResponse(
+        sse_stream(
+            citizen_events, user_id, load_snapshot,
+            settings.CITIZEN_EVENTS_HEARTBEAT_SECONDS, settings.CITIZEN_EVENTS_MAX_STREAM_SECONDS,
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}, # No proxy buffering
+    )
 
 @app.post("/api/v1/citizen/respond", status_code=status.HTTP_200_OK, tags=["Citizen (Ayo)"])
 async def respond_to_request(body: ConsentResponseBody):
@@ -218,32 +414,62 @@ async def respond_to_request(body: ConsentResponseBody):
     except Exception: raise HTTPException(status_code=400, detail="Invalid request_id format.")
     
     # Get the request details before updating
-    request_doc = consent_log_collection.find_one({"_id": request_oid, "status": "pending"})
+    request_doc = await consent_log_collection.find_one({"_id": request_oid, "status": "pending"})
     if not request_doc:
         raise HTTPException(status_code=404, detail="Request not found or already actioned.")
     
     # Update the request status
-    result = consent_log_collection.update_one(
+    decided_at = datetime.now(timezone.utc)
+    result = await consent_log_collection.update_one(
         {"_id": request_oid, "status": "pending"},
-        {"$set": {"status": body.decision, "approval_method": "manual", "timestamp": datetime.now(timezone.utc)}},
+        {"$set": {"status": body.decision, "approval_method": "manual", "timestamp": decided_at}},
     )
+    if result.modified_count == 0:
+        # A concurrent response got there first
+        raise HTTPException(status_code=404, detail="Request not found or already actioned.")
+    citizen_events.publish("request.updated", {
+        **request_doc, "status": body.decision, "approval_method": "manual", "timestamp": decided_at
+    })
+    rollups.record_decision(request_doc, body.decision)
+
+    # Tell the org instead of making it poll /request-status (no personal data in the event)
+    try:
+        await enqueue_event(request_doc["org_id"], "consent.decision", {
+            "request_id": body.request_id,
+            "user_id": request_doc["user_id"],
+            "data_type": request_doc["data_type"],
+            "purpose": request_doc["purpose"],
+            "status": body.decision,
+            "decided_at": decided_at.isoformat(),
+        })
+    except Exception as e:
+        # The decision is saved; the org can still poll for it
+        logger.error(f"Failed to queue webhook for request {body.request_id}: {e}")
     
     response_data = {"message": f"Consent status updated to '{body.decision}'."}
     
     # If approved, include the requested data
     if body.decision == "approved":
-        user = users_collection.find_one({"username": request_doc["user_id"]})
+        field = data_type_field(request_doc["data_type"])
+        user = await users_collection.find_one({"username": request_doc["user_id"]}, user_projection(field)) if field else None
         if user:
-            requested_data = user.get(request_doc["data_type"])
+            requested_data = user.get(field)
             response_data["data"] = requested_data
             logger.info(f"✅ Manual approval granted - returning {request_doc['data_type']} data for {request_doc['user_id']}")
     
     return response_data
 
 @app.get("/api/v1/citizen/{user_id}/log", response_model=List[ConsentLog], tags=["Citizen (Ayo)"])
-async def get_citizen_transparency_log(user_id: str):
-    logs = consent_log_collection.find({"user_id": user_id}).sort("timestamp", -1)
-    return list(logs)
+async def get_citizen_transparency_log(
+    user_id: str,
+    limit: LimitParam = None,
+    cursor: CursorParam = None,
+    output: FormatParam = "json",
+):
+    return await list_documents(
+        consent_log_collection, {"user_id": user_id},
+        "timestamp", ConsentLog, limit, cursor, output, archived=True
+    )
 
 @app.put("/api/v1/citizen/{user_id}/profile", response_model=User, tags=["Citizen (Ayo)"])
 async def update_citizen_profile(user_id: str, profile_data: UserProfileUpdate):
@@ -251,7 +477,7 @@ async def update_citizen_profile(user_id: str, profile_data: UserProfileUpdate):
     logger.info(f"Profile update request for user: {user_id}")
     
     # Find user by username (user_id)
-    existing_user = users_collection.find_one({"username": user_id})
+    existing_user = await users_collection.find_one({"username": user_id})
     if not existing_user:
         logger.error(f"User '{user_id}' not found in database")
         raise HTTPException(status_code=404, detail=f"User '{user_id}' not found")
@@ -261,7 +487,7 @@ async def update_citizen_profile(user_id: str, profile_data: UserProfileUpdate):
     logger.info(f"Updating user '{user_id}' with {len(update_data)} fields")
     
     if update_data:
-        updated_user = users_collection.find_one_and_update(
+        updated_user = await users_collection.find_one_and_update(
             {"username": user_id},
             {"$set": update_data},
             return_document=pymongo.ReturnDocument.AFTER
@@ -275,7 +501,7 @@ async def update_citizen_profile(user_id: str, profile_data: UserProfileUpdate):
 @app.get("/api/v1/citizen/{user_id}/profile", response_model=User, tags=["Citizen (Ayo)"])
 async def get_citizen_profile(user_id: str):
     """Get citizen profile data"""
-    user = users_collection.find_one({"username": user_id})
+    user = await users_collection.find_one({"username": user_id})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return User(**user)
@@ -283,7 +509,7 @@ async def get_citizen_profile(user_id: str):
 # --- Component 2 & 3: Org API Endpoints (SME-Femi's Backend) ---
 # (The authentication `Depends(get_current_org)` now works dynamically using app/auth.py)
 
-@app.post("/api/v1/org/submit-for-verification", tags=["Organization (SME-Femi)"])
+@app.post("/api/v1/org/submit-for-verification", status_code=status.HTTP_202_ACCEPTED, tags=["Organization (SME-Femi)"])
 async def submit_for_verification(
     org_name: str = Form(...), 
     company_description: str = Form(...),
@@ -297,51 +523,29 @@ async def submit_for_verification(
 ):
     """
     Submit organization details and CAC certificate for AI verification.
+    Returns 202 with a job ID; the verification itself runs in the background.
     """
     # Prevent re-verification
     if org.verification_status == "verified": raise HTTPException(status_code=400, detail="This organization is already verified.")
+    if org.verification_status == "pending": raise HTTPException(status_code=409, detail="A verification is already in progress for this organization.")
 
     # --- File Handling ---
-    file_path = os.path.join(UPLOAD_DIRECTORY, f"{org.id}_{cac_certificate.filename}")
-    uploaded_file = None # Initialize variable for Gemini file handle
+    # Streamed in chunks, size-capped and stored by SHA-256 (identical retries are stored once)
+    if cac_certificate.size and cac_certificate.size > settings.MAX_CERTIFICATE_BYTES:
+        await cac_certificate.close()
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Certificate file is too large.")
     try:
-        # Save the file locally first
-        with open(file_path, "wb+") as file_object: shutil.copyfileobj(cac_certificate.file, file_object)
+        stored = await save_upload_content_addressed(cac_certificate, CERTIFICATE_DIRECTORY, settings.MAX_CERTIFICATE_BYTES)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
     except Exception as e:
         logger.error(f"Failed to save certificate file locally: {e}")
         raise HTTPException(status_code=500, detail="Failed to save certificate file.")
     finally:
         await cac_certificate.close() # Ensure file is closed
 
-    try:
-        # --- Upload file to Google AI for analysis ---
-        logger.info(f"Uploading {file_path} to Gemini for verification...")
-        uploaded_file = genai.upload_file(path=file_path, display_name=f"{org_name} CAC Cert")
-        logger.info(f"File uploaded successfully to Gemini: {uploaded_file.name}")
-
-        # --- Call the AI Verifier ---
-        logger.info(f"Submitting {org_name} details for AI verification...")
-        ai_result = await verify_organization_identity(
-            org_name=org_name,
-            business_registration_number=business_registration_number,
-            cac_certificate_file=uploaded_file # Pass the Gemini file object
-        )
-    except Exception as e:
-         # Broad exception catch during AI processing
-         logger.error(f"Error during AI verification process: {e}")
-         ai_result = {"decision": "REJECTED", "reason": f"Internal error during AI verification: {e}"}
-    finally:
-        # --- Clean up the uploaded file from Google AI ---
-        if uploaded_file:
-            try:
-                genai.delete_file(uploaded_file.name)
-                logger.info(f"Cleaned up Gemini file: {uploaded_file.name}")
-            except Exception as e:
-                # Log error but don't fail the request if cleanup fails
-                logger.error(f"Failed to delete Gemini file {uploaded_file.name}: {e}")
-
-    # --- Update Org in DB based on AI decision ---
-    update_data = {
+    # --- Queue the AI verification and return right away ---
+    submission = {
         "org_name": org_name, # Allow org name update during verification
         "company_description": company_description,
         "company_category": company_category,
@@ -349,140 +553,298 @@ async def submit_for_verification(
         "business_registration_number": business_registration_number,
         "policy_text": policy_text, # Store the privacy policy
         "data_types_collected": data_types_collected, # Store data collection info
-        "cac_certificate_url": file_path, # Store the local path
-        "verification_status": ai_result["decision"].lower() # "verified" or "rejected"
     }
-    updated_org_doc = organizations_collection.find_one_and_update(
-        {"_id": validate_object_id(org.id)}, # Use teammate's validator
-        {"$set": update_data},
-        return_document=pymongo.ReturnDocument.AFTER
+    org_oid = validate_object_id(org.id)
+    # The check above used the (possibly cached) org; only one concurrent submission may win this
+    claimed = await organizations_collection.update_one(
+        {"_id": org_oid, "verification_status": {"$nin": ["pending", "verified"]}},
+        {"$set": {"verification_status": "pending"}}
     )
+    if claimed.modified_count == 0:
+        raise HTTPException(status_code=409, detail="A verification is already in progress for this organization.")
+    await invalidate_org(org.id) # Cached auth must see the pending status right away
+    job_id = await verification_jobs.submit(org_oid, submission, stored.path, stored.sha256)
+    logger.info(f"Queued verification job {job_id} for {org_name}.")
 
-    # Handle verification failure
-    if ai_result["decision"] == "REJECTED":
-        logger.warning(f"🔥 VERIFICATION REJECTED for {org_name}: {ai_result['reason']}")
-        # Don't delete the local file on rejection, they might need to see it/retry
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail=f"VERIFICATION REJECTED: {ai_result['reason']}"
-        )
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content={
+            "status": "pending",
+            "job_id": str(job_id),
+            "status_url": f"/api/v1/org/verification-jobs/{job_id}",
+            "message": "Verification submitted. Poll the status URL or GET /api/v1/org/me for the result."
+        }
+    )
+
+@app.get("/api/v1/org/verification-jobs/{job_id}", response_model=VerificationJob, tags=["Organization (SME-Femi)"])
+async def get_verification_job(job_id: str, org: Organization = Depends(get_current_org)):
+    """Progress of a verification job: queued -> running -> completed (with decision and reason)."""
+    try: job_oid = validate_object_id(job_id)
+    except Exception: raise HTTPException(status_code=400, detail="Invalid job_id format.")
+    job = await verification_jobs_collection.find_one({"_id": job_oid, "org_id": validate_object_id(org.id)})
+    if not job:
+        raise HTTPException(status_code=404, detail="Verification job not found.")
+    return job
 
-    # Handle success
-    logger.info(f"✅ VERIFICATION SUCCESSFUL for {org_name}.")
-    if not updated_org_doc: # Should not happen after successful update
-         raise HTTPException(status_code=500, detail="Failed to retrieve updated organization details.")
-    return {"status": "verified", "reason": ai_result["reason"], "organization": Organization(**updated_org_doc)}
 
+def retry_after_header(ai_result: dict) -> str:
+    """Whole seconds until the regulator is worth trying again (at least 1)."""
+    return str(max(1, math.ceil(ai_result.get("retry_after") or 0)))
+
+def build_consent_request(org: Organization, body: DataRequestBody, ai_result: dict, manual: bool) -> dict:
+    """Consent log document for a request that passed compliance."""
+    return {
+        "user_id": body.user_id, 
+        "org_id": validate_object_id(org.id),
+        "org_name": org.org_name,
+        "data_type": body.data_type, 
+        "purpose": body.purpose, 
+        "status": "pending" if manual else "auto_approved",
+        "approval_method": "manual" if manual else "auto",
+        "ai_reason": ai_result["reason"],
+        "decision_stage": ai_result["stage"],
+        "timestamp": datetime.now(timezone.utc)
+    }
 
 @app.post("/api/v1/request-data", status_code=status.HTTP_202_ACCEPTED, tags=["Organization (SME-Femi)"])
 async def request_data_access(body: DataRequestBody, org: Organization = Depends(get_current_org)):
     if org.verification_status != "verified": 
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="COMPLIANCE VIOLATION: Your organization is not verified.")
     
-    user = users_collection.find_one({"username": body.user_id})
+    # Only releasable data types can be requested (never passwords or internal flags)
+    field = data_type_field(body.data_type)
+    if not field:
+        raise HTTPException(status_code=400, detail=f"Unknown data_type '{body.data_type}'.")
+
+    # Fetch just the requested field and the consent setting, not the whole profile
+    user = await users_collection.find_one({"username": body.user_id}, user_projection(field, "manual_approval_required"))
     if not user: 
         raise HTTPException(status_code=404, detail=f"User '{body.user_id}' not found.")
     
     if not org.policy_text: 
         raise HTTPException(status_code=400, detail="COMPLIANCE VIOLATION: No privacy policy found.")
     
-    logger.info(f"Checking data minimization for verified org {org.org_name}...")
-    ai_result = await check_policy_compliance(
-        policy_text=org.policy_text, 
-        data_type=body.data_type, 
-        purpose=body.purpose, 
-        company_category=org.company_category
-    )
-    
-    if ai_result["decision"] == "VIOLATION":
-        logger.warning(f"🔥 VIOLATION DETECTED: {ai_result['reason']}")
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=f"COMPLIANCE VIOLATION: {ai_result['reason']}")
+    logger.debug(f"Checking data minimization for verified org {org.org_name}...")
+    # Local rules first, then the cached Gemini regulator
+    with llm_deadline(settings.REQUEST_LLM_BUDGET_SECONDS):
+        ai_result = await evaluate_request_compliance(org, body.data_type, body.purpose)
+
+    if ai_result["decision"] == "UNAVAILABLE":
+        # Nothing was judged - tell the client to come back instead of rejecting the request
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=ai_result["reason"],
+            headers={"Retry-After": retry_after_header(ai_result), "X-Compliance-Stage": ai_result["stage"]}
+        )
+    if ai_result["decision"] != "APPROVED":
+        # Fail closed: anything but a clear approval is treated as a violation
+        # A refused request is a normal outcome, not an application warning
+        logger.info(
+            f"🔥 VIOLATION DETECTED ({ai_result['stage']}): {ai_result['reason']}",
+            extra={"event": "request_data.refused", "org_id": org.id, "stage": ai_result["stage"]}
+        )
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"COMPLIANCE VIOLATION: {ai_result['reason']}",
+            headers={"X-Compliance-Stage": ai_result["stage"]}
+        )
     
     # Check if user requires manual approval (default is auto-approval)
     requires_manual_approval = user.get('manual_approval_required', False)
-    logger.info(f"🔍 DEBUG: User {body.user_id} manual_approval_required = {user.get('manual_approval_required')} (type: {type(user.get('manual_approval_required'))})")
-    logger.info(f"🔍 DEBUG: requires_manual_approval = {requires_manual_approval}")
+    logger.debug(f"User {body.user_id} manual_approval_required = {requires_manual_approval}")
     
     if requires_manual_approval:
         # Create pending request for manual approval
-        logger.info(f"✅ AI Approved but user requires manual approval. Creating pending request.")
-        consent_request = {
-            "user_id": body.user_id, 
-            "org_id": validate_object_id(org.id),
-            "org_name": org.org_name,
-            "data_type": body.data_type, 
-            "purpose": body.purpose, 
-            "status": "pending",
-            "approval_method": "manual",
-            "ai_reason": ai_result["reason"],
-            "timestamp": datetime.now(timezone.utc)
-        }
-        result = consent_log_collection.insert_one(consent_request)
+        logger.info(
+            "✅ AI Approved but user requires manual approval. Creating pending request.",
+            extra={"event": "request_data.accepted", "org_id": org.id, "status": "pending", "stage": ai_result["stage"]}
+        )
+        consent_request = build_consent_request(org, body, ai_result, manual=True)
+        result = await consent_log_collection.insert_one(consent_request)
+        citizen_events.publish("request.created", {**consent_request, "_id": result.inserted_id})
+        rollups.record_created({**consent_request, "_id": result.inserted_id})
         return {
             "message": "AI analysis passed. Awaiting user approval.", 
             "status": "pending", 
             "request_id": str(result.inserted_id), 
-            "ai_reason": ai_result["reason"]
+            "ai_reason": ai_result["reason"],
+            "decision_stage": ai_result["stage"]
         }
     else:
         # Auto-approve since AI passed and user allows it
-        logger.info(f"✅ AI Approved and auto-approving for user {body.user_id}")
-        consent_request = {
-            "user_id": body.user_id, 
-            "org_id": validate_object_id(org.id),
-            "org_name": org.org_name,
-            "data_type": body.data_type, 
-            "purpose": body.purpose, 
-            "status": "auto_approved",
-            "approval_method": "auto",
-            "ai_reason": ai_result["reason"],
-            "timestamp": datetime.now(timezone.utc)
-        }
-        result = consent_log_collection.insert_one(consent_request)
+        logger.info(
+            f"✅ AI Approved and auto-approving for user {body.user_id}",
+            extra={"event": "request_data.accepted", "org_id": org.id, "status": "auto_approved", "stage": ai_result["stage"]}
+        )
+        consent_request = build_consent_request(org, body, ai_result, manual=False)
+        # Journaled and flushed to Mongo in the background when CONSENT_WRITE_BEHIND is on
+        [request_id] = await write_consent_logs([consent_request], write_behind=True)
+        citizen_events.publish("request.created", {**consent_request, "_id": request_id})
+        rollups.record_created({**consent_request, "_id": request_id})
         
         # Return the actual data if available
-        requested_data = user.get(body.data_type)
+        requested_data = user.get(field)
         return {
             "message": "Request auto-approved.", 
             "status": "auto_approved", 
-            "request_id": str(result.inserted_id),
+            "request_id": str(request_id),
             "ai_reason": ai_result["reason"],
+            "decision_stage": ai_result["stage"],
             "data": requested_data
         }
 
+@app.post("/api/v1/request-data/batch", status_code=status.HTTP_202_ACCEPTED, tags=["Organization (SME-Femi)"])
+async def request_data_access_batch(body: BatchDataRequestBody, org: Organization = Depends(get_current_org)):
+    """
+    Many data requests in one call. Each distinct (data_type, purpose) is checked
+    for compliance once, users are fetched with one query and consent logs are
+    written with one insert_many. Results come back in the order of `items`;
+    a failed item carries `error` ({status_code, detail}) like the single endpoint would.
+    """
+    if org.verification_status != "verified": 
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="COMPLIANCE VIOLATION: Your organization is not verified.")
+    if not org.policy_text: 
+        raise HTTPException(status_code=400, detail="COMPLIANCE VIOLATION: No privacy policy found.")
+
+    items = body.items
+    results: List[Optional[dict]] = [None] * len(items)
+
+    def fail(index: int, status_code: int, detail: str, **extra):
+        item = items[index]
+        results[index] = {
+            "user_id": item.user_id, "data_type": item.data_type, "status": "error",
+            "error": {"status_code": status_code, "detail": detail}, **extra
+        }
+
+    # 1. Allowlisted data types only
+    fields = [data_type_field(item.data_type) for item in items]
+    for i, field in enumerate(fields):
+        if not field:
+            fail(i, 400, f"Unknown data_type '{items[i].data_type}'.")
+
+    # 2. One compliance evaluation per distinct (data_type, purpose)
+    pending = [i for i in range(len(items)) if results[i] is None]
+    groups = {}
+    for i in pending:
+        groups.setdefault((items[i].data_type, normalize_purpose(items[i].purpose)), i)
+    logger.info(f"Batch of {len(items)} requests from {org.org_name}: {len(groups)} distinct compliance checks")
+    # The checks run concurrently and share one time budget
+    with llm_deadline(settings.REQUEST_LLM_BUDGET_SECONDS):
+        decisions = await asyncio.gather(*(
+            evaluate_request_compliance(org, items[i].data_type, items[i].purpose) for i in groups.values()
+        ))
+    decision_by_key = dict(zip(groups.keys(), decisions))
+
+    # 3. All users in one $in query, projected to just the requested fields
+    usernames = list({items[i].user_id for i in pending})
+    projection = user_projection("username", "manual_approval_required", *{fields[i] for i in pending})
+    found_users = await users_collection.find({"username": {"$in": usernames}}, projection).to_list(None)
+    users_by_name = {user["username"]: user for user in found_users}
+
+    # 4. Build consent logs for everything that passed
+    to_insert = [] # (item index, consent document)
+    for i in pending:
+        item = items[i]
+        ai_result = decision_by_key[(item.data_type, normalize_purpose(item.purpose))]
+        if ai_result["decision"] == "UNAVAILABLE":
+            fail(i, 503, ai_result["reason"], decision_stage=ai_result["stage"], retry_after=int(retry_after_header(ai_result)))
+            continue
+        if ai_result["decision"] != "APPROVED":
+            fail(i, 403, f"COMPLIANCE VIOLATION: {ai_result['reason']}", decision_stage=ai_result["stage"])
+            continue
+        user = users_by_name.get(item.user_id)
+        if not user:
+            fail(i, 404, f"User '{item.user_id}' not found.")
+            continue
+        manual = bool(user.get("manual_approval_required", False))
+        to_insert.append((i, build_consent_request(org, item, ai_result, manual=manual)))
+
+    if to_insert:
+        # Pending requests are inserted now (their request_id must exist); auto-approved ones may be written behind
+        await write_consent_logs([doc for _, doc in to_insert if doc["status"] == "pending"])
+        await write_consent_logs([doc for _, doc in to_insert if doc["status"] != "pending"], write_behind=True)
+        for i, doc in to_insert:
+            inserted_id = doc["_id"]
+            citizen_events.publish("request.created", {**doc, "_id": inserted_id})
+            rollups.record_created(doc)
+            result = {
+                "user_id": doc["user_id"],
+                "data_type": doc["data_type"],
+                "status": doc["status"],
+                "request_id": str(inserted_id),
+                "ai_reason": doc["ai_reason"],
+                "decision_stage": doc["decision_stage"],
+            }
+            if doc["status"] == "auto_approved":
+                result["data"] = users_by_name[doc["user_id"]].get(fields[i])
+            results[i] = result
+
+    summary = {}
+    for result in results:
+        summary[result["status"]] = summary.get(result["status"], 0) + 1
+    return {"results": results, "summary": summary}
+
 @app.post("/api/v1/org/policy", response_model=Organization, tags=["Organization (SME-Femi)"])
 async def update_org_policy(policy_body: OrgPolicyUpdate, org: Organization = Depends(get_current_org)):
     # (No logic changes needed inside this function)
     if org.verification_status != "verified": raise HTTPException(status_code=403, detail="You must verify your organization before uploading a policy.")
-    updated_org = organizations_collection.find_one_and_update({"_id": validate_object_id(org.id)}, {"$set": {"policy_text": policy_body.policy_text}}, return_document=pymongo.ReturnDocument.AFTER,)
+    updated_org = await organizations_collection.find_one_and_update({"_id": validate_object_id(org.id)}, {"$set": {"policy_text": policy_body.policy_text}}, return_document=pymongo.ReturnDocument.AFTER,)
+    await invalidate_org(org.id) # Next request must be checked against the new policy
+    if org.policy_text != policy_body.policy_text:
+        await decision_cache.invalidate_policy(org.policy_text)
+        await policy_indexes.forget(org.policy_text)
     if not updated_org: raise HTTPException(status_code=404, detail="Organization not found")
+    await policy_indexes.index_policy(policy_body.policy_text) # Sections for regulator prompts
     return Organization(**updated_org)
 
 @app.get("/api/v1/org/log", response_model=List[ConsentLog], tags=["Organization (SME-Femi)"])
-async def get_org_compliance_log(org: Organization = Depends(get_current_org)):
-    logs = consent_log_collection.find({"org_id": validate_object_id(org.id)}).sort("timestamp", -1)
-    return list(logs)
+async def get_org_compliance_log(
+    limit: LimitParam = None,
+    cursor: CursorParam = None,
+    output: FormatParam = "json",
+    org: Organization = Depends(get_current_org)
+):
+    return await list_documents(
+        consent_log_collection, {"org_id": validate_object_id(org.id)},
+        "timestamp", ConsentLog, limit, cursor, output, archived=True
+    )
+
+@app.get("/api/v1/org/analytics", response_model=OrgAnalytics, tags=["Organization (SME-Femi)"])
+async def get_org_analytics(
+    since: Annotated[Optional[date], Query(description="First day (UTC). Defaults to 30 days before `until`.")] = None,
+    until: Annotated[Optional[date], Query(description="Last day (UTC), inclusive. Defaults to today.")] = None,
+    data_type: Annotated[Optional[str], Query(description="Only requests for this data type.")] = None,
+    org: Organization = Depends(get_current_org)
+):
+    """Requests, decisions and approval rates per day and data type, read from the pre-aggregated rollups."""
+    until = until or datetime.now(timezone.utc).date()
+    since = since or until - timedelta(days=29)
+    if since > until:
+        raise HTTPException(status_code=400, detail="'since' must not be after 'until'.")
+    if (until - since).days >= settings.ANALYTICS_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"At most {settings.ANALYTICS_MAX_DAYS} days per request.")
+    return await org_analytics(validate_object_id(org.id), since, until, data_type)
 
 @app.get("/api/v1/request-status/{request_id}", tags=["Organization (SME-Femi)"])
 async def check_request_status(request_id: str, org: Organization = Depends(get_current_org)):
     """Check status of a data request and get data if approved"""
-    logger.info(f"🔍 Checking status for request {request_id} by org {org.org_name} (ID: {org.id})")
+    logger.debug(f"🔍 Checking status for request {request_id} by org {org.org_name} (ID: {org.id})")
     
     try:
         request_oid = validate_object_id(request_id)
-        logger.info(f"✅ Valid ObjectId: {request_oid}")
     except Exception as e:
-        logger.error(f"❌ Invalid request_id format: {e}")
+        # A client error - the 400 response says it all
+        logger.debug(f"❌ Invalid request_id format: {e}")
         raise HTTPException(status_code=400, detail="Invalid request_id format.")
     
-    # First try to find by request ID only for debugging
-    request_doc = consent_log_collection.find_one({"_id": request_oid})
+    # First try to find by request ID only for debugging (includes write-behind records not yet flushed)
+    request_doc = await find_consent_log(request_oid) or await find_archived_consent_log(request_oid)
     
     if not request_doc:
-        logger.error(f"❌ Request {request_id} not found in database at all")
+        logger.debug(f"❌ Request {request_id} not found in database at all")
         raise HTTPException(status_code=404, detail="Request not found.")
     
-    logger.info(f"📋 Found request: org_id={request_doc.get('org_id')}, status={request_doc.get('status')}")
+    logger.debug(f"📋 Found request: org_id={request_doc.get('org_id')}, status={request_doc.get('status')}")
     
     # Check if request belongs to this organization
     expected_org_id = validate_object_id(org.id)
@@ -503,11 +865,12 @@ async def check_request_status(request_id: str, org: Organization = Depends(get_
     
     # If approved, include the data
     if request_doc["status"] in ["approved", "auto_approved"]:
-        user = users_collection.find_one({"username": request_doc["user_id"]})
+        field = data_type_field(request_doc["data_type"])
+        user = await users_collection.find_one({"username": request_doc["user_id"]}, user_projection(field)) if field else None
         if user:
-            response["data"] = user.get(request_doc["data_type"])
+            response["data"] = user.get(field)
             response["message"] = "Data access granted"
-            logger.info(f"✅ Returning data for approved request")
+            logger.debug("✅ Returning data for approved request")
     elif request_doc["status"] == "denied":
         response["message"] = "Access denied by user"
     else:
@@ -525,14 +888,8 @@ async def login_org(api_key: str = Form(...)):
     if not api_key:
         raise HTTPException(status_code=401, detail="API Key is missing")
 
-    # Check against active keys
-    all_api_keys = api_keys_collection.find({"status": "active"})
-    matched_key_doc = None
-    for key_doc in all_api_keys:
-        hashed_key = key_doc.get("key_hash")
-        if hashed_key and verify_api_key(api_key, hashed_key):
-            matched_key_doc = key_doc
-            break
+    # Same indexed lookup as the get_current_org dependency
+    matched_key_doc = await find_active_api_key(api_key)
 
     if not matched_key_doc:
         raise HTTPException(status_code=401, detail="Invalid or expired API Key")
@@ -542,7 +899,7 @@ async def login_org(api_key: str = Form(...)):
     if not org_id:
         raise HTTPException(status_code=500, detail="Internal server error: API key not linked to organization")
 
-    org_data = organizations_collection.find_one({"_id": org_id})
+    org_data = await organizations_collection.find_one({"_id": org_id})
     if not org_data:
         raise HTTPException(status_code=500, detail="Internal server error: Organization not found")
 
@@ -554,10 +911,17 @@ async def get_org_details(org: Organization = Depends(get_current_org)):
 
 # --- UPDATED API Key Management Endpoints ---
 @app.get("/api/v1/org/api-keys", response_model=List[ApiKey], tags=["Organization (SME-Femi)"])
-async def get_api_keys(org: Organization = Depends(get_current_org)):
+async def get_api_keys(
+    limit: LimitParam = None,
+    cursor: CursorParam = None,
+    output: FormatParam = "json",
+    org: Organization = Depends(get_current_org)
+):
     """Retrieve all API keys associated with the authenticated organization."""
-    keys = api_keys_collection.find({"org_id": validate_object_id(org.id)}).sort("created_date", -1)
-    return list(keys)
+    return await list_documents(
+        api_keys_collection, {"org_id": validate_object_id(org.id)},
+        "created_date", ApiKey, limit, cursor, output
+    )
 
 @app.post("/api/v1/org/api-keys", response_model=ApiKeyResponse, status_code=status.HTTP_201_CREATED, tags=["Organization (SME-Femi)"])
 async def create_api_key(body: ApiKeyCreate, org: Organization = Depends(get_current_org)):
@@ -571,12 +935,13 @@ async def create_api_key(body: ApiKeyCreate, org: Organization = Depends(get_cur
     key_doc = {
         "name": body.name,
         "key_hash": api_key_hash, # <-- Store the HASH
+        "key_prefix": get_api_key_prefix(new_api_key),
         "status": "active",
         "created_date": datetime.now(timezone.utc),
         "org_id": validate_object_id(org.id), # Link to current org
     }
-    result = api_keys_collection.insert_one(key_doc)
-    created_key_doc = api_keys_collection.find_one({"_id": result.inserted_id})
+    result = await api_keys_collection.insert_one(key_doc)
+    created_key_doc = await api_keys_collection.find_one({"_id": result.inserted_id})
     if not created_key_doc:
         raise HTTPException(status_code=500, detail="Failed to create and retrieve API key.")
 
@@ -592,21 +957,75 @@ async def revoke_api_key(key_id: str, org: Organization = Depends(get_current_or
     try: key_oid = validate_object_id(key_id) # Use teammate's validator
     except Exception: raise HTTPException(status_code=400, detail="Invalid key_id format.")
     
-    result = api_keys_collection.update_one(
+    # Return the previous state so we know the key's hash (for the auth cache) and
+    # whether it was already revoked
+    previous_key_doc = await api_keys_collection.find_one_and_update(
         {"_id": key_oid, "org_id": validate_object_id(org.id)}, # Ensure key belongs to this org
-        {"$set": {"status": "revoked"}}
+        {"$set": {"status": "revoked"}},
+        projection={"key_hash": 1, "status": 1},
+        return_document=pymongo.ReturnDocument.BEFORE
     )
     # Check if the key was found and belonged to the org before updating
-    if result.matched_count == 0:
+    if not previous_key_doc:
         raise HTTPException(status_code=404, detail="API key not found or does not belong to this organization.")
-    
+
+    # A revoked key must stop working immediately, not when its cache entry expires
+    if previous_key_doc.get("key_hash"):
+        invalidate_api_key(previous_key_doc["key_hash"])
+
     # Check if the document was actually modified (it might already be revoked)
-    if result.modified_count == 0:
+    if previous_key_doc.get("status") == "revoked":
         # Optionally return a different message or status if already revoked
         return {"message": "API key was already revoked."}
         
     return {"message": "API key revoked successfully."}
 
+# --- Webhooks ---
+@app.post("/api/v1/org/webhooks", response_model=WebhookResponse, status_code=status.HTTP_201_CREATED, tags=["Organization (SME-Femi)"])
+async def create_webhook(body: WebhookCreate, org: Organization = Depends(get_current_org)):
+    """
+    Registers a URL that receives signed `consent.decision` events when a citizen
+    approves or denies a request. The signing secret is returned ONCE.
+    """
+    url = str(body.url)
+    if body.url.scheme != "https" and not settings.WEBHOOK_ALLOW_HTTP:
+        raise HTTPException(status_code=400, detail="Webhook URLs must use https.")
+    if not settings.WEBHOOK_ALLOW_PRIVATE_ADDRESSES:
+        # Deliveries are sent from inside our network: no internal or loopback hosts
+        try:
+            await resolve_public_address(url)
+        except UnsafeWebhookURL as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    secret = generate_webhook_secret()
+    webhook_doc = {
+        "org_id": validate_object_id(org.id),
+        "url": url,
+        "events": list(dict.fromkeys(body.events)),
+        "status": "active",
+        "secret": secret, # Needed in plain text to sign deliveries
+        "secret_prefix": secret[:12],
+        "created_date": datetime.now(timezone.utc),
+    }
+    result = await webhooks_collection.insert_one(webhook_doc)
+    webhook_doc["_id"] = result.inserted_id
+    return WebhookResponse(webhook=Webhook(**webhook_doc), secret=secret)
+
+@app.get("/api/v1/org/webhooks", response_model=List[Webhook], tags=["Organization (SME-Femi)"])
+async def list_webhooks(org: Organization = Depends(get_current_org)):
+    return await webhooks_collection.find({"org_id": validate_object_id(org.id)}, {"secret": 0}).to_list(None)
+
+@app.post("/api/v1/org/webhooks/{webhook_id}/disable", status_code=status.HTTP_200_OK, tags=["Organization (SME-Femi)"])
+async def disable_webhook(webhook_id: str, org: Organization = Depends(get_current_org)):
+    """Stops deliveries to a webhook; events still queued for it are cancelled."""
+    try: webhook_oid = validate_object_id(webhook_id)
+    except Exception: raise HTTPException(status_code=400, detail="Invalid webhook_id format.")
+    result = await webhooks_collection.update_one(
+        {"_id": webhook_oid, "org_id": validate_object_id(org.id)}, {"$set": {"status": "disabled"}}
+    )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Webhook not found or does not belong to this organization.")
+    return {"message": "Webhook disabled."}
+
 # --- Main execution ---
 if __name__ == "__main__":
     print("Starting Trust-Grid API server at http://localhost:8000")
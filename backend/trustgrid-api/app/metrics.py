@@ -0,0 +1,244 @@
+# app/metrics.py
+"""
+Prometheus metrics, served at GET /metrics.
+
+Where a request's time goes, by layer:
+- HTTP:    per-route latency histogram, status counts and in-flight requests (MetricsMiddleware)
+- auth:    API key resolution time by source (cache / db / rejected)
+- Mongo:   per-collection, per-operation timings, errors and thread-pool wait (app/async_db.py)
+- Gemini:  per-model call latency by outcome, queue wait, in-flight calls, retries,
+           coalescing, circuit breaker state, prompt size and token counts (app/ai_compliance.py)
+- caches:  hits/misses/evictions of every TTLCache registered with register_cache()
+
+With several worker processes set PROMETHEUS_MULTIPROC_DIR (see prometheus_client
+docs) and /metrics aggregates every process. Caches are per process and can't be
+aggregated that way: their series are the answering worker's own, labelled with its pid.
+"""
+import os
+import time
+from typing import Dict, Iterable, Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, REGISTRY
+
+# Request latency spans cache hits (~1 ms) to slow LLM calls (tens of seconds)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 60.0)
+PROMPT_CHAR_BUCKETS = (250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000)
+
+# --- HTTP ---
+HTTP_REQUEST_DURATION = Histogram(
+    "trustgrid_http_request_duration_seconds", "Time to serve a request, by route template.",
+    ["method", "route"], buckets=LATENCY_BUCKETS,
+)
+HTTP_RESPONSES = Counter(
+    "trustgrid_http_responses_total", "Responses sent, by route template and status code.",
+    ["method", "route", "status"],
+)
+HTTP_IN_FLIGHT = Gauge(
+    "trustgrid_http_requests_in_flight", "Requests currently being served.", multiprocess_mode="livesum",
+)
+
+# --- Auth ---
+AUTH_DURATION = Histogram(
+    "trustgrid_auth_duration_seconds", "API key resolution time by where the org came from.",
+    ["source"], buckets=LATENCY_BUCKETS,
+)
+
+# --- Mongo ---
+MONGO_OPERATION_DURATION = Histogram(
+    "trustgrid_mongo_operation_duration_seconds",
+    "Awaited time of a Mongo operation (thread-pool wait included), by collection and operation.",
+    ["collection", "operation"], buckets=LATENCY_BUCKETS,
+)
+MONGO_OPERATION_ERRORS = Counter(
+    "trustgrid_mongo_operation_errors_total", "Mongo operations that raised, by exception type.",
+    ["collection", "operation", "error"],
+)
+MONGO_EXECUTOR_WAIT = Histogram(
+    "trustgrid_mongo_executor_wait_seconds",
+    "Time a Mongo operation waited for a free executor thread (MONGO_EXECUTOR_WORKERS).",
+    buckets=LATENCY_BUCKETS,
+)
+MONGO_IN_FLIGHT = Gauge(
+    "trustgrid_mongo_operations_in_flight", "Mongo operations submitted and not yet finished.",
+    multiprocess_mode="livesum",
+)
+
+# --- Gemini ---
+LLM_CALL_DURATION = Histogram(
+    "trustgrid_llm_call_duration_seconds", "One Gemini attempt, by model and outcome (ok / error / timeout).",
+    ["model", "outcome"], buckets=LATENCY_BUCKETS,
+)
+LLM_QUEUE_WAIT = Histogram(
+    "trustgrid_llm_queue_wait_seconds", "Time spent waiting for a concurrency slot, by model.",
+    ["model"], buckets=LATENCY_BUCKETS,
+)
+LLM_IN_FLIGHT = Gauge(
+    "trustgrid_llm_calls_in_flight", "Gemini calls currently running, by model.",
+    ["model"], multiprocess_mode="livesum",
+)
+LLM_RETRIES = Counter("trustgrid_llm_retries_total", "Retried Gemini attempts, by model.", ["model"])
+LLM_COALESCED = Counter(
+    "trustgrid_llm_coalesced_total", "Requests served by an identical in-flight call, by model.", ["model"],
+)
+LLM_UNAVAILABLE = Counter(
+    "trustgrid_llm_unavailable_total",
+    "Requests that got no answer (deadline, retries exhausted, circuit open), by model.", ["model"],
+)
+LLM_CIRCUIT_OPEN = Gauge(
+    "trustgrid_llm_circuit_open", "1 while the model's circuit breaker is open or half-open.",
+    ["model"], multiprocess_mode="max",
+)
+LLM_PROMPT_CHARS = Histogram(
+    "trustgrid_llm_prompt_characters", "Size of text sent to Gemini per call, by model.",
+    ["model"], buckets=PROMPT_CHAR_BUCKETS,
+)
+LLM_TOKENS = Counter(
+    "trustgrid_llm_tokens_total", "Tokens reported by Gemini usage metadata, by model and kind (prompt / completion).",
+    ["model", "kind"],
+)
+
+# --- Compliance pipeline ---
+COMPLIANCE_DECISIONS = Counter(
+    "trustgrid_compliance_decisions_total", "Compliance decisions by deciding stage (rules / cache / llm) and decision.",
+    ["stage", "decision"],
+)
+
+POLICY_EXCERPTS = Counter(
+    "trustgrid_policy_excerpts_total",
+    "Policy text choices for regulator prompts: excerpt, short (fits the budget), no_match / error (full text sent).",
+    ["outcome"],
+)
+REGULATOR_POLICY_CHARS = Counter(
+    "trustgrid_regulator_policy_characters_total",
+    "Policy characters behind regulator prompts: 'policy' is the full text, 'sent' what the prompt carried.",
+    ["part"],
+)
+
+# --- Consent log storage: write-behind (app/consent_journal.py), archival (app/retention.py) ---
+CONSENT_JOURNAL_PENDING = Gauge(
+    "trustgrid_consent_journal_pending", "Journaled consent logs not yet written to Mongo.", multiprocess_mode="livesum",
+)
+CONSENT_JOURNAL_FLUSHES = Counter(
+    "trustgrid_consent_journal_flushes_total", "Journal segments written to Mongo, by outcome (ok / error).", ["outcome"],
+)
+
+CONSENT_ARCHIVED = Counter(
+    "trustgrid_consent_log_archived_total", "Consent log entries moved to the yearly archives.",
+)
+
+# --- Webhooks (app/webhooks.py) ---
+WEBHOOK_DELIVERIES = Counter(
+    "trustgrid_webhook_events_total", "Webhook events by delivery outcome (delivered / retried / failed).", ["outcome"],
+)
+
+# --- Citizen event streams (app/citizen_events.py) ---
+CITIZEN_EVENT_STREAMS = Gauge(
+    "trustgrid_citizen_event_streams", "Open citizen /events streams.", multiprocess_mode="livesum",
+)
+
+# --- Logging (app/logging_config.py) ---
+LOG_RECORDS_DROPPED = Counter(
+    "trustgrid_log_records_dropped_total", "Log records not written, by reason (sampled / queue_full).", ["reason"],
+)
+
+
+def observe_llm_usage(model_name: str, contents, response) -> None:
+    """Records prompt size and, when Gemini reports them, token counts for one call."""
+    parts = contents if isinstance(contents, (list, tuple)) else [contents]
+    LLM_PROMPT_CHARS.labels(model_name).observe(sum(len(part) for part in parts if isinstance(part, str)))
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        LLM_TOKENS.labels(model_name, "prompt").inc(getattr(usage, "prompt_token_count", 0) or 0)
+        LLM_TOKENS.labels(model_name, "completion").inc(getattr(usage, "candidates_token_count", 0) or 0)
+
+
+# --- Caches ---
+class _CacheCollector:
+    """Reads TTLCache.stats() at scrape time, so caches pay nothing extra per lookup."""
+
+    def __init__(self):
+        self._caches: Dict[str, object] = {}
+
+    def register(self, cache) -> None:
+        self._caches[cache.name] = cache
+
+    def collect(self) -> Iterable:
+        return self.families()
+
+    def families(self, pid: Optional[int] = None) -> Iterable:
+        """The cache series; with `pid`, labelled with it (one worker's caches among several)."""
+        labels = ["cache"] + (["pid"] if pid is not None else [])
+        extra = [str(pid)] if pid is not None else []
+        counters = {
+            field: CounterMetricFamily(f"trustgrid_cache_{field}", f"TTLCache {field}, by cache.", labels=labels)
+            for field in ("hits", "misses", "evictions", "invalidations")
+        }
+        size = GaugeMetricFamily("trustgrid_cache_entries", "Entries held, by cache.", labels=labels)
+        for name, cache in self._caches.items():
+            stats = cache.stats()
+            for field, family in counters.items():
+                family.add_metric([name] + extra, stats[field])
+            size.add_metric([name] + extra, stats["size"])
+        yield from counters.values()
+        yield size
+
+class _WorkerCacheCollector:
+    """The scraped worker's own caches for the multiprocess registry (caches aren't shared)."""
+
+    def collect(self) -> Iterable:
+        return _cache_collector.families(pid=os.getpid())
+
+_cache_collector = _CacheCollector()
+REGISTRY.register(_cache_collector)
+
+def register_cache(cache) -> None:
+    """Exposes a TTLCache's counters on /metrics."""
+    _cache_collector.register(cache)
+
+
+def render_latest():
+    """(body, content type) for the /metrics endpoint."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(_WorkerCacheCollector())
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware (no BaseHTTPMiddleware overhead, streaming untouched).
+    Labels use the matched route template ("/api/v1/citizen/{user_id}/log"), never
+    the raw path, so label cardinality stays bounded; unmatched paths share one label.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500 # If the app raises before responding
+        async def capture_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, capture_status)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            route = scope.get("route")
+            route_label = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            HTTP_REQUEST_DURATION.labels(method, route_label).observe(time.perf_counter() - started)
+            HTTP_RESPONSES.labels(method, route_label, str(status_code)).inc()
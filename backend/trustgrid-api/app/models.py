@@ -1,8 +1,8 @@
 # app/models.py
-from pydantic import BaseModel, Field
-from typing import Optional, List, Literal
+from pydantic import BaseModel, Field, HttpUrl
+from typing import Dict, Optional, List, Literal
 from bson import ObjectId
-from datetime import datetime, timezone
+from datetime import date, datetime, timezone
 
 # --- Your Teammate's Working Code (UNCHANGED) ---
 class PyObjectId(str):
@@ -113,6 +113,28 @@ class User(BaseModel):
         arbitrary_types_allowed = True
         json_encoders = {ObjectId: str}
 
+# --- Releasable data types ---
+# data_type values an org may request, mapped to the User field holding the value.
+# Anything not listed (ids, passwords, consent settings) is never released, and
+# data-release paths fetch only the mapped field via a projection.
+NON_RELEASABLE_USER_FIELDS = {"id", "username", "manual_approval_required"}
+DATA_TYPE_FIELDS = {
+    name: name for name in User.model_fields if name not in NON_RELEASABLE_USER_FIELDS
+}
+
+def data_type_field(data_type: str) -> Optional[str]:
+    """Returns the User field for a requested data_type, or None if it is not releasable."""
+    return DATA_TYPE_FIELDS.get(data_type) or DATA_TYPE_FIELDS.get((data_type or "").strip().lower())
+
+def user_projection(*fields: Optional[str]) -> dict:
+    """
+    Mongo projection returning only `fields` (None entries are skipped).
+    `_id` is kept so a found user is never an empty (falsy) document.
+    """
+    projection = {"_id": 1}
+    projection.update({field: 1 for field in fields if field})
+    return projection
+
 class UserCreate(BaseModel):
     username: str
     password: str
@@ -168,6 +190,21 @@ class Organization(BaseModel):
         arbitrary_types_allowed = True
         json_encoders = {ObjectId: str}
 
+class VerificationJob(BaseModel):
+    id: PyObjectId = Field(alias="_id")
+    org_id: PyObjectId
+    status: Literal["queued", "running", "completed"]
+    decision: Optional[Literal["VERIFIED", "REJECTED"]] = None
+    reason: Optional[str] = None
+    attempts: int = 0
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        validate_by_name = True
+        arbitrary_types_allowed = True
+        json_encoders = {ObjectId: str}
+
 # --- NEW: Model for Org Registration (Response) ---
 class OrgRegistrationResponse(BaseModel):
     organization: Organization
@@ -181,6 +218,12 @@ class DataRequestBody(BaseModel):
     data_type: str
     purpose: str
 
+# Upper bound on items in one POST /api/v1/request-data/batch call
+MAX_BATCH_ITEMS = 500
+
+class BatchDataRequestBody(BaseModel):
+    items: List[DataRequestBody] = Field(..., min_length=1, max_length=MAX_BATCH_ITEMS)
+
 class ConsentLog(BaseModel):
     id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
     user_id: str
@@ -191,6 +234,7 @@ class ConsentLog(BaseModel):
     status: Literal["pending", "approved", "denied", "auto_approved"] 
     approval_method: Optional[Literal["manual", "auto"]] = None
     ai_reason: Optional[str] = None  # Store AI compliance reason
+    decision_stage: Optional[Literal["rules", "cache", "llm"]] = None  # Which compliance stage decided
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
     class Config:
@@ -198,6 +242,25 @@ class ConsentLog(BaseModel):
         arbitrary_types_allowed = True
         json_encoders = {ObjectId: str}
 
+class AnalyticsCounts(BaseModel):
+    requests: int # Consent requests created (pending or auto-approved)
+    pending: int
+    auto_approved: int
+    approved: int
+    denied: int
+    approval_rate: Optional[float] = None # (auto_approved + approved) / decided; None if nothing decided
+
+class AnalyticsDay(AnalyticsCounts):
+    day: date
+    data_type: str
+
+class OrgAnalytics(BaseModel):
+    since: date
+    until: date
+    totals: AnalyticsCounts
+    by_data_type: Dict[str, AnalyticsCounts]
+    days: List[AnalyticsDay]
+
 class ConsentResponseBody(BaseModel):
     request_id: str
     decision: Literal["approved", "denied"]
@@ -207,6 +270,7 @@ class ApiKey(BaseModel):
     id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
     name: str
     key_hash: str # <-- Store the hash, not the key
+    key_prefix: Optional[str] = None # Public, non-secret start of the key (for display)
     status: Literal["active", "revoked"] # Use Literal for status
     created_date: datetime
     org_id: PyObjectId
@@ -219,6 +283,29 @@ class ApiKey(BaseModel):
 class ApiKeyCreate(BaseModel):
     name: str
 
+# --- Webhooks (app/webhooks.py) ---
+class Webhook(BaseModel):
+    id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
+    url: str
+    events: List[Literal["consent.decision"]]
+    status: Literal["active", "disabled"]
+    secret_prefix: str # Public start of the signing secret (for display)
+    created_date: datetime
+    org_id: PyObjectId
+
+    class Config:
+        validate_by_name = True
+        arbitrary_types_allowed = True
+        json_encoders = {ObjectId: str}
+
+class WebhookCreate(BaseModel):
+    url: HttpUrl
+    events: List[Literal["consent.decision"]] = Field(default_factory=lambda: ["consent.decision"], min_length=1)
+
+class WebhookResponse(BaseModel):
+    webhook: Webhook
+    secret: str # Signing secret (shown once)
+
 # --- NEW: Model for API Key Response (shows key once) ---
 class ApiKeyResponse(BaseModel):
     key_details: ApiKey # Contains the ID, hash, etc.
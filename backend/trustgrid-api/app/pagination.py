@@ -0,0 +1,149 @@
+# app/pagination.py
+import base64
+import heapq
+import json
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Callable, List, NamedTuple, Optional, Tuple
+
+from bson import ObjectId
+
+from app.async_db import AsyncCollection, AsyncCursor
+
+# Largest page a client may ask for with ?limit=
+MAX_PAGE_SIZE = 1000
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+def encode_cursor(doc: dict, sort_field: str) -> str:
+    """Opaque cursor pointing just after `doc` in (sort_field desc, _id desc) order."""
+    value = doc.get(sort_field)
+    payload = {
+        "v": value.isoformat() if isinstance(value, datetime) else value,
+        "d": isinstance(value, datetime),
+        "id": str(doc["_id"]),
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[Any, ObjectId]:
+    """Inverse of encode_cursor. Raises ValueError on anything malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        value = datetime.fromisoformat(payload["v"]) if payload["d"] else payload["v"]
+        return value, ObjectId(payload["id"])
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {e}")
+
+def keyset_filter(query: dict, sort_field: str, cursor: Optional[str]) -> dict:
+    """Restricts `query` to documents strictly after the cursor (descending order)."""
+    if not cursor:
+        return query
+    value, oid = decode_cursor(cursor)
+    return {
+        **query,
+        "$or": [
+            {sort_field: {"$lt": value}},
+            {sort_field: value, "_id": {"$lt": oid}},
+        ],
+    }
+
+def keyset_find(collection: AsyncCollection, query: dict, sort_field: str, cursor: Optional[str] = None, **kwargs) -> AsyncCursor:
+    """find() in stable keyset order (sort_field desc, _id desc), starting after `cursor`."""
+    return collection.find(keyset_filter(query, sort_field, cursor), **kwargs).sort([(sort_field, -1), ("_id", -1)])
+
+async def fetch_page(
+    collection: AsyncCollection,
+    query: dict,
+    sort_field: str,
+    limit: Optional[int],
+    cursor: Optional[str] = None,
+    **kwargs
+) -> Tuple[List[dict], Optional[str]]:
+    """
+    Returns (documents, next_cursor). With no limit every matching document is
+    returned (the original behaviour) and next_cursor is None.
+    """
+    found = keyset_find(collection, query, sort_field, cursor, **kwargs)
+    if limit is None:
+        return await found.to_list(None), None
+    # Fetch one extra document to know whether another page exists
+    docs = await found.limit(limit + 1).to_list(None)
+    if len(docs) <= limit:
+        return docs, None
+    docs = docs[:limit]
+    return docs, encode_cursor(docs[-1], sort_field)
+
+async def ndjson_lines(docs: AsyncIterator[dict], serialize: Callable[[dict], bytes]) -> AsyncIterator[bytes]:
+    """Yields one JSON line per document as the cursor produces them."""
+    async for doc in docs:
+        yield serialize(doc) + b"\n"
+
+
+# --- Reading across storage tiers (app/retention.py) ---
+class Tier(NamedTuple):
+    """One collection holding part of a log; every sort_field value in it is below `before` (None: no bound)."""
+    collection: AsyncCollection
+    before: Optional[datetime] = None
+
+def _naive_utc(value):
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+class _Head:
+    """A tier's next document, ordered newest first for heapq."""
+    __slots__ = ("key", "doc", "docs")
+
+    def __init__(self, doc: dict, docs: AsyncIterator[dict], sort_field: str):
+        self.key = (_naive_utc(doc.get(sort_field)), doc["_id"])
+        self.doc = doc
+        self.docs = docs
+
+    def __lt__(self, other: "_Head") -> bool:
+        return self.key > other.key
+
+async def merged_find(
+    tiers: List[Tier], query: dict, sort_field: str, cursor: Optional[str] = None, limit: Optional[int] = None
+) -> AsyncIterator[dict]:
+    """
+    keyset_find over several tiers, merged into one (sort_field desc, _id desc)
+    stream. Tiers are queried lazily, newest bound first: an older tier is only
+    opened once the next document could come from it, so a page of recent
+    entries never touches the archives. At most `limit` documents are yielded.
+    """
+    # Unbounded tiers first, then by bound, newest first
+    pending = sorted(
+        tiers, key=lambda tier: (tier.before is None, _naive_utc(tier.before) or datetime.min), reverse=True
+    )
+    heap: List[_Head] = []
+
+    async def advance(docs: AsyncIterator[dict]) -> None:
+        async for doc in docs:
+            heapq.heappush(heap, _Head(doc, docs, sort_field))
+            return
+
+    yielded = 0
+    while limit is None or yielded < limit:
+        while pending and (not heap or pending[0].before is None or heap[0].key[0] < _naive_utc(pending[0].before)):
+            found = keyset_find(pending.pop(0).collection, query, sort_field, cursor)
+            if limit:
+                found = found.limit(limit).batch_size(limit)
+            await advance(found.__aiter__())
+        if not heap:
+            return
+        head = heapq.heappop(heap)
+        yield head.doc
+        yielded += 1
+        await advance(head.docs)
+
+async def fetch_merged_page(
+    tiers: List[Tier], query: dict, sort_field: str, limit: Optional[int], cursor: Optional[str] = None
+) -> Tuple[List[dict], Optional[str]]:
+    """fetch_page across tiers (see merged_find)."""
+    if len(tiers) == 1:
+        return await fetch_page(tiers[0].collection, query, sort_field, limit, cursor)
+    # One extra document tells whether another page exists
+    docs = [doc async for doc in merged_find(tiers, query, sort_field, cursor, limit=limit + 1 if limit else None)]
+    if limit is None or len(docs) <= limit:
+        return docs, None
+    docs = docs[:limit]
+    return docs, encode_cursor(docs[-1], sort_field)
@@ -0,0 +1,271 @@
+# app/policy_index.py
+"""
+Section index over privacy policies, so the regulator prompt carries the parts
+of a policy that matter to a request instead of all of it.
+
+A policy is split into sections (headings and paragraphs, long ones cut at
+sentence boundaries) when an org stores it (update_org_policy, or a completed
+verification job). The sections are kept in policy_indexes under the policy
+hash, with an LRU in memory in front, so any process can score them without
+re-splitting. A policy stored before indexing existed is indexed on first use.
+
+policy_excerpt() scores the sections with BM25 against the data_type (its
+words and synonyms, weighted up) and the purpose, then takes the best ones,
+in document order, until POLICY_EXCERPT_MAX_CHARS. The regulator sees the full
+text when the policy fits the budget anyway, or when no section names the data
+type (DATA_TYPE_NAMES; the broad synonyms only rank): "the policy doesn't
+declare this" is a verdict that needs all of it.
+"""
+import hashlib
+import logging
+import math
+import re
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from app.cache import TTLCache
+from app.database import policy_indexes_collection, settings
+from app.metrics import POLICY_EXCERPTS, REGULATOR_POLICY_CHARS, register_cache
+
+logger = logging.getLogger(__name__)
+
+# Sections longer than this are cut at sentence boundaries
+SECTION_MAX_CHARS = 1500
+# Paragraphs shorter than this are merged into the next one (headings, one-liners)
+SECTION_MIN_CHARS = 200
+
+# BM25 parameters (the usual defaults) and the extra weight of data_type terms over purpose terms
+K1 = 1.2
+B = 0.75
+DATA_TYPE_WEIGHT = 3.0
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or our that the their this to was we were will with you your us".split()
+)
+_HEADING = re.compile(r"^\s*(#{1,6}\s+\S.*|\d+(\.\d+)*[.)]?\s+[A-Z].{0,80}|[A-Z][A-Z0-9 &,/'-]{3,80}:?)\s*$")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+# Phrases that name a releasable data type (app/models.py User fields) on their
+# own, besides the field name itself. A policy using none of them doesn't declare it.
+DATA_TYPE_NAMES: Dict[str, Tuple[str, ...]] = {
+    "bvn": ("bank verification number",),
+    "nin": ("national identification number", "national identity number"),
+    "phone_number": ("phone", "telephone", "mobile number"),
+    "email": ("e-mail",),
+    "date_of_birth": ("birth date", "birthday", "dob"),
+    "bank_account_number": ("bank account", "account number"),
+    "passport_number": ("passport",),
+    "drivers_license": ("driver's license", "driver's licence", "drivers licence", "driving license", "driving licence"),
+    "voters_card": ("voter's card", "voter card", "pvc"),
+    "monthly_income": ("income", "salary", "earnings"),
+    "medical_conditions": ("medical", "health condition"),
+    "blood_type": ("blood group",),
+    "fingerprint_data": ("fingerprint",),
+    "facial_recognition_data": ("facial recognition", "face recognition", "facial data"),
+    "ip_address": ("internet protocol address",),
+    "device_id": ("device identifier",),
+    "location_data": ("location", "geolocation", "gps"),
+}
+
+# Related words for ranking sections only; too broad to show a data type is declared
+DATA_TYPE_SYNONYMS: Dict[str, str] = {
+    "bvn": "bank verification number",
+    "nin": "national identification identity number",
+    "phone_number": "telephone mobile contact",
+    "email": "e-mail address contact",
+    "date_of_birth": "birth age dob",
+    "address": "residential home postal location",
+    "bank_account_number": "bank account financial",
+    "passport_number": "passport travel identity document",
+    "drivers_license": "driver licence license identity document",
+    "voters_card": "voter card identity document",
+    "monthly_income": "income salary earnings financial",
+    "medical_conditions": "medical health condition",
+    "blood_type": "blood group health",
+    "fingerprint_data": "fingerprint biometric",
+    "facial_recognition_data": "facial face recognition biometric",
+    "ip_address": "ip internet protocol address device",
+    "device_id": "device identifier",
+    "browser_fingerprint": "browser fingerprint device",
+    "location_data": "location geolocation gps",
+}
+
+
+def policy_hash(policy_text: Optional[str]) -> str:
+    return hashlib.sha256((policy_text or "").encode("utf-8")).hexdigest()
+
+def _singular(word: str) -> str:
+    # Crude, but the same on both sides: "BVNs" matches "bvn", "emails" matches "email"
+    return word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+
+def tokenize(text: str) -> List[str]:
+    return [_singular(token) for token in _TOKEN.findall((text or "").lower()) if token not in _STOPWORDS]
+
+def phrase_text(text: str) -> str:
+    """Lowercase singular words, space-padded, for whole-phrase matching."""
+    return " " + " ".join(_singular(word) for word in _TOKEN.findall((text or "").lower())) + " "
+
+def split_sections(policy_text: str) -> List[str]:
+    """Headings and paragraphs, merged up to SECTION_MIN_CHARS and cut down to SECTION_MAX_CHARS."""
+    blocks: List[str] = []
+    current: List[str] = []
+    for line in policy_text.splitlines():
+        if not line.strip() or _HEADING.match(line):
+            # A blank line or a heading ends the block once it is long enough
+            if sum(len(part) for part in current) >= SECTION_MIN_CHARS:
+                blocks.append("\n".join(current))
+                current = []
+        if line.strip():
+            current.append(line.strip())
+    if current:
+        blocks.append("\n".join(current))
+
+    sections = []
+    for block in blocks:
+        while len(block) > SECTION_MAX_CHARS:
+            cut = max((m.start() for m in _SENTENCE_END.finditer(block, 0, SECTION_MAX_CHARS)), default=SECTION_MAX_CHARS)
+            sections.append(block[:cut].strip())
+            block = block[cut:].strip()
+        if block:
+            sections.append(block)
+    return sections
+
+
+class PolicyIndex:
+    """BM25 over one policy's sections."""
+
+    def __init__(self, sections: List[str]):
+        self.sections = sections
+        self.term_counts = [Counter(tokenize(section)) for section in sections]
+        self.lengths = [sum(counts.values()) for counts in self.term_counts]
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        document_frequency = Counter(term for counts in self.term_counts for term in counts)
+        n = len(sections)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in document_frequency.items()}
+        self.phrase_texts = [phrase_text(section) for section in sections]
+
+    def mentions(self, phrases: List[str]) -> bool:
+        """Whether any section contains one of `phrases` as whole words (plurals included)."""
+        needles = [phrase_text(phrase) for phrase in phrases if phrase.strip()]
+        return any(needle in text for text in self.phrase_texts for needle in needles)
+
+    def scores(self, weighted_terms: Dict[str, float]) -> List[float]:
+        scores = []
+        for counts, length in zip(self.term_counts, self.lengths):
+            norm = K1 * (1 - B + B * length / self.average_length) if self.average_length else K1
+            score = 0.0
+            for term, weight in weighted_terms.items():
+                tf = counts.get(term)
+                if tf:
+                    score += weight * self.idf[term] * tf * (K1 + 1) / (tf + norm)
+            scores.append(score)
+        return scores
+
+
+def data_type_terms(data_type: str) -> List[str]:
+    key = (data_type or "").strip().lower()
+    return tokenize(key.replace("_", " ") + " " + DATA_TYPE_SYNONYMS.get(key, ""))
+
+def data_type_names(data_type: str) -> List[str]:
+    key = (data_type or "").strip().lower()
+    return [key.replace("_", " "), *DATA_TYPE_NAMES.get(key, ())]
+
+def select_sections(index: PolicyIndex, data_type: str, purpose: str, max_chars: int) -> Optional[str]:
+    """The best sections for the request, in document order, or None if none names the data type."""
+    if not index.mentions(data_type_names(data_type)):
+        return None
+    type_terms = set(data_type_terms(data_type))
+    weighted_terms: Dict[str, float] = {term: 1.0 for term in tokenize(purpose)}
+    weighted_terms.update({term: DATA_TYPE_WEIGHT for term in type_terms})
+
+    ranked = sorted(enumerate(index.scores(weighted_terms)), key=lambda item: -item[1])
+    chosen, used = [], 0
+    for position, score in ranked:
+        if score <= 0:
+            break
+        size = len(index.sections[position])
+        if used + size > max_chars:
+            continue # A smaller, lower-ranked section may still fit
+        chosen.append(position)
+        used += size
+    return "\n[...]\n".join(index.sections[position] for position in sorted(chosen)) or None
+
+
+class PolicyIndexStore:
+    """Section lists by policy hash: in memory, then policy_indexes, else built from the text."""
+
+    def __init__(self, collection, memory: TTLCache):
+        self.collection = collection
+        self.memory = memory
+
+    async def index_policy(self, policy_text: Optional[str]) -> Optional[PolicyIndex]:
+        """Splits and stores a policy's sections. Called whenever a policy is stored."""
+        if not policy_text:
+            return None
+        digest = policy_hash(policy_text)
+        index = PolicyIndex(split_sections(policy_text))
+        self.memory.set(digest, index)
+        try:
+            await self.collection.update_one(
+                {"_id": digest},
+                {"$set": {"sections": index.sections, "indexed_at": datetime.now(timezone.utc)}},
+                upsert=True,
+            )
+        except Exception as e:
+            # Rebuilt from the text on first use - never fail the policy update over it
+            logger.error(f"Failed to store policy index: {e}")
+        return index
+
+    async def get(self, policy_text: str) -> PolicyIndex:
+        digest = policy_hash(policy_text)
+        index = self.memory.get(digest)
+        if index is not None:
+            return index
+        doc = await self.collection.find_one({"_id": digest})
+        if doc:
+            index = PolicyIndex(doc["sections"])
+            self.memory.set(digest, index)
+            return index
+        return await self.index_policy(policy_text)
+
+    async def forget(self, policy_text: Optional[str]) -> None:
+        """Drops a replaced policy's index (another org with the same text re-indexes it on use)."""
+        if not policy_text:
+            return
+        digest = policy_hash(policy_text)
+        self.memory.pop(digest)
+        await self.collection.delete_one({"_id": digest})
+
+
+policy_indexes = PolicyIndexStore(
+    collection=policy_indexes_collection,
+    memory=TTLCache(
+        maxsize=settings.POLICY_INDEX_MEMORY_ENTRIES,
+        ttl=settings.POLICY_INDEX_MEMORY_TTL_SECONDS,
+        name="policy_indexes",
+    ),
+)
+register_cache(policy_indexes.memory)
+
+async def policy_excerpt(policy_text: str, data_type: str, purpose: str) -> Tuple[str, bool]:
+    """
+    (text for the regulator prompt, whether it is an excerpt). Falls back to
+    the full policy rather than failing the request.
+    """
+    max_chars = settings.POLICY_EXCERPT_MAX_CHARS
+    excerpt = None
+    if max_chars and len(policy_text) > max_chars:
+        try:
+            excerpt = select_sections(await policy_indexes.get(policy_text), data_type, purpose, max_chars)
+            POLICY_EXCERPTS.labels("excerpt" if excerpt else "no_match").inc()
+        except Exception as e:
+            logger.error(f"Policy section retrieval failed, sending the full policy: {e}")
+            POLICY_EXCERPTS.labels("error").inc()
+    else:
+        POLICY_EXCERPTS.labels("short").inc()
+    text = excerpt or policy_text
+    REGULATOR_POLICY_CHARS.labels("policy").inc(len(policy_text))
+    REGULATOR_POLICY_CHARS.labels("sent").inc(len(text))
+    return text, excerpt is not None
@@ -0,0 +1,172 @@
+# app/retention.py
+"""
+Tiered storage for the consent log.
+
+consent_log is the hot tier. With CONSENT_RETENTION_DAYS set, ConsentArchiver
+moves decided entries (anything but "pending") older than that into one
+archive collection per year of their timestamp: consent_log_archive_<year>.
+Archive collections are created zstd-compressed (CONSENT_ARCHIVE_COMPRESSOR)
+with just the indexes the log endpoints need, so the hot collection and its
+indexes stay small enough to live in RAM.
+
+A move is insert (duplicates ignored) then delete, in batches, so a crash or a
+second process running the archiver at the same time never loses or doubles
+an entry. Decided entries are never modified again, so nothing changes
+between the copy and the delete.
+
+Reads: consent_log_tiers() lists the hot tier and every archive year; the log
+endpoints merge them with app.pagination.merged_find, which opens an archive
+only once a page reaches its year. Other processes notice a newly created
+archive year within _YEARS_TTL_SECONDS.
+"""
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import pymongo.errors
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+from app.async_db import AsyncCollection, run_in_executor
+from app.database import consent_log_collection, mongo, settings
+from app.metrics import CONSENT_ARCHIVED
+from app.pagination import Tier
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_PREFIX = "consent_log_archive_"
+
+# Archived entries are only read by the transparency and org logs (and by id)
+ARCHIVE_INDEXES = [
+    IndexModel([("user_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)], name="user_timestamp_id"),
+    IndexModel([("org_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)], name="org_timestamp_id"),
+]
+
+# Archive years are re-listed at most this often (other processes may add one)
+_YEARS_TTL_SECONDS = 60.0
+_years: List[int] = []
+_years_listed_at = float("-inf")
+
+
+def archive_collection(year: int) -> AsyncCollection:
+    return mongo.collection(f"{ARCHIVE_PREFIX}{year}")
+
+async def archive_years() -> List[int]:
+    """Years that have an archive collection, newest first."""
+    global _years, _years_listed_at
+    if time.monotonic() - _years_listed_at > _YEARS_TTL_SECONDS:
+        names = await run_in_executor(mongo.executor, mongo.db.list_collection_names)
+        _years = sorted(
+            (int(name[len(ARCHIVE_PREFIX):]) for name in names
+             if name.startswith(ARCHIVE_PREFIX) and name[len(ARCHIVE_PREFIX):].isdigit()),
+            reverse=True,
+        )
+        _years_listed_at = time.monotonic()
+    return _years
+
+async def consent_log_tiers() -> List[Tier]:
+    """The hot collection, then each archive year bounded by the start of the next year."""
+    return [Tier(consent_log_collection)] + [
+        Tier(archive_collection(year), datetime(year + 1, 1, 1, tzinfo=timezone.utc))
+        for year in await archive_years()
+    ]
+
+async def find_archived_consent_log(doc_id: ObjectId) -> Optional[dict]:
+    """
+    An archived entry by id. Its timestamp is never older than its _id (give or
+    take clock skew), so archives of earlier years are skipped.
+    """
+    earliest_year = (doc_id.generation_time - timedelta(days=1)).year
+    for year in await archive_years():
+        if year < earliest_year:
+            break
+        doc = await archive_collection(year).find_one({"_id": doc_id})
+        if doc:
+            return doc
+    return None
+
+
+def _create_archive(year: int) -> None:
+    """Creates an archive collection (compressed where the server allows it) and its indexes."""
+    name = f"{ARCHIVE_PREFIX}{year}"
+    db = mongo.db
+    if name not in db.list_collection_names(filter={"name": name}):
+        options = {}
+        if settings.CONSENT_ARCHIVE_COMPRESSOR:
+            options["storageEngine"] = {"wiredTiger": {"configString": f"block_compressor={settings.CONSENT_ARCHIVE_COMPRESSOR}"}}
+        try:
+            db.create_collection(name, **options)
+        except pymongo.errors.CollectionInvalid:
+            pass # Created by another process meanwhile
+        except pymongo.errors.OperationFailure as e:
+            # e.g. a storage engine without that compressor: archive uncompressed
+            logger.warning(f"Creating {name} with {options} failed, using defaults: {e}")
+            db.create_collection(name)
+    db[name].create_indexes(ARCHIVE_INDEXES)
+
+
+class ConsentArchiver:
+    """Background task moving old decided consent log entries to the yearly archives."""
+
+    def __init__(self, retention_days: int, batch_size: int, interval: float):
+        self.retention = timedelta(days=retention_days)
+        self.batch_size = batch_size
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self._ready_years: set = set()
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run_forever())
+        logger.info(f"Consent log archiver started (hot tier keeps {self.retention.days} days).")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run_forever(self) -> None:
+        while True:
+            try:
+                moved = await self.archive_once()
+                if moved:
+                    logger.info(f"Archived {moved} consent log entries.")
+            except Exception as e:
+                logger.error(f"🔥 Consent log archiving failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def archive_once(self) -> int:
+        """Moves every entry past retention, a batch at a time. Returns how many moved."""
+        global _years_listed_at
+        cutoff = datetime.now(timezone.utc) - self.retention
+        due = {"timestamp": {"$lt": cutoff}, "status": {"$ne": "pending"}}
+        moved = 0
+        while True:
+            batch = await consent_log_collection.find(due).sort("timestamp", ASCENDING).limit(self.batch_size).to_list(None)
+            if not batch:
+                return moved
+            by_year: Dict[int, List[dict]] = defaultdict(list)
+            for doc in batch:
+                by_year[doc["timestamp"].year].append(doc)
+            for year, docs in by_year.items():
+                if year not in self._ready_years:
+                    await run_in_executor(mongo.executor, _create_archive, year)
+                    self._ready_years.add(year)
+                    _years_listed_at = float("-inf") # Let readers see the new year now
+                await archive_collection(year).insert_many_ignoring_duplicates(docs)
+            # Only what was copied, and only if it is still decided
+            await consent_log_collection.delete_many({"_id": {"$in": [doc["_id"] for doc in batch]}, "status": {"$ne": "pending"}})
+            CONSENT_ARCHIVED.inc(len(batch))
+            moved += len(batch)
+            if len(batch) < self.batch_size:
+                return moved
+
+
+consent_archiver = ConsentArchiver(
+    retention_days=settings.CONSENT_RETENTION_DAYS or 0,
+    batch_size=settings.CONSENT_ARCHIVE_BATCH_SIZE,
+    interval=settings.CONSENT_ARCHIVE_INTERVAL_SECONDS,
+)
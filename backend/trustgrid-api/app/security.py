@@ -1,6 +1,7 @@
 # app/security.py
 import secrets
 import hashlib
+import hmac
 from passlib.context import CryptContext
 import logging
 
@@ -13,6 +14,9 @@ logger = logging.getLogger(__name__) # Use the logger
 # Use the same password context as in your main.py
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# Length of the public key prefix: "tg_live_" plus the first 8 random characters
+API_KEY_PREFIX_LENGTH = 16
+
 def generate_api_key(prefix: str = "tg_live", length: int = 16) -> str:
     """
     Generates a new, secure API key.
@@ -20,6 +24,14 @@ def generate_api_key(prefix: str = "tg_live", length: int = 16) -> str:
     random_part = secrets.token_urlsafe(length)
     return f"{prefix}_{random_part}"
 
+def get_api_key_prefix(api_key: str) -> str:
+    """
+    Returns the public, non-secret prefix of an API key (e.g. "tg_live_AbCd1234").
+    Stored next to the hash so keys can be identified in listings and logs
+    without ever storing or printing the full key.
+    """
+    return api_key[:API_KEY_PREFIX_LENGTH]
+
 def get_api_key_hash(api_key: str) -> str:
     """
     Hashes the API key using SHA256 to avoid bcrypt length limitations.
@@ -36,7 +48,7 @@ def verify_api_key(plain_key: str, hashed_key: str) -> bool:
     try:
         # Use SHA256 verification to match get_api_key_hash
         expected_hash = get_api_key_hash(plain_key)
-        return expected_hash == hashed_key
+        return hmac.compare_digest(expected_hash, hashed_key)
     except Exception:
         # Handle old hashes or invalid formats gracefully
         return False
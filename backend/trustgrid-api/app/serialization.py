@@ -0,0 +1,100 @@
+# app/serialization.py
+"""
+JSON for documents we read back from our own database.
+
+Returning documents through `response_model=List[ConsentLog]` validates each
+one (PyObjectId included) and then serializes it, which for large log pages
+costs more than the Mongo query. These documents were validated when they were
+written, so encode_documents() skips that: it copies each model field (by
+alias, missing ones get the field default) into a plain dict and hands the
+list to orjson, giving the same bytes as `model_dump_json(by_alias=True)`.
+Endpoints still declare their response_model, so the OpenAPI schema doesn't
+change; they return the bytes as a Response, which FastAPI sends as is.
+
+Only models made of plain fields (str, numbers, bool, dates, PyObjectId,
+Literal, Optional of these) take the fast path. Other models, and documents
+orjson can't encode, go through a cached TypeAdapter with full validation.
+"""
+import types
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Any, Iterable, List, Literal, Optional, Tuple, Type, Union, get_args, get_origin
+
+import orjson
+from bson import ObjectId
+from pydantic import BaseModel, TypeAdapter
+
+from app.models import PyObjectId
+
+JSON_MEDIA_TYPE = "application/json"
+
+# UTC datetimes as "...Z", like pydantic; naive ones (what pymongo returns) without an offset
+_ORJSON_OPTIONS = orjson.OPT_UTC_Z
+
+_PLAIN_TYPES = (str, int, float, bool, datetime, date, PyObjectId, type(None))
+
+# (document key, default factory) per output field
+FieldPlan = Tuple[Tuple[str, Any], ...]
+
+
+def _is_plain(annotation: Any) -> bool:
+    """Whether orjson encodes values of this type exactly as pydantic would."""
+    origin = get_origin(annotation)
+    if origin is Literal:
+        return all(isinstance(value, (str, int, bool)) or value is None for value in get_args(annotation))
+    if origin in (Union, types.UnionType):
+        return all(_is_plain(arg) for arg in get_args(annotation))
+    return annotation in _PLAIN_TYPES
+
+def _missing(field):
+    if field.default_factory is not None:
+        return field.default_factory
+    default = field.default
+    return lambda: default
+
+@lru_cache(maxsize=None)
+def _field_plan(model: Type[BaseModel]) -> Optional[FieldPlan]:
+    """The output fields of `model`, or None if it needs full serialization."""
+    plan = []
+    for name, field in model.model_fields.items():
+        if field.exclude:
+            continue
+        if not _is_plain(field.annotation):
+            return None
+        plan.append((field.alias or name, _missing(field)))
+    return tuple(plan)
+
+@lru_cache(maxsize=None)
+def _list_adapter(model: Type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(List[model])
+
+def _default(value: Any) -> str:
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+def _shape(plan: FieldPlan, doc: dict) -> dict:
+    return {key: doc[key] if key in doc else missing() for key, missing in plan}
+
+
+def encode_documents(model: Type[BaseModel], docs: Iterable[dict]) -> bytes:
+    """A JSON array of `docs` as `model` would serialize them (by alias)."""
+    docs = list(docs)
+    plan = _field_plan(model)
+    if plan is not None:
+        try:
+            return orjson.dumps([_shape(plan, doc) for doc in docs], default=_default, option=_ORJSON_OPTIONS)
+        except TypeError:
+            pass # A value outside the declared types: let pydantic deal with it
+    adapter = _list_adapter(model)
+    return adapter.dump_json(adapter.validate_python(docs), by_alias=True)
+
+def encode_document(model: Type[BaseModel], doc: dict) -> bytes:
+    """One document as `model` would serialize it (by alias)."""
+    plan = _field_plan(model)
+    if plan is not None:
+        try:
+            return orjson.dumps(_shape(plan, doc), default=_default, option=_ORJSON_OPTIONS)
+        except TypeError:
+            pass
+    return model.model_validate(doc).model_dump_json(by_alias=True).encode()
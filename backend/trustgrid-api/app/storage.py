@@ -0,0 +1,83 @@
+# app/storage.py
+import asyncio
+import hashlib
+import os
+import re
+import uuid
+from typing import NamedTuple
+
+from fastapi import UploadFile
+
+CHUNK_SIZE = 1024 * 1024 # 1 MiB per read/write
+
+# Spellings of the same file type, stored under one extension
+_EXTENSION_ALIASES = {".jpeg": ".jpg", ".jpe": ".jpg", ".tif": ".tiff", ".htm": ".html"}
+
+class UploadTooLarge(Exception):
+    pass
+
+class StoredFile(NamedTuple):
+    sha256: str
+    path: str
+    size: int
+    deduplicated: bool # True if identical bytes were already stored
+
+def _safe_extension(filename: str) -> str:
+    """Keeps a short alphanumeric extension (Gemini infers the MIME type from it)."""
+    ext = os.path.splitext(filename or "")[1].lower()
+    ext = _EXTENSION_ALIASES.get(ext, ext)
+    return ext if re.fullmatch(r"\.[a-z0-9]{1,8}", ext) else ""
+
+def _stored_as(directory: str, sha256: str):
+    """The file already holding these bytes, whatever extension it was stored with."""
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return None
+    name = next((name for name in names if os.path.splitext(name)[0] == sha256), None)
+    return os.path.join(directory, name) if name else None
+
+async def save_upload_content_addressed(upload: UploadFile, directory: str, max_bytes: int) -> StoredFile:
+    """
+    Streams an upload to disk in chunks, hashing it as it goes, and stores it
+    under its SHA-256: <directory>/<sha[:2]>/<sha><ext>. Identical bytes are
+    stored once, under the extension of the first upload (the hash alone is the
+    key). Raises UploadTooLarge (and keeps nothing) past `max_bytes`.
+    """
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = os.path.join(directory, f".incoming-{uuid.uuid4().hex}")
+    digest = hashlib.sha256()
+    size = 0
+    out = await asyncio.to_thread(open, tmp_path, "wb")
+    try:
+        try:
+            while True:
+                chunk = await upload.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"File exceeds the {max_bytes / (1024 * 1024):g} MB limit.")
+                digest.update(chunk)
+                await asyncio.to_thread(out.write, chunk)
+        finally:
+            await asyncio.to_thread(out.close)
+
+        sha256 = digest.hexdigest()
+        final_dir = os.path.join(directory, sha256[:2])
+
+        def place():
+            os.makedirs(final_dir, exist_ok=True)
+            existing = _stored_as(final_dir, sha256)
+            if existing:
+                return existing, True
+            final_path = os.path.join(final_dir, sha256 + _safe_extension(upload.filename))
+            os.replace(tmp_path, final_path) # Atomic on the same filesystem
+            return final_path, False
+
+        final_path, deduplicated = await asyncio.to_thread(place)
+    finally:
+        # Gone once placed; otherwise (duplicate, too large, any error) it must not pile up
+        if os.path.exists(tmp_path):
+            await asyncio.to_thread(os.remove, tmp_path)
+    return StoredFile(sha256=sha256, path=final_path, size=size, deduplicated=deduplicated)
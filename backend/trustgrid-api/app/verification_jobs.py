@@ -0,0 +1,287 @@
+# app/verification_jobs.py
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+import pymongo
+from bson import ObjectId
+
+from app.ai_compliance import ensure_models, genai_module, is_transient_error, llm_deadline, verify_organization_identity
+from app.auth import invalidate_org
+from app.compliance_cache import decision_cache
+from app.database import (
+    organizations_collection,
+    settings,
+    verification_decisions_collection,
+    verification_jobs_collection,
+)
+from app.policy_index import policy_indexes
+
+logger = logging.getLogger(__name__)
+
+class VerificationJobQueue:
+    """
+    Runs CAC verification (Gemini upload -> verify -> cleanup -> org update) as
+    background jobs on a bounded pool of asyncio workers.
+
+    Jobs live in the `verification_jobs` collection, so they survive restarts:
+    a job is claimed with a lease (status "running", lease_expires_at) and any
+    job still "queued", or "running" with an expired lease, is picked up again
+    by the recovery sweep - in this process or another worker process.
+    """
+
+    def __init__(self, workers: int, lease_seconds: int, max_attempts: int, sweep_interval: float = 60.0):
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.sweep_interval = sweep_interval
+        self._queue: "asyncio.Queue[ObjectId]" = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    async def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._worker(n)) for n in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._sweep_forever()))
+        logger.info(f"Verification job queue started with {self.workers} workers.")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, org_id: ObjectId, submission: dict, file_path: str, certificate_sha256: str) -> ObjectId:
+        """Persists a new job and queues it. Returns the job id."""
+        now = datetime.now(timezone.utc)
+        job = {
+            "org_id": org_id,
+            "status": "queued",
+            "submission": submission,
+            "file_path": file_path,
+            "certificate_sha256": certificate_sha256,
+            "attempts": 0,
+            "decision": None,
+            "reason": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        result = await verification_jobs_collection.insert_one(job)
+        await self._queue.put(result.inserted_id)
+        return result.inserted_id
+
+    async def recover(self, all_queued: bool = False) -> int:
+        """
+        Queues every job that is waiting or whose worker died (expired lease).
+        Recently queued jobs are skipped unless `all_queued` (startup), since the
+        process that accepted them has them in its own queue.
+        """
+        now = datetime.now(timezone.utc)
+        queued_before = now if all_queued else now - timedelta(seconds=self.sweep_interval)
+        stale = await verification_jobs_collection.find(
+            {"$or": [
+                {"status": "queued", "updated_at": {"$lt": queued_before}},
+                {"status": "running", "lease_expires_at": {"$lt": now}},
+            ]},
+            {"_id": 1}
+        ).sort("created_at", 1).to_list(None)
+        for job in stale:
+            await self._queue.put(job["_id"])
+        if stale:
+            logger.info(f"Re-queued {len(stale)} unfinished verification jobs.")
+        return len(stale)
+
+    async def _sweep_forever(self) -> None:
+        first = True
+        while True:
+            try:
+                await self.recover(all_queued=first)
+                first = False
+            except Exception as e:
+                logger.error(f"Verification job recovery sweep failed: {e}")
+            await asyncio.sleep(self.sweep_interval)
+
+    async def _claim(self, job_id: ObjectId) -> Optional[dict]:
+        """Atomically marks a job as running under a fresh lease, or returns None if someone else has it."""
+        now = datetime.now(timezone.utc)
+        return await verification_jobs_collection.find_one_and_update(
+            {"_id": job_id, "$or": [
+                {"status": "queued"},
+                {"status": "running", "lease_expires_at": {"$lt": now}},
+            ]},
+            {"$set": {
+                "status": "running",
+                "started_at": now,
+                "updated_at": now,
+                "lease_expires_at": now + timedelta(seconds=self.lease_seconds),
+            }, "$inc": {"attempts": 1}},
+            return_document=pymongo.ReturnDocument.AFTER
+        )
+
+    async def _worker(self, n: int) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                job = await self._claim(job_id)
+                if job:
+                    await self._run(job)
+            except Exception as e:
+                # The lease expires and the sweep retries the job
+                logger.error(f"Verification worker {n} failed on job {job_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _requeue(self, job: dict, reason: str) -> None:
+        """
+        Gemini was unreachable - that says nothing about the company, so the job
+        goes back to "queued" and the recovery sweep retries it one interval later.
+        """
+        logger.warning(f"Verifier unavailable for job {job['_id']} (attempt {job['attempts']}): {reason}")
+        await verification_jobs_collection.update_one(
+            {"_id": job["_id"]},
+            {"$set": {"status": "queued", "reason": reason, "updated_at": datetime.now(timezone.utc)},
+             "$unset": {"lease_expires_at": ""}}
+        )
+
+    async def _run(self, job: dict) -> None:
+        submission = job["submission"]
+        org_name = submission["org_name"]
+
+        rc_number = submission["business_registration_number"]
+        reused = await find_previous_decision(job.get("certificate_sha256"), org_name, rc_number)
+        if reused:
+            # Same certificate bytes, name and RC number were already judged - skip Gemini
+            logger.info(f"Reusing earlier verifier decision for {org_name}: {reused['decision']}")
+            ai_result = reused
+        elif job["attempts"] > self.max_attempts:
+            ai_result = {"decision": "REJECTED", "reason": f"Verification failed after {self.max_attempts} attempts. Please resubmit.", "error": True}
+        else:
+            with llm_deadline(settings.VERIFICATION_LLM_BUDGET_SECONDS):
+                ai_result = await verify_certificate(
+                    job["file_path"], org_name, rc_number,
+                    coalesce_key=_decision_key(job["certificate_sha256"], org_name, rc_number) if job.get("certificate_sha256") else None
+                )
+            if ai_result["decision"] == "UNAVAILABLE":
+                await self._requeue(job, ai_result["reason"])
+                return
+            await remember_decision(job.get("certificate_sha256"), org_name, rc_number, ai_result)
+
+        await apply_verification_result(job["org_id"], submission, job["file_path"], ai_result)
+
+        now = datetime.now(timezone.utc)
+        await verification_jobs_collection.update_one(
+            {"_id": job["_id"]},
+            {"$set": {
+                "status": "completed",
+                "decision": ai_result["decision"],
+                "reason": ai_result["reason"],
+                "reused_decision": bool(reused),
+                "finished_at": now,
+                "updated_at": now,
+            }, "$unset": {"lease_expires_at": ""}}
+        )
+        if ai_result["decision"] == "VERIFIED":
+            logger.info(f"✅ VERIFICATION SUCCESSFUL for {org_name}.")
+        else:
+            logger.warning(f"🔥 VERIFICATION REJECTED for {org_name}: {ai_result['reason']}")
+
+
+async def verify_certificate(file_path: str, org_name: str, business_registration_number: str, coalesce_key: Optional[str] = None) -> dict:
+    """Uploads the certificate to Gemini, runs the verifier and always cleans up the remote file."""
+    uploaded_file = None # Gemini file handle
+    await ensure_models() # Imports google.generativeai off the event loop the first time
+    try:
+        genai = genai_module()
+        # --- Upload file to Google AI for analysis ---
+        logger.debug(f"Uploading {file_path} to Gemini for verification...")
+        uploaded_file = await asyncio.to_thread(genai.upload_file, path=file_path, display_name=f"{org_name} CAC Cert")
+        logger.debug(f"File uploaded successfully to Gemini: {uploaded_file.name}")
+
+        # --- Call the AI Verifier ---
+        logger.debug(f"Submitting {org_name} details for AI verification...")
+        ai_result = await verify_organization_identity(
+            org_name=org_name,
+            business_registration_number=business_registration_number,
+            cac_certificate_file=uploaded_file, # Pass the Gemini file object
+            coalesce_key=coalesce_key
+        )
+    except Exception as e:
+        # Broad exception catch during AI processing
+        logger.error(f"Error during AI verification process: {e}")
+        if is_transient_error(e):
+            # e.g. the upload timed out or was rate limited - retry the job later
+            ai_result = {"decision": "UNAVAILABLE", "reason": "The AI verifier is temporarily unavailable.", "error": True}
+        else:
+            ai_result = {"decision": "REJECTED", "reason": f"Internal error during AI verification: {e}", "error": True}
+    finally:
+        # --- Clean up the uploaded file from Google AI ---
+        if uploaded_file:
+            try:
+                await asyncio.to_thread(genai.delete_file, uploaded_file.name)
+                logger.debug(f"Cleaned up Gemini file: {uploaded_file.name}")
+            except Exception as e:
+                # Log error but don't fail the job if cleanup fails
+                logger.error(f"Failed to delete Gemini file {uploaded_file.name}: {e}")
+
+    # Anything other than a clear VERIFIED is a rejection (UNAVAILABLE is retried instead)
+    if ai_result.get("decision") not in ("VERIFIED", "UNAVAILABLE"):
+        ai_result = {**ai_result, "decision": "REJECTED", "reason": ai_result.get("reason", "AI analysis was inconclusive.")}
+    return ai_result
+
+def _decision_key(certificate_sha256: str, org_name: str, business_registration_number: str) -> str:
+    # Case and spacing differences in the submitted name/RC number don't change the answer
+    normalize = lambda value: " ".join((value or "").split()).upper()
+    parts = [certificate_sha256, normalize(org_name), normalize(business_registration_number)]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+async def find_previous_decision(certificate_sha256: Optional[str], org_name: str, business_registration_number: str) -> Optional[dict]:
+    """A verifier decision already made for these exact certificate bytes, name and RC number."""
+    if not certificate_sha256:
+        return None
+    doc = await verification_decisions_collection.find_one(
+        {"_id": _decision_key(certificate_sha256, org_name, business_registration_number)}
+    )
+    if not doc:
+        return None
+    return {"decision": doc["decision"], "reason": doc["reason"]}
+
+async def remember_decision(certificate_sha256: Optional[str], org_name: str, business_registration_number: str, ai_result: dict) -> None:
+    """Stores a real verifier decision for reuse; errors and timeouts are never stored."""
+    if not certificate_sha256 or ai_result.get("error"):
+        return
+    await verification_decisions_collection.update_one(
+        {"_id": _decision_key(certificate_sha256, org_name, business_registration_number)},
+        {"$set": {
+            "certificate_sha256": certificate_sha256,
+            "decision": ai_result["decision"],
+            "reason": ai_result["reason"],
+            "decided_at": datetime.now(timezone.utc),
+        }},
+        upsert=True,
+    )
+
+async def apply_verification_result(org_id: ObjectId, submission: dict, file_path: str, ai_result: dict) -> None:
+    """Stores the submitted details and the verifier's decision on the org."""
+    previous = await organizations_collection.find_one({"_id": org_id}, {"policy_text": 1})
+    update_data = {
+        **submission, # org_name, description, category, website, RC number, policy, data types
+        "cac_certificate_url": file_path, # Store the local path
+        "verification_status": ai_result["decision"].lower() # "verified" or "rejected"
+    }
+    await organizations_collection.update_one({"_id": org_id}, {"$set": update_data})
+    await invalidate_org(org_id) # Cached auth must see the new status/policy right away
+    if previous and previous.get("policy_text") != submission.get("policy_text"):
+        await decision_cache.invalidate_policy(previous.get("policy_text"))
+        await policy_indexes.forget(previous.get("policy_text"))
+    await policy_indexes.index_policy(submission.get("policy_text")) # Sections for regulator prompts
+
+
+verification_jobs = VerificationJobQueue(
+    workers=settings.VERIFICATION_WORKERS,
+    lease_seconds=settings.VERIFICATION_JOB_LEASE_SECONDS,
+    max_attempts=settings.VERIFICATION_JOB_MAX_ATTEMPTS,
+)
@@ -0,0 +1,282 @@
+# app/webhooks.py
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import json
+import logging
+import random
+import secrets
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+import httpx
+from bson import ObjectId
+
+from app.database import settings, webhook_deliveries_collection, webhooks_collection
+from app.metrics import WEBHOOK_DELIVERIES
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_HEADER = "X-TrustGrid-Signature"
+EVENT_TYPES = ("consent.decision",)
+
+def generate_webhook_secret() -> str:
+    return f"whsec_{secrets.token_urlsafe(32)}"
+
+def sign_payload(secret: str, body: bytes, timestamp: Optional[int] = None) -> str:
+    """
+    Signature header value "t=<unix seconds>,v1=<hex HMAC-SHA256 of '<t>.<body>'>".
+    The timestamp is signed too, so receivers can reject replays of old deliveries.
+    """
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    digest = hmac.new(secret.encode(), f"{timestamp}.".encode() + body, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={digest}"
+
+
+class UnsafeWebhookURL(ValueError):
+    """The webhook URL leads somewhere the dispatcher must not send requests to."""
+
+def _is_public(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%", 1)[0]) # Drop an IPv6 scope ("fe80::1%eth0")
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+async def resolve_public_address(url: str) -> str:
+    """
+    A public IP address of the URL's host. Raises UnsafeWebhookURL if the host
+    doesn't resolve, or if ANY of its addresses is private, loopback, link-local
+    or reserved - deliveries come from inside the deployment, so a webhook must
+    never be a way to reach internal services.
+    """
+    parsed = httpx.URL(url)
+    if not parsed.host:
+        raise UnsafeWebhookURL("Webhook URL has no host.")
+    port = parsed.port or (443 if parsed.scheme == "https" else 80)
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(parsed.host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror:
+        raise UnsafeWebhookURL(f"Webhook host '{parsed.host}' does not resolve.")
+    addresses = [info[4][0] for info in infos]
+    if not addresses or not all(_is_public(address) for address in addresses):
+        raise UnsafeWebhookURL(f"Webhook host '{parsed.host}' resolves to a non-public address.")
+    return addresses[0]
+
+
+async def enqueue_event(org_id: ObjectId, event_type: str, data: dict) -> int:
+    """
+    Writes one delivery per active webhook of the org subscribed to `event_type`
+    (an outbox in `webhook_deliveries`) and wakes the dispatcher. Returns how many.
+    """
+    hooks = await webhooks_collection.find(
+        {"org_id": org_id, "status": "active", "events": event_type}, {"_id": 1}
+    ).to_list(None)
+    if not hooks:
+        return 0
+    now = datetime.now(timezone.utc)
+    event_id = f"evt_{uuid.uuid4().hex}"
+    await webhook_deliveries_collection.insert_many([
+        {
+            "webhook_id": hook["_id"],
+            "org_id": org_id,
+            "event": {"id": event_id, "type": event_type, "created_at": now.isoformat(), "data": data},
+            "status": "pending",
+            "attempts": 0,
+            "next_attempt_at": now,
+            "created_at": now,
+        }
+        for hook in hooks
+    ])
+    webhook_dispatcher.wake()
+    return len(hooks)
+
+
+class WebhookDispatcher:
+    """
+    Delivers queued webhook events in the background.
+
+    Deliveries are claimed per webhook in batches of up to `batch_size` events
+    (status "sending" under a lease, so a crashed process's claims are retried)
+    and POSTed as one signed request: {"events": [...]}. A 2xx marks the batch
+    delivered; anything else reschedules it with exponential backoff and jitter
+    until `max_attempts`, after which it is marked "failed". Delivery is
+    at-least-once and unordered: receivers should de-duplicate on event id.
+
+    The URL's host is resolved and checked again before every POST (it may have
+    been re-pointed since registration), and the request goes to the address that
+    was checked, so DNS can't swap in an internal one between check and connect.
+    """
+
+    def __init__(self, batch_size: int, concurrency: int, max_attempts: int, timeout: float,
+                 retry_base: float, retry_max: float, lease_seconds: int, poll_interval: float,
+                 allow_private_addresses: bool = False):
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.allow_private_addresses = allow_private_addresses
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    async def start(self) -> None:
+        self._client = httpx.AsyncClient(timeout=self.timeout, follow_redirects=False)
+        self._task = asyncio.create_task(self._run_forever())
+        logger.info("Webhook dispatcher started.")
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+
+    async def _run_forever(self) -> None:
+        while True:
+            try:
+                await self.dispatch_due()
+            except Exception as e:
+                logger.error(f"Webhook dispatch round failed: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def dispatch_due(self) -> None:
+        """Sends every due batch, at most `concurrency` webhooks at a time."""
+        now = datetime.now(timezone.utc)
+        due = {"$or": [
+            {"status": "pending", "next_attempt_at": {"$lte": now}},
+            {"status": "sending", "lease_expires_at": {"$lt": now}},
+        ]}
+        webhook_ids = {doc["webhook_id"] for doc in await webhook_deliveries_collection.find(
+            due, {"webhook_id": 1}
+        ).limit(self.batch_size * self.concurrency * 4).to_list(None)}
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def drain(webhook_id: ObjectId):
+            async with semaphore:
+                # Keep sending while full batches come back (a backlog)
+                while await self._send_batch(webhook_id) >= self.batch_size:
+                    pass
+
+        await asyncio.gather(*(drain(webhook_id) for webhook_id in webhook_ids))
+
+    async def _claim(self, webhook_id: ObjectId) -> List[dict]:
+        """Atomically takes up to batch_size due deliveries of one webhook."""
+        now = datetime.now(timezone.utc)
+        due = {"webhook_id": webhook_id, "$or": [
+            {"status": "pending", "next_attempt_at": {"$lte": now}},
+            {"status": "sending", "lease_expires_at": {"$lt": now}},
+        ]}
+        candidates = await webhook_deliveries_collection.find(due, {"_id": 1}).sort("created_at", 1).limit(self.batch_size).to_list(None)
+        if not candidates:
+            return []
+        # Another process may claim some of the same ids; the token tells us which we got
+        token = uuid.uuid4().hex
+        await webhook_deliveries_collection.update_many(
+            {**due, "_id": {"$in": [doc["_id"] for doc in candidates]}},
+            {"$set": {"status": "sending", "claim": token, "lease_expires_at": now + timedelta(seconds=self.lease_seconds)}}
+        )
+        return await webhook_deliveries_collection.find({"claim": token, "status": "sending"}).sort("created_at", 1).to_list(None)
+
+    async def _target(self, url: str) -> Tuple[httpx.URL, dict, dict]:
+        """(URL to POST to, extra headers, request extensions) for a delivery to `url`."""
+        if self.allow_private_addresses:
+            return httpx.URL(url), {}, {}
+        parsed = httpx.URL(url)
+        address = await resolve_public_address(url)
+        # Connect to the checked address; Host and TLS (SNI, certificate check) still use the name
+        return (
+            parsed.copy_with(host=address),
+            {"Host": parsed.netloc.decode("ascii")},
+            {"sni_hostname": parsed.host},
+        )
+
+    async def _send_batch(self, webhook_id: ObjectId) -> int:
+        deliveries = await self._claim(webhook_id)
+        if not deliveries:
+            return 0
+        ids = [delivery["_id"] for delivery in deliveries]
+        hook = await webhooks_collection.find_one({"_id": webhook_id})
+        if not hook or hook.get("status") != "active":
+            # Disabled or deleted after the events were queued
+            await webhook_deliveries_collection.update_many(
+                {"_id": {"$in": ids}}, {"$set": {"status": "cancelled"}, "$unset": {"lease_expires_at": "", "claim": ""}}
+            )
+            return len(deliveries)
+
+        error = None
+        try:
+            body = json.dumps({"events": [delivery["event"] for delivery in deliveries]}, separators=(",", ":")).encode()
+            url, extra_headers, extensions = await self._target(hook["url"])
+            headers = {
+                "Content-Type": "application/json",
+                "User-Agent": "TrustGrid-Webhooks/1.0",
+                "X-TrustGrid-Webhook-Id": str(webhook_id),
+                SIGNATURE_HEADER: sign_payload(hook["secret"], body),
+                **extra_headers,
+            }
+            response = await self._client.post(url, content=body, headers=headers, extensions=extensions)
+            if not 200 <= response.status_code < 300:
+                error = f"HTTP {response.status_code}"
+        except (httpx.HTTPError, UnsafeWebhookURL) as e:
+            error = f"{type(e).__name__}: {e}"
+        except Exception as e:
+            # Anything else still counts as an attempt, or the batch would sit in
+            # "sending" and be retried every lease period forever
+            logger.error(f"Webhook {webhook_id} delivery raised: {e!r}")
+            error = f"{type(e).__name__}: {e}"
+
+        now = datetime.now(timezone.utc)
+        if error is None:
+            WEBHOOK_DELIVERIES.labels("delivered").inc(len(deliveries))
+            await webhook_deliveries_collection.update_many(
+                {"_id": {"$in": ids}},
+                {"$set": {"status": "delivered", "delivered_at": now}, "$inc": {"attempts": 1},
+                 "$unset": {"lease_expires_at": "", "claim": ""}}
+            )
+            return len(deliveries)
+
+        # One schedule for the whole batch, from its most-tried delivery
+        attempts = max(delivery["attempts"] for delivery in deliveries) + 1
+        if attempts >= self.max_attempts:
+            logger.warning(f"Webhook {webhook_id} gave up on {len(deliveries)} events after {attempts} attempts: {error}")
+            WEBHOOK_DELIVERIES.labels("failed").inc(len(deliveries))
+            update = {"$set": {"status": "failed", "last_error": error, "attempts": attempts}}
+        else:
+            delay = random.uniform(0.5, 1.0) * min(self.retry_max, self.retry_base * (2 ** (attempts - 1)))
+            WEBHOOK_DELIVERIES.labels("retried").inc(len(deliveries))
+            update = {"$set": {"status": "pending", "last_error": error, "attempts": attempts,
+                               "next_attempt_at": now + timedelta(seconds=delay)}}
+        update["$unset"] = {"lease_expires_at": "", "claim": ""}
+        await webhook_deliveries_collection.update_many({"_id": {"$in": ids}}, update)
+        # Nothing more for this webhook until the retry is due
+        return 0
+
+
+webhook_dispatcher = WebhookDispatcher(
+    batch_size=settings.WEBHOOK_BATCH_SIZE,
+    concurrency=settings.WEBHOOK_CONCURRENCY,
+    max_attempts=settings.WEBHOOK_MAX_ATTEMPTS,
+    timeout=settings.WEBHOOK_TIMEOUT_SECONDS,
+    retry_base=settings.WEBHOOK_RETRY_BASE_SECONDS,
+    retry_max=settings.WEBHOOK_RETRY_MAX_SECONDS,
+    lease_seconds=settings.WEBHOOK_LEASE_SECONDS,
+    poll_interval=settings.WEBHOOK_POLL_SECONDS,
+    allow_private_addresses=settings.WEBHOOK_ALLOW_PRIVATE_ADDRESSES,
+)
@@ -0,0 +1,150 @@
+# benchmarks/bench_async_db.py
+"""
+Before/after benchmark for the async data access layer (app/async_db.py).
+
+Drives the real app (benchmarks/offline.py: mongomock or a local Mongo, fake
+Gemini) with concurrent POST /api/v1/request-data calls, each with a fresh
+purpose so every request reaches the (fake) regulator. Every Mongo call
+additionally sleeps --db-latency seconds to stand in for a network round trip.
+
+  blocking  - the app's Mongo executor runs each call inline on the event loop,
+              which is what pymongo calls made directly in `async def` did
+  offloaded - the app as shipped: calls run on the MONGO_EXECUTOR_WORKERS pool
+
+Run from backend/trustgrid-api (pip install -r benchmarks/requirements.txt):
+    python benchmarks/bench_async_db.py --clients 128 --requests 10
+    python benchmarks/bench_async_db.py --mongo-uri mongodb://localhost:27017 --db-latency 0
+"""
+import argparse
+import asyncio
+import functools
+import itertools
+import logging
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import Executor, Future
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from offline import load_app, seed  # noqa: E402
+
+# Collection methods that make one round trip to the server
+ROUND_TRIP_METHODS = (
+    "find", "find_one", "insert_one", "insert_many", "update_one", "update_many",
+    "find_one_and_update", "delete_one", "delete_many", "count_documents", "aggregate", "bulk_write",
+)
+
+
+class InlineExecutor(Executor):
+    """Runs every submitted call right away on the calling thread (the event loop)."""
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+
+def add_round_trip_latency(collection_class, latency: float) -> None:
+    """Makes every server call on `collection_class` take `latency` seconds longer."""
+    if latency <= 0:
+        return
+
+    def delayed(method):
+        @functools.wraps(method)
+        def call(*args, **kwargs):
+            time.sleep(latency)
+            return method(*args, **kwargs)
+        return call
+
+    for name in ROUND_TRIP_METHODS:
+        if hasattr(collection_class, name):
+            setattr(collection_class, name, delayed(getattr(collection_class, name)))
+
+
+async def run(offline, data, mode: str, clients: int, requests: int) -> dict:
+    import httpx
+
+    mongo = offline.database.mongo
+    pool = mongo.executor
+    if mode == "blocking":
+        mongo._executor = InlineExecutor()
+    purposes = itertools.count()
+    latencies, statuses = [], {}
+
+    async def client(client_id: int, http):
+        headers = {"X-API-Key": data.api_keys[client_id % len(data.api_keys)]}
+        for n in range(requests):
+            body = {
+                "user_id": data.citizens[(client_id * requests + n) % len(data.citizens)],
+                "data_type": "email",
+                "purpose": f"Send receipts for order {mode}-{next(purposes)}",
+            }
+            start = time.perf_counter()
+            response = await http.post("/api/v1/request-data", json=body, headers=headers)
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    try:
+        transport = httpx.ASGITransport(app=offline.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://trustgrid.bench", timeout=None) as http:
+            start = time.perf_counter()
+            await asyncio.gather(*(client(n, http) for n in range(clients)))
+            elapsed = time.perf_counter() - start
+    finally:
+        mongo._executor = pool
+
+    latencies.sort()
+    return {
+        "mode": mode,
+        "requests": len(latencies),
+        "statuses": statuses,
+        "elapsed_s": elapsed,
+        "throughput_rps": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[max(0, int(len(latencies) * 0.99) - 1)] * 1000,
+    }
+
+
+async def run_all(offline, data, args) -> list:
+    # lifespan_context runs the app's startup/shutdown (indexes, background workers)
+    async with offline.app.router.lifespan_context(offline.app):
+        # Warm up (auth cache, models) so both modes start from the same state
+        await run(offline, data, "offloaded", len(data.api_keys), 1)
+        return [await run(offline, data, mode, args.clients, args.requests) for mode in ("blocking", "offloaded")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=128)
+    parser.add_argument("--requests", type=int, default=10, help="requests per client")
+    parser.add_argument("--db-latency", type=float, default=0.002, help="extra seconds per Mongo round trip")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds per Gemini call")
+    parser.add_argument("--workers", type=int, default=32, help="Mongo executor threads (MONGO_EXECUTOR_WORKERS)")
+    parser.add_argument("--mongo-uri", help="use this Mongo (throwaway database) instead of mongomock")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING) # Per-request INFO logs would dominate the timings
+    offline = load_app(
+        mongo_uri=args.mongo_uri, llm_latency=args.llm_latency, llm_jitter=0.0,
+        settings_overrides={"MONGO_EXECUTOR_WORKERS": str(args.workers)},
+    )
+    try:
+        data = seed(offline.db, orgs=8, citizens=args.clients, log_entries=0, purposes=1, manual_share=0.0)
+        add_round_trip_latency(type(offline.db["users"]), args.db_latency)
+
+        print(f"clients={args.clients} requests/client={args.requests} "
+              f"db_latency={args.db_latency * 1000:.1f}ms llm_latency={args.llm_latency * 1000:.0f}ms workers={args.workers}")
+        print(f"{'mode':<10} {'requests':>8} {'elapsed s':>10} {'req/s':>10} {'p50 ms':>10} {'p99 ms':>10}  statuses")
+        for r in asyncio.run(run_all(offline, data, args)):
+            print(f"{r['mode']:<10} {r['requests']:>8} {r['elapsed_s']:>10.2f} {r['throughput_rps']:>10.1f} "
+                  f"{r['p50_ms']:>10.1f} {r['p99_ms']:>10.1f}  {r['statuses']}")
+    finally:
+        offline.close()
+
+
+if __name__ == "__main__":
+    main()
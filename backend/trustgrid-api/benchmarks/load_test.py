@@ -0,0 +1,337 @@
+# benchmarks/load_test.py
+"""
+Offline load test for the TrustGrid API.
+
+Runs the real FastAPI app in process (httpx ASGI transport, startup/shutdown
+hooks included) against mongomock or a local Mongo, with a fake Gemini whose
+latency you choose (see benchmarks/offline.py). A closed-loop pool of clients
+drives a weighted mix of endpoints for a fixed time and reports p50/p95/p99
+latency and throughput per endpoint.
+
+Results can be saved as a baseline and later runs compared against it; the
+comparison exits non-zero when an endpoint regresses past --tolerance.
+Baselines are only comparable on the same machine with the same options.
+
+mongomock has no indexes and copies documents on every find, so its cost grows
+with the seeded data; the small default data set keeps the numbers about the
+API itself. Use --mongo-uri for realistic database behaviour at volume.
+
+Run from backend/trustgrid-api (pip install -r benchmarks/requirements.txt):
+    python benchmarks/load_test.py --concurrency 64 --duration 20
+    python benchmarks/load_test.py --save-baseline local
+    python benchmarks/load_test.py --compare local
+    python benchmarks/load_test.py --mongo-uri mongodb://localhost:27017   # real mongod, throwaway DB
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from offline import REQUESTED_DATA_TYPES, Dataset, load_app, seed  # noqa: E402
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+# (name, weight) - the share of traffic each operation gets
+DEFAULT_MIX = {
+    "request_data": 35,
+    "org_log": 15,
+    "citizen_log": 15,
+    "citizen_pending": 5,
+    "citizen_respond": 10,
+    "org_login": 10,
+    "citizen_login": 10,
+    "org_analytics": 5,
+}
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Workload:
+    """One method per operation; each sends one request and returns the response."""
+
+    def __init__(self, client, data: Dataset, page_size: int, rng: random.Random):
+        self.client = client
+        self.data = data
+        self.page_size = page_size
+        self.rng = rng
+        # Requests that can still be approved/denied; request_data adds to it
+        self.pending = list(data.pending_request_ids)
+
+    def _org_headers(self) -> dict:
+        return {"X-API-Key": self.rng.choice(self.data.api_keys)}
+
+    async def request_data(self):
+        body = {
+            "user_id": self.rng.choice(self.data.citizens),
+            "data_type": self.rng.choice(REQUESTED_DATA_TYPES),
+            "purpose": self.rng.choice(self.data.purposes),
+        }
+        response = await self.client.post("/api/v1/request-data", json=body, headers=self._org_headers())
+        if response.status_code == 202 and response.json().get("status") == "pending":
+            self.pending.append(response.json()["request_id"])
+        return response
+
+    async def org_log(self):
+        return await self.client.get("/api/v1/org/log", params={"limit": self.page_size}, headers=self._org_headers())
+
+    async def org_analytics(self):
+        # Rollups written by this run's request_data/citizen_respond (flushed every ROLLUP_FLUSH_SECONDS)
+        return await self.client.get("/api/v1/org/analytics", headers=self._org_headers())
+
+    async def citizen_log(self):
+        user_id = self.rng.choice(self.data.citizens)
+        return await self.client.get(f"/api/v1/citizen/{user_id}/log", params={"limit": self.page_size})
+
+    async def citizen_pending(self):
+        user_id = self.rng.choice(self.data.citizens)
+        return await self.client.get(f"/api/v1/citizen/{user_id}/requests", params={"limit": self.page_size})
+
+    async def citizen_respond(self):
+        if not self.pending:
+            return None
+        request_id = self.pending.pop(self.rng.randrange(len(self.pending)))
+        decision = "approved" if self.rng.random() < 0.8 else "denied"
+        return await self.client.post("/api/v1/citizen/respond", json={"request_id": request_id, "decision": decision})
+
+    async def org_login(self):
+        return await self.client.post("/api/v1/org/login", data={"api_key": self.rng.choice(self.data.api_keys)})
+
+    async def citizen_login(self):
+        username = self.rng.choice(self.data.citizens)
+        return await self.client.post("/api/v1/citizen/login", json={"username": username, "password": username})
+
+
+# Statuses that are a correct answer for the operation (403: the rules refuse BVN for most categories)
+EXPECTED_STATUS = defaultdict(lambda: {200}, {
+    "request_data": {202, 403},
+})
+
+
+async def drive(
+    workload: Workload,
+    mix: Dict[str, int],
+    concurrency: int,
+    duration: float,
+    warmup: float,
+    rng: random.Random,
+) -> Tuple[Dict[str, List[float]], Dict[str, Dict[int, int]], float]:
+    """Runs `concurrency` clients back to back. Returns latencies and status counts per operation."""
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    statuses: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+
+    start = time.perf_counter()
+    measure_from = start + warmup
+    stop_at = measure_from + duration
+
+    async def client():
+        while time.perf_counter() < stop_at:
+            name = rng.choices(names, weights)[0]
+            operation: Callable = getattr(workload, name)
+            began = time.perf_counter()
+            response = await operation()
+            if response is None or began < measure_from:
+                continue
+            latencies[name].append(time.perf_counter() - began)
+            statuses[name][response.status_code] += 1
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies, statuses, time.perf_counter() - measure_from
+
+
+def summarize(latencies: Dict[str, List[float]], statuses: Dict[str, Dict[int, int]], elapsed: float) -> Dict[str, dict]:
+    results = {}
+    everything = []
+    for name in sorted(latencies):
+        values = sorted(latencies[name])
+        everything.extend(values)
+        unexpected = sum(count for code, count in statuses[name].items() if code not in EXPECTED_STATUS[name])
+        results[name] = {
+            "requests": len(values),
+            "unexpected_status": unexpected,
+            "status_counts": {str(code): count for code, count in sorted(statuses[name].items())},
+            "throughput_rps": len(values) / elapsed,
+            "p50_ms": percentile(values, 50) * 1000,
+            "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+        }
+    everything.sort()
+    results["ALL"] = {
+        "requests": len(everything),
+        "unexpected_status": sum(r["unexpected_status"] for r in results.values()),
+        "throughput_rps": len(everything) / elapsed,
+        "p50_ms": percentile(everything, 50) * 1000,
+        "p95_ms": percentile(everything, 95) * 1000,
+        "p99_ms": percentile(everything, 99) * 1000,
+    }
+    return results
+
+
+def print_results(results: Dict[str, dict]) -> None:
+    print(f"{'endpoint':<16} {'requests':>8} {'bad':>5} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, r in results.items():
+        print(f"{name:<16} {r['requests']:>8} {r['unexpected_status']:>5} {r['throughput_rps']:>9.1f} "
+              f"{r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f}")
+
+
+def baseline_path(name: str) -> str:
+    return os.path.join(BASELINE_DIR, f"{name}.json")
+
+
+def save_baseline(name: str, config: dict, results: Dict[str, dict]) -> str:
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    path = baseline_path(name)
+    with open(path, "w") as f:
+        json.dump({
+            "recorded_at": datetime.now(timezone.utc).isoformat(),
+            "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+            "config": config,
+            "results": results,
+        }, f, indent=2, sort_keys=True)
+        f.write("\n")
+    return path
+
+
+def compare_to_baseline(name: str, config: dict, results: Dict[str, dict], tolerance: float) -> List[str]:
+    """
+    Prints the change per endpoint against a saved baseline and returns the
+    regressions: p95 up, or throughput down, by more than `tolerance`.
+    """
+    with open(baseline_path(name)) as f:
+        baseline = json.load(f)
+    changed = {key: (baseline["config"].get(key), value) for key, value in config.items() if baseline["config"].get(key) != value}
+    if changed:
+        print(f"⚠️ Options differ from baseline '{name}': {changed}")
+
+    regressions = []
+    print(f"\nvs baseline '{name}' ({baseline['recorded_at']}), tolerance {tolerance:.0%}")
+    print(f"{'endpoint':<16} {'p95 ms':>18} {'req/s':>18}")
+    for endpoint, current in results.items():
+        before = baseline["results"].get(endpoint)
+        if not before:
+            continue
+        p95_change = current["p95_ms"] / before["p95_ms"] - 1 if before["p95_ms"] else 0.0
+        rps_change = current["throughput_rps"] / before["throughput_rps"] - 1 if before["throughput_rps"] else 0.0
+        flag = ""
+        if p95_change > tolerance or rps_change < -tolerance:
+            flag = "  REGRESSION"
+            regressions.append(endpoint)
+        print(f"{endpoint:<16} {before['p95_ms']:>7.1f} -> {current['p95_ms']:>7.1f} "
+              f"{before['throughput_rps']:>7.1f} -> {current['throughput_rps']:>7.1f}{flag}")
+    return regressions
+
+
+async def run(args) -> Dict[str, dict]:
+    import httpx
+
+    offline = load_app(
+        mongo_uri=args.mongo_uri,
+        llm_latency=args.llm_latency,
+        llm_jitter=args.llm_jitter,
+        # The app installs its own log pipeline (app/logging_config.py) at import
+        settings_overrides={"LOG_LEVEL": args.log_level, **{key: str(value) for key, value in args.setting}},
+    )
+    try:
+        data = seed(offline.db, args.orgs, args.citizens, args.log_entries, args.purposes)
+        rng = random.Random(args.seed)
+        transport = httpx.ASGITransport(app=offline.app)
+        # lifespan_context runs the app's startup/shutdown hooks (indexes, job workers)
+        async with offline.app.router.lifespan_context(offline.app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://trustgrid.bench") as client:
+                workload = Workload(client, data, args.page_size, rng)
+                latencies, statuses, elapsed = await drive(
+                    workload, args.mix, args.concurrency, args.duration, args.warmup, rng
+                )
+        print(f"fake Gemini calls: regulator={offline.regulator.calls}")
+        print(f"analytics rollups written: {offline.db['consent_rollups'].count_documents({})}")
+        return summarize(latencies, statuses, elapsed)
+    finally:
+        offline.close()
+
+
+def parse_mix(value: str) -> Dict[str, int]:
+    """'request_data=50,org_log=50' -> weights; unknown names are rejected."""
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"unknown operation '{name}' (choose from {', '.join(DEFAULT_MIX)})")
+        mix[name.strip()] = int(weight or 1)
+    return mix
+
+
+def parse_setting(value: str) -> Tuple[str, str]:
+    name, sep, setting = value.partition("=")
+    if not sep:
+        raise argparse.ArgumentTypeError("expected NAME=VALUE")
+    return name, setting
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=64, help="concurrent clients")
+    parser.add_argument("--duration", type=float, default=20.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=3.0, help="unmeasured seconds first (fills caches)")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX, help="weights, e.g. request_data=50,org_log=50")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="fake Gemini seconds per call")
+    parser.add_argument("--llm-jitter", type=float, default=0.1, help="+/- seconds around --llm-latency")
+    parser.add_argument("--mongo-uri", default=None, help="use this Mongo server (throwaway DB) instead of mongomock")
+    parser.add_argument("--orgs", type=int, default=20)
+    parser.add_argument("--citizens", type=int, default=1000)
+    parser.add_argument("--log-entries", type=int, default=2000, help="seeded consent log entries")
+    parser.add_argument("--purposes", type=int, default=200, help="distinct purposes (drives compliance cache hit rate)")
+    parser.add_argument("--page-size", type=int, default=50, help="?limit= on log reads")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--setting", type=parse_setting, action="append", default=[],
+                        help="app setting override, e.g. --setting MONGO_EXECUTOR_WORKERS=64 (repeatable)")
+    parser.add_argument("--log-level", default="ERROR", help="app log level while measuring")
+    parser.add_argument("--save-baseline", metavar="NAME", help=f"write results to {BASELINE_DIR}/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help="compare with a saved baseline; exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative slowdown before flagging")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level)
+    logging.getLogger().setLevel(args.log_level)
+
+    # What has to match for two runs to be comparable
+    config = {
+        "concurrency": args.concurrency, "duration": args.duration, "warmup": args.warmup,
+        "mix": args.mix, "llm_latency": args.llm_latency, "llm_jitter": args.llm_jitter,
+        "mongo": "server" if args.mongo_uri else "mongomock",
+        "orgs": args.orgs, "citizens": args.citizens, "log_entries": args.log_entries,
+        "purposes": args.purposes, "page_size": args.page_size, "seed": args.seed,
+        "settings": dict(args.setting),
+    }
+    print(f"concurrency={args.concurrency} duration={args.duration:g}s llm_latency={args.llm_latency * 1000:.0f}ms "
+          f"mongo={config['mongo']} mix={args.mix}")
+
+    results = asyncio.run(run(args))
+    print_results(results)
+
+    if args.save_baseline:
+        print(f"Saved baseline to {save_baseline(args.save_baseline, config, results)}")
+    if args.compare:
+        regressions = compare_to_baseline(args.compare, config, results, args.tolerance)
+        if regressions:
+            print(f"🔥 Regressed: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+# benchmarks/offline.py
+"""
+Boots the real FastAPI app without live services, for load tests.
+
+- Mongo: mongomock in process by default, or a real (local) server via
+  `mongo_uri` using a throwaway database that is dropped afterwards.
+- Gemini: FakeGeminiModel replaces the regulator/verifier models. It answers
+  in the same JSON shape after a configurable latency, so the LLM gateway,
+  decision cache and deadlines all run as they do in production.
+
+Everything here must happen before `app.database` is first imported: its
+MongoConnection builds the client with pymongo.MongoClient on first use, which
+is what the mongomock patch replaces, and Settings read the environment at import.
+"""
+import asyncio
+import hashlib
+import inspect
+import json
+import os
+import random
+import sys
+import types
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+BACKEND_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_ROOT not in sys.path:
+    sys.path.append(BACKEND_ROOT)
+
+CATEGORIES = ["Fintech", "E-commerce", "Healthcare", "Gaming", "Other"]
+PURPOSE_TEMPLATES = [
+    "Account verification for loan application {n}",
+    "Send order confirmation and delivery updates, campaign {n}",
+    "KYC refresh required by regulator, cycle {n}",
+    "Customer support callback for ticket batch {n}",
+    "Fraud screening on new signup cohort {n}",
+]
+# Releasable fields seeded on every citizen and used by the request mix
+REQUESTED_DATA_TYPES = ["email", "phone_number", "first_name", "city", "bvn"]
+
+
+class FakeGeminiModel:
+    """Stand-in for genai.GenerativeModel: sleeps, then returns a fixed JSON verdict."""
+
+    def __init__(self, decision: str, latency: float, jitter: float = 0.0, seed: int = 0):
+        self.decision = decision
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = 0
+        self._random = random.Random(seed)
+
+    async def generate_content_async(self, contents):
+        self.calls += 1
+        delay = self.latency + self._random.uniform(-self.jitter, self.jitter)
+        await asyncio.sleep(max(0.0, delay))
+        reason = "Fake model: request is consistent with the declared policy."
+        return types.SimpleNamespace(text=json.dumps({"decision": self.decision, "reason": reason}))
+
+
+class OfflineApp:
+    """The imported app plus handles the load test needs (db, fakes, cleanup)."""
+
+    def __init__(self, main, database, regulator: FakeGeminiModel, verifier: FakeGeminiModel, throwaway_db: Optional[str]):
+        self.app = main.app
+        self.main = main
+        self.database = database
+        self.regulator = regulator
+        self.verifier = verifier
+        self._throwaway_db = throwaway_db
+
+    @property
+    def db(self):
+        return self.database.mongo.db
+
+    def close(self) -> None:
+        if self._throwaway_db:
+            self.database.mongo.client.drop_database(self._throwaway_db)
+
+
+def _accept_bulk_sort(mongomock) -> None:
+    """
+    pymongo >= 4.11 passes `sort` to the bulk builder for UpdateOne/ReplaceOne
+    (bulk_write, as used by app/analytics.py), which mongomock's builder doesn't
+    take. Drop it when unset - the app never sorts a bulk update.
+    """
+    builder = mongomock.collection.BulkOperationBuilder
+
+    def without_sort(method):
+        def call(self, *args, sort=None, **kwargs):
+            if sort is not None:
+                raise NotImplementedError("mongomock can't sort bulk updates")
+            return method(self, *args, **kwargs)
+        return call
+
+    for name in ("add_update", "add_replace"):
+        if "sort" not in inspect.signature(getattr(builder, name)).parameters:
+            setattr(builder, name, without_sort(getattr(builder, name)))
+
+
+def load_app(
+    mongo_uri: Optional[str] = None,
+    llm_latency: float = 0.3,
+    llm_jitter: float = 0.1,
+    settings_overrides: Optional[Dict[str, str]] = None,
+) -> OfflineApp:
+    """Imports app.main against the offline backends. Can only be called once per process."""
+    if "app.database" in sys.modules:
+        raise RuntimeError("app.database is already imported; load_app() must run first")
+
+    throwaway_db = None
+    if mongo_uri:
+        throwaway_db = f"trustgrid_bench_{uuid.uuid4().hex[:8]}"
+    else:
+        import mongomock
+        import pymongo
+        # app/database.py builds its client with pymongo.MongoClient(...). Hand out one
+        # in-memory server, so data outlives the client the app closes on shutdown
+        server = mongomock.MongoClient()
+        pymongo.MongoClient = lambda *args, **kwargs: server
+        _accept_bulk_sort(mongomock)
+        mongo_uri = "mongodb://offline-bench"
+
+    os.environ.update({
+        "MONGO_URI": mongo_uri,
+        "DB_NAME": throwaway_db or "trustgrid_bench",
+        "GEMINI_API_KEY": "offline-benchmark",
+    })
+    os.environ.update(settings_overrides or {})
+
+    from app import ai_compliance, database, main
+
+    regulator = FakeGeminiModel("APPROVED", llm_latency, llm_jitter, seed=1)
+    verifier = FakeGeminiModel("VERIFIED", llm_latency, llm_jitter, seed=2)
+    ai_compliance.use_models(regulator, verifier)
+    return OfflineApp(main, database, regulator, verifier, throwaway_db)
+
+
+class Dataset:
+    """What seed() created: API keys, citizens and pending consent requests to act on."""
+
+    def __init__(self):
+        self.api_keys: List[str] = []
+        self.org_ids: List[str] = []
+        self.citizens: List[str] = [] # usernames; every citizen's password is its username
+        self.pending_request_ids: List[str] = []
+        self.purposes: List[str] = []
+
+
+def seed(db, orgs: int, citizens: int, log_entries: int, purposes: int, manual_share: float = 0.3, rng_seed: int = 42) -> Dataset:
+    """Fills the offline database with verified orgs, keyed citizens and consent history."""
+    from app.security import get_api_key_hash, get_api_key_prefix
+
+    rng = random.Random(rng_seed)
+    data = Dataset()
+    now = datetime.now(timezone.utc)
+
+    org_docs = []
+    for n in range(orgs):
+        category = CATEGORIES[n % len(CATEGORIES)]
+        org_docs.append({
+            "org_name": f"Bench Org {n}",
+            "policy_text": f"Bench Org {n} collects {', '.join(REQUESTED_DATA_TYPES)} to provide its {category} services.",
+            "data_types_collected": ", ".join(REQUESTED_DATA_TYPES),
+            "company_category": category,
+            "verification_status": "verified",
+        })
+    org_ids = db["organizations"].insert_many(org_docs).inserted_ids
+    key_docs = []
+    for org_id in org_ids:
+        api_key = f"tg_live_bench{uuid.UUID(int=rng.getrandbits(128)).hex}"
+        data.api_keys.append(api_key)
+        data.org_ids.append(str(org_id))
+        key_docs.append({
+            "org_id": org_id,
+            "key_hash": get_api_key_hash(api_key),
+            "key_prefix": get_api_key_prefix(api_key),
+            "name": "benchmark",
+            "status": "active",
+            "created_date": now,
+        })
+    db["api_keys"].insert_many(key_docs)
+
+    user_docs = []
+    for n in range(citizens):
+        username = f"citizen{n:06d}"
+        data.citizens.append(username)
+        user_docs.append({
+            "username": username,
+            # Same scheme as POST /api/v1/citizen/register
+            "password": hashlib.sha256(username.encode()).hexdigest(),
+            "first_name": f"First{n}",
+            "email": f"{username}@example.ng",
+            "phone_number": f"+234800{n:07d}",
+            "city": rng.choice(["Lagos", "Abuja", "Ibadan", "Kano"]),
+            "bvn": f"{rng.randrange(10**10, 10**11)}",
+            "manual_approval_required": rng.random() < manual_share,
+        })
+    db["users"].insert_many(user_docs)
+
+    data.purposes = [PURPOSE_TEMPLATES[n % len(PURPOSE_TEMPLATES)].format(n=n) for n in range(purposes)]
+
+    log_docs = []
+    for n in range(log_entries):
+        org_index = rng.randrange(orgs)
+        status = rng.choices(["auto_approved", "pending", "approved", "denied"], weights=[60, 20, 15, 5])[0]
+        log_docs.append({
+            "user_id": rng.choice(data.citizens),
+            "org_id": org_ids[org_index],
+            "org_name": f"Bench Org {org_index}",
+            "data_type": rng.choice(REQUESTED_DATA_TYPES),
+            "purpose": rng.choice(data.purposes),
+            "status": status,
+            "approval_method": "auto" if status == "auto_approved" else "manual",
+            "ai_reason": "Seeded by the load test.",
+            "decision_stage": "llm",
+            "timestamp": now - timedelta(seconds=rng.randrange(90 * 24 * 3600)),
+        })
+    if log_docs:
+        result = db["consent_log"].insert_many(log_docs)
+        data.pending_request_ids = [
+            str(inserted_id) for inserted_id, doc in zip(result.inserted_ids, log_docs) if doc["status"] == "pending"
+        ]
+    return data
@@ -0,0 +1,37 @@
+# tests/conftest.py
+"""
+Runs the tests against an in-memory mongomock server, like benchmarks/offline.py.
+
+Has to happen before `app.database` is first imported: Settings read the
+environment at import and MongoConnection builds its client with
+pymongo.MongoClient on first use.
+
+Run from backend/trustgrid-api (pip install -r tests/requirements.txt):
+    python -m pytest -q tests
+"""
+import os
+import sys
+
+import mongomock
+import pymongo
+import pytest
+
+BACKEND_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_ROOT not in sys.path:
+    sys.path.append(BACKEND_ROOT)
+
+_server = mongomock.MongoClient()
+pymongo.MongoClient = lambda *args, **kwargs: _server
+os.environ.update({
+    "MONGO_URI": "mongodb://trustgrid-tests",
+    "DB_NAME": "trustgrid_tests",
+    "GEMINI_API_KEY": "tests",
+})
+
+
+@pytest.fixture
+def consent_log():
+    """The (emptied) consent_log collection, as the raw mongomock collection."""
+    from app.database import consent_log_collection
+    consent_log_collection.sync.delete_many({})
+    return consent_log_collection.sync
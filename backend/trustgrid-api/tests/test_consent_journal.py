@@ -0,0 +1,163 @@
+# tests/test_consent_journal.py
+"""Durability and idempotency of the consent log write-behind journal (app/consent_journal.py)."""
+import asyncio
+import fcntl
+import os
+
+import pytest
+from bson import ObjectId, json_util
+
+from app import consent_journal as journal_module
+from app.consent_journal import ConsentJournal, JournalUnavailable, _JSON_OPTIONS, _Segment, read_segment
+from app.database import consent_log_collection
+
+
+def make_journal(directory, **overrides) -> ConsentJournal:
+    # A long interval and a large batch: nothing flushes unless a test asks for it
+    options = {"batch_size": 1000, "flush_interval": 3600, "max_backlog": 1000, "fsync": True}
+    options.update(overrides)
+    return ConsentJournal(directory=str(directory), **options)
+
+
+def make_doc(n: int) -> dict:
+    return {"_id": ObjectId(), "user_id": f"citizen{n:06d}", "data_type": "email", "status": "auto_approved"}
+
+
+def segment_files(directory) -> list:
+    return sorted(name for name in os.listdir(directory) if name.endswith(".jsonl"))
+
+
+def write_segment(path, docs) -> None:
+    with open(path, "wb") as f:
+        for doc in docs:
+            f.write(json_util.dumps(doc, json_options=_JSON_OPTIONS).encode() + b"\n")
+
+
+def test_group_commit_resolves_every_waiter(tmp_path, consent_log, monkeypatch):
+    writes = []
+    write = _Segment.write
+    monkeypatch.setattr(_Segment, "write", lambda self, lines, fsync: (writes.append(len(lines)), write(self, lines, fsync)))
+
+    async def scenario():
+        journal = make_journal(tmp_path)
+        await journal.start()
+        batches = [[make_doc(n), make_doc(n + 100)] for n in range(20)]
+        await asyncio.gather(*(journal.append(docs) for docs in batches))
+        journal_docs = read_segment(journal._active.path)
+        await journal.stop()
+        return batches, journal, journal_docs
+
+    batches, journal, journal_docs = asyncio.run(scenario())
+    # Appends queued up together share one write + fsync
+    assert writes == [40]
+    ids = [doc["_id"] for docs in batches for doc in docs]
+    assert [doc["_id"] for doc in journal_docs] == ids
+    # stop() flushed everything and removed the segments
+    assert journal.pending == 0
+    assert consent_log.count_documents({"_id": {"$in": ids}}) == 40
+    assert segment_files(tmp_path) == []
+
+
+def test_full_backlog_falls_back_to_a_direct_insert(tmp_path, consent_log, monkeypatch):
+    async def scenario():
+        journal = make_journal(tmp_path, max_backlog=2)
+        monkeypatch.setattr(journal_module, "consent_journal", journal)
+        await journal.start()
+        queued = [make_doc(1), make_doc(2)]
+        await journal_module.write_consent_logs(queued, write_behind=True)
+        with pytest.raises(JournalUnavailable):
+            await journal.append([make_doc(3)])
+        overflow = make_doc(4)
+        ids = await journal_module.write_consent_logs([overflow], write_behind=True)
+        state = {
+            "ids": ids,
+            "overflow_journaled": journal.get(overflow["_id"]) is not None,
+            "overflow_in_mongo": consent_log.find_one({"_id": overflow["_id"]}) is not None,
+            "queued_in_mongo": consent_log.count_documents({"_id": {"$in": [doc["_id"] for doc in queued]}}),
+            "found": await journal_module.find_consent_log(queued[0]["_id"]),
+        }
+        await journal.stop()
+        return overflow, state
+
+    overflow, state = asyncio.run(scenario())
+    assert state["ids"] == [overflow["_id"]]
+    assert not state["overflow_journaled"]
+    assert state["overflow_in_mongo"]
+    # The first two are only journaled, but /request-status still finds them
+    assert state["queued_in_mongo"] == 0
+    assert state["found"] is not None
+
+
+def test_flush_deletes_a_segment_only_after_its_insert(tmp_path, consent_log, monkeypatch):
+    async def mongo_down(docs):
+        raise ConnectionError("mongo is down")
+
+    async def scenario():
+        journal = make_journal(tmp_path)
+        await journal.start()
+        docs = [make_doc(n) for n in range(5)]
+        await journal.append(docs)
+        sealed_path = journal._active.path
+
+        insert = consent_log_collection.insert_many_ignoring_duplicates
+        monkeypatch.setattr(consent_log_collection, "insert_many_ignoring_duplicates", mongo_down)
+        with pytest.raises(ConnectionError):
+            await journal.flush()
+        failed = {
+            "exists": os.path.exists(sealed_path),
+            "on_disk": [doc["_id"] for doc in read_segment(sealed_path)],
+            "pending": journal.pending,
+            "sealed": journal.stats()["sealed_segments"],
+            "in_mongo": consent_log.count_documents({}),
+        }
+
+        monkeypatch.setattr(consent_log_collection, "insert_many_ignoring_duplicates", insert)
+        await journal.flush()
+        flushed = {
+            "exists": os.path.exists(sealed_path),
+            "pending": journal.pending,
+            "sealed": journal.stats()["sealed_segments"],
+            "in_mongo": consent_log.count_documents({"_id": {"$in": [doc["_id"] for doc in docs]}}),
+        }
+        await journal.stop()
+        return docs, failed, flushed
+
+    docs, failed, flushed = asyncio.run(scenario())
+    assert failed == {"exists": True, "on_disk": [doc["_id"] for doc in docs], "pending": 5, "sealed": 1, "in_mongo": 0}
+    assert flushed == {"exists": False, "pending": 0, "sealed": 0, "in_mongo": 5}
+
+
+def test_replay_skips_locked_segments_and_ignores_duplicates(tmp_path, consent_log):
+    crashed = [make_doc(n) for n in range(3)]
+    # The crashed process got the first record into Mongo before it died
+    consent_log.insert_one(dict(crashed[0]))
+    write_segment(tmp_path / "1-100-1.jsonl", crashed)
+    live = [make_doc(n) for n in range(3, 5)]
+    write_segment(tmp_path / "2-200-1.jsonl", live)
+
+    async def scenario():
+        journal = make_journal(tmp_path, batch_size=2)
+        # Another live process holds its segment's lock
+        with open(tmp_path / "2-200-1.jsonl", "ab") as owner:
+            fcntl.flock(owner.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            replayed = await journal.replay()
+            # Replaying the same records again is harmless
+            write_segment(tmp_path / "3-100-2.jsonl", crashed)
+            replayed_again = await journal.replay()
+        return replayed, replayed_again
+
+    replayed, replayed_again = asyncio.run(scenario())
+    assert (replayed, replayed_again) == (3, 3)
+    assert segment_files(tmp_path) == ["2-200-1.jsonl"]
+    assert consent_log.count_documents({"_id": {"$in": [doc["_id"] for doc in crashed]}}) == 3
+    assert consent_log.count_documents({"_id": {"$in": [doc["_id"] for doc in live]}}) == 0
+
+
+def test_read_segment_skips_a_torn_last_line(tmp_path):
+    docs = [make_doc(n) for n in range(2)]
+    path = tmp_path / "1-100-1.jsonl"
+    write_segment(path, docs)
+    with open(path, "ab") as f:
+        f.write(json_util.dumps(make_doc(2), json_options=_JSON_OPTIONS).encode()[:25])
+
+    assert read_segment(str(path)) == docs
@@ -156,27 +156,36 @@ const CitizenApp = () => {
 
   useEffect(() => {
     if (!user) return;
-    
-    const interval = setInterval(async () => {
-      try {
-        const response = await fetch(`https://trust-grid.onrender.com/api/v1/citizen/${user.username}/requests`);
-        if (response.ok) {
-          const pendingRequests = await response.json();
-          const pending = pendingRequests.find(req => req.status === 'pending');
-          if (pending && (!pendingRequest || pendingRequest._id !== pending._id)) {
-            setPendingRequest(pending);
-          } else if (!pending && pendingRequest) {
-            setPendingRequest(null);
-          }
-          fetchRequests(user.username);
-        }
-      } catch (error) {
-        console.error('Poll requests error:', error);
-      }
-    }, 2000);
 
-    return () => clearInterval(interval);
-  }, [user, pendingRequest]);
+    // The API pushes consent request changes; EventSource reconnects by itself
+    const events = new EventSource(`https://trust-grid.onrender.com/api/v1/citizen/${user.username}/events`);
+    const upsert = (request) => setRequests(prev => (
+      prev.some(req => req._id === request._id)
+        ? prev.map(req => (req._id === request._id ? request : req))
+        : [request, ...prev]
+    ));
+
+    // Sent on every (re)connect: resync whatever may have been missed
+    events.addEventListener('snapshot', (event) => {
+      const pending = JSON.parse(event.data);
+      setPendingRequest(current => pending.find(req => current && req._id === current._id) || pending[0] || null);
+      fetchRequests(user.username);
+    });
+    events.addEventListener('request.created', (event) => {
+      const request = JSON.parse(event.data);
+      upsert(request);
+      if (request.status === 'pending') {
+        setPendingRequest(current => current || request);
+      }
+    });
+    events.addEventListener('request.updated', (event) => {
+      const request = JSON.parse(event.data);
+      upsert(request);
+      setPendingRequest(current => (current && current._id === request._id ? null : current));
+    });
+
+    return () => events.close();
+  }, [user]);
 
   const LoginPage = () => (
     <div className="min-h-screen flex items-center justify-center bg-gray-100 p-4 sm:p-8">